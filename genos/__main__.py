@@ -0,0 +1,68 @@
+import argparse
+import os
+import sys
+from functools import partial
+
+from .batch import load_roster, roll_roster, write_jsonl
+from .ruleset import get_active_ruleset, load_ruleset
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m genos", description="Roll a litter for every pairing in a roster.")
+    parser.add_argument("roster", help="JSON list or CSV of pairings, using the breeding form's field names")
+    parser.add_argument("--roster-format", choices=["json", "csv"], help="defaults to the roster's file extension")
+    parser.add_argument("--output", help="file to write to, defaults to stdout")
+    parser.add_argument("--output-format", choices=["jsonl", "csv", "columns"], default="jsonl",
+                        help="jsonl writes one litter per line with comments, csv one puppy per row, and columns "
+                             "every puppy's trait codes to a binary file, see genos.puppy_columns")
+    parser.add_argument("--seed", type=int, help="roll the same litters every time")
+    parser.add_argument("--workers", type=int, default=1, help="processes to roll litters across, 0 for every core")
+    parser.add_argument("--genetic-discovery", action="store_true", help="allow genetic discovery genes")
+    parser.add_argument("--test", action="store_true", help="add test mode statistics to every litter")
+    parser.add_argument("--exact-test", action="store_true", help="use exact probabilities in test mode")
+    parser.add_argument("--test-iterations", type=int, help="pups rolled per litter in test mode")
+    parser.add_argument("--ruleset", help="JSON or TOML ruleset to roll with instead of the standard rules")
+    parser.add_argument("--journal", help="append every litter to this roll journal, see genos.roll_journal")
+    args = parser.parse_args(argv)
+    if args.journal and args.workers != 1:
+        parser.error("--journal needs --workers 1")
+
+    roster_format = args.roster_format or os.path.splitext(args.roster)[1].lstrip(".").lower()
+    # Everything is checked before the first litter is rolled, so a bad roster never leaves half its output written.
+    try:
+        ruleset = load_ruleset(args.ruleset) if args.ruleset else get_active_ruleset()
+        with open(args.roster, newline="") as roster_file:
+            pairings = load_roster(roster_file, roster_format, args.genetic_discovery, ruleset)
+    except ValueError as error:
+        parser.error(str(error))
+
+    journal = None
+    if args.journal:
+        from .roll_journal import RollJournal
+        journal = RollJournal(args.journal)
+    # CSV and binary columns go straight from each litter's trait codes, without a dictionary per pup.
+    columns = args.output_format in ["csv", "columns"]
+    results = roll_roster(pairings, seed=args.seed, workers=args.workers or os.cpu_count() or 1,
+                          is_test=args.test or args.exact_test, exact_test=args.exact_test,
+                          test_iterations=args.test_iterations,
+                          ruleset=ruleset, journal=journal,
+                          columns=columns)
+    if columns:
+        from .puppy_columns import write_litters
+        write = partial(write_litters, output_format=args.output_format)
+    else:
+        write = write_jsonl
+    binary = args.output_format == "columns"
+    try:
+        if args.output:
+            with open(args.output, "wb") if binary else open(args.output, "w", newline="") as output:
+                write(results, output)
+        else:
+            write(results, sys.stdout.buffer if binary else sys.stdout)
+    finally:
+        if journal is not None:
+            journal.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,205 @@
+import csv
+import json
+from typing import Dict, Iterable, Iterator, List, Optional, TextIO
+
+from . import sinks
+from .breeding_logic import BreedingRoller, BreedingVesper
+from .genes import (
+    all_bases, all_chimeras, all_horns, all_modifiers, all_mutations, all_subspecies, colour_index, gene_rarity_index,
+    tails_by_rarity,
+)
+from .rng import RollRandom
+from .ruleset import Ruleset, get_active_ruleset
+
+VESPER_FIELDS = ["coatcolour", "horns", "tail", "base", "mod", "species", "mut", "chimera", "chimeracolour"]
+GENE_FIELDS = [f"gene{gene_num}" for gene_num in range(1, 11)]
+
+# What the breeding form offers for each vesper field. A chimera colour can be None unless the vesper is a chimera.
+FIELD_VALUES = {
+    "coatcolour": frozenset(colour_index),
+    "horns": frozenset(["None"] + all_horns),
+    "tail": frozenset(tails_by_rarity),
+    "base": frozenset(all_bases),
+    "mod": frozenset(["None"] + all_modifiers),
+    "species": frozenset(["None"] + all_subspecies),
+    "mut": frozenset(["None"] + all_mutations),
+    "chimera": frozenset(["None"] + all_chimeras),
+    "chimeracolour": frozenset(["None"] + list(colour_index)),
+}
+TRUE_VALUES = ["1", "true", "yes", "y", "on"]
+FALSE_VALUES = ["0", "false", "no", "n", "off"]
+
+# Modifiers a pairing doesn't mention are off.
+DEFAULT_MODIFIERS = {
+    'MaleBoost': False,
+    'FemaleBoost': False,
+    'Alpha': False,
+    'SpringBlessing': False,
+    'Bonded': False,
+    'VirusReduction': 0,
+    'Inbred': 0,
+    'SomnisBlessing': False,
+    'Stardust': 0,
+}
+
+PUPPY_FIELDS = ["Name", "Health", "Subspecies", "Base", "Sex", "Appearance", "Abnormalities", "MinorMutation"]
+
+
+class Pairing:
+    """One litter in a roster - a sire, a dam and the modifiers applied to them."""
+
+    def __init__(self, name: str, sire: BreedingVesper, dam: BreedingVesper, modifiers: Dict, password_valid=False):
+        self.name = name
+        self.sire = sire
+        self.dam = dam
+        self.modifiers = modifiers
+        self.password_valid = password_valid
+
+    @staticmethod
+    def factory(data: Dict, number: int, password_valid=False, ruleset: Ruleset = None) -> 'Pairing':
+        """Builds a pairing from one roster record, which uses the breeding form's field names for the vespers
+        (sirecoatcolour, damgene3, ...) and the BreedingRoller modifier names (Bonded, Stardust, ...). Every vesper
+        field has to be there, "None" where the form says None, but genes can be left out.
+
+        Every value has to be one the form offers, or a genetic discovery gene of the ruleset (the active one unless
+        given), so nothing unknown is ever rolled or given a trait code. Raises ValueError naming the pairing and the
+        first field that's missing or wrong."""
+        name = str(data.get("name") or f"Pairing {number}")
+        known_genes = ruleset_genes(ruleset if ruleset is not None else get_active_ruleset())
+        record = {}
+        for parent in ["sire", "dam"]:
+            for field in VESPER_FIELDS:
+                key = f"{parent}{field}"
+                value = data.get(key)
+                if value in (None, ""):
+                    raise ValueError(f"{name} has no {key}")
+                record[key] = str(value)
+                if record[key] not in FIELD_VALUES[field]:
+                    raise ValueError(f"{name}'s {key} can't be {record[key]}")
+            if record[f"{parent}chimera"] in all_chimeras and record[f"{parent}chimeracolour"] == "None":
+                raise ValueError(f"{name}'s {parent}chimeracolour can't be None for a chimera")
+            for field in GENE_FIELDS:
+                key = f"{parent}{field}"
+                value = data.get(key)
+                record[key] = "None" if value in (None, "") else str(value)
+                if record[key] != "None" and record[key] not in known_genes:
+                    raise ValueError(f"{name}'s {key} can't be {record[key]}")
+
+        modifiers = {}
+        for modifier, default in DEFAULT_MODIFIERS.items():
+            try:
+                modifiers[modifier] = parse_modifier(data.get(modifier), default)
+            except ValueError:
+                raise ValueError(f"{name}'s {modifier} can't be {data[modifier]}") from None
+
+        return Pairing(name=name,
+                       sire=BreedingVesper.factory(record, "sire"),
+                       dam=BreedingVesper.factory(record, "dam"),
+                       modifiers=modifiers,
+                       password_valid=password_valid)
+
+
+def parse_modifier(value, default):
+    if value is None or value == "":
+        return default
+    if isinstance(default, bool):
+        if isinstance(value, str):
+            value = value.strip().lower()
+            if value not in TRUE_VALUES + FALSE_VALUES:
+                raise ValueError(f"{value} isn't yes or no")
+            return value in TRUE_VALUES
+        return bool(value)
+    if isinstance(value, float) and not value.is_integer():
+        raise ValueError(f"{value} isn't a whole number")
+    return int(value)
+
+
+_ruleset_genes: Dict[str, frozenset] = {}
+
+
+def ruleset_genes(ruleset: Ruleset) -> frozenset:
+    """Every gene a parent can have under the ruleset - the known genes and its genetic discovery genes."""
+    genes = _ruleset_genes.get(ruleset.fingerprint)
+    if genes is None:
+        genes = set(gene_rarity_index)
+        for parents, (gene, rarity) in ruleset.genetic_discovery_genes.items():
+            genes.update(parents)
+            genes.add(gene)
+        genes = _ruleset_genes[ruleset.fingerprint] = frozenset(genes)
+    return genes
+
+
+def load_roster(roster_file: TextIO, roster_format: str, password_valid=False,
+                ruleset: Ruleset = None) -> List[Pairing]:
+    """Reads a roster of pairings from a JSON list of records or a CSV file with one record per row, checking every
+    record before anything is rolled. See Pairing.factory."""
+    if roster_format == "json":
+        records = json.load(roster_file)
+    elif roster_format == "csv":
+        records = list(csv.DictReader(roster_file))
+    else:
+        raise ValueError(f"Unknown roster format {roster_format}")
+    return [Pairing.factory(record, number + 1, password_valid, ruleset) for number, record in enumerate(records)]
+
+
+def roll_roster(pairings: Iterable[Pairing], seed: Optional[int] = None, workers: int = 1, is_test=False,
+                exact_test=False, test_iterations: int = None, ruleset: Ruleset = None,
+                journal=None, columns=False) -> Iterator:
+    """Rolls every pairing's litter and yields the results in roster order as soon as each is ready.
+
+    Every pairing gets its own RNG stream, so a seeded roster gives the same litters whatever the worker count.
+    With more than one worker the litters are shared across a single process pool for the whole roster.
+    The whole roster is rolled with one ruleset, the active one when it starts unless one is given.
+    Unseeded tests can be answered from the test cache, seeded ones are always rolled so they repeat exactly.
+    A roll_journal.RollJournal records every litter, which needs them all rolled in this process.
+    With columns, each litter comes back as a puppy_columns.PuppyColumns rather than a dictionary, without comments.
+    """
+    rng = RollRandom(seed)
+    if ruleset is None:
+        ruleset = get_active_ruleset()
+    cache_tests = seed is None
+    jobs = ((pairing, rng.spawn(number).seed, is_test, exact_test, test_iterations, ruleset, cache_tests)
+            for number, pairing in enumerate(pairings))
+    roll = roll_pairing_columns if columns else roll_pairing
+    if workers == 1:
+        yield from (roll(job, journal) for job in jobs)
+        return
+    if journal is not None:
+        raise ValueError("Litters can only be journalled with one worker")
+
+    from concurrent.futures import ProcessPoolExecutor
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        yield from pool.map(roll, jobs, chunksize=16)
+
+
+def roll_job(job, journal=None) -> BreedingRoller:
+    pairing, seed, is_test, exact_test, test_iterations, ruleset, cache_tests = job
+    roller = BreedingRoller([pairing.sire, pairing.dam], pairing.modifiers, password_valid=pairing.password_valid,
+                            is_test=is_test, exact_test=exact_test, rng=RollRandom(seed),
+                            test_iterations=test_iterations, ruleset=ruleset, cache_tests=cache_tests,
+                            journal=journal)
+    roller.roll_breeding()
+    return roller
+
+
+def roll_pairing(job, journal=None) -> Dict:
+    roller = roll_job(job, journal)
+    pairing, seed = job[:2]
+    return {
+        "pairing": pairing.name,
+        "seed": seed,
+        "puppies": roller.puppies,
+        "comments": roller.comments,
+    }
+
+
+def roll_pairing_columns(job, journal=None):
+    from .puppy_columns import PuppyColumns
+    columns = PuppyColumns()
+    columns.add_roller(job[0].name, roll_job(job, journal))
+    return columns
+
+
+def write_jsonl(results: Iterable[Dict], output: TextIO):
+    """One litter per line, flushed as each litter is rolled."""
+    sinks.write_jsonl(results, output, flush_every=1)
@@ -0,0 +1,434 @@
+"""Micro-benchmarks for the breeding and random vesper hot paths.
+
+Run with python -m genos.benchmarks --output results.json, and pass --compare old_results.json to see how a change
+moved each benchmark. Anything more than REGRESSION_THRESHOLD slower is flagged, and --fail-on-regression fails the
+run if anything is. Every benchmark is seeded, so the same commit rolls the same pups each time. --check-budget
+fails the run if a fresh worker takes longer than COLD_START_BUDGET_SECONDS to roll its first litter, or test mode
+on the vectorised engine takes longer than VECTORISED_TEST_BUDGET_SECONDS for the benchmark pairing, and --service
+adds a load test of the asyncio service against the breeding form's one synchronous roll per request.
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc
+from typing import Callable, Dict, List
+
+from .batch import Pairing
+from .breeding_logic import VECTORISED_TEST_ITERATIONS, BreedingRoller, BreedingVesper, get_vectorised_engine
+from .genes import BICOLOUR_CHIMERA, FULL_CHIMERA
+from .rng import RollRandom
+
+REPEATS = 5
+SEED = 2024
+# Size of the made up discovery table the get_genes benchmark is also run with
+DISCOVERY_RULES = 600
+
+# A benchmark this much slower than in the run it's compared with is flagged as a regression.
+REGRESSION_THRESHOLD = 0.1
+
+# A worker that's just started has this long to import BreedingRoller and roll its first litter.
+COLD_START_BUDGET_SECONDS = 0.05
+# Pressing test on the benchmark pairing, as heavy a pairing as there is, has this long with the vectorised engine.
+VECTORISED_TEST_BUDGET_SECONDS = 1.0
+VECTORISED_TEST_BENCHMARK = f"BreedingRoller.perform_test {VECTORISED_TEST_ITERATIONS} (vectorised)"
+# Optional engines and anything else heavy that the first litter mustn't need.
+LAZY_MODULES = ["numpy", "concurrent.futures", "multiprocessing", "tomllib", "hashlib"]
+COLD_START_SCRIPT = """
+import json, sys, time
+start = time.perf_counter()
+from genos.breeding_logic import BreedingRoller
+imported = time.perf_counter()
+from genos.benchmarks import BENCHMARK_SIRE, BENCHMARK_DAM, BENCHMARK_MODIFIERS
+rolled = time.perf_counter()
+BreedingRoller([BENCHMARK_SIRE, BENCHMARK_DAM], dict(BENCHMARK_MODIFIERS)).roll_breeding()
+done = time.perf_counter()
+lazy = [module for module in {lazy_modules!r} if module in sys.modules]
+print(json.dumps({{"import": imported - start, "first_roll": done - rolled, "lazy_modules_loaded": lazy}}))
+"""
+
+# Ten genes each, with Gleam and genetic discovery pairs, chimera parents and rare traits to pass down.
+BENCHMARK_SIRE = BreedingVesper(name="sire", colour="Derecho Wine", horns="Ram Horns", tail="Skeletal", base="Maned",
+                                modifier="Albinism", subspecies="Bat Eared Pygmy Vesper", mutation="Fins",
+                                chimera_status=FULL_CHIMERA, chimera_colour="Gem Ink",
+                                genes=["Comet", "Mask", "Collared", "Barring", "Gleam", "Leopard", "Acid", "Brindle",
+                                       "Cloak", "Sable"])
+BENCHMARK_DAM = BreedingVesper(name="dam", colour="Harvest Cocoa", horns="Hook Horns", tail="Cloud", base="Woolen",
+                               modifier="None", subspecies="None", mutation="Gills",
+                               chimera_status=BICOLOUR_CHIMERA, chimera_colour="Lush Mint",
+                               genes=["Flurry", "Dapple", "Underbelly", "Merle", "Washed", "Stardust", "Void", "Comet",
+                                      "Glass", "Points"])
+BENCHMARK_MODIFIERS = {
+    'MaleBoost': False,
+    'FemaleBoost': False,
+    'Alpha': True,
+    'SpringBlessing': False,
+    'Bonded': True,
+    'VirusReduction': 5,
+    'Inbred': 1,
+    'SomnisBlessing': False,
+    'Stardust': 10,
+}
+
+
+def get_roller(**kwargs) -> BreedingRoller:
+    roller = BreedingRoller([BENCHMARK_SIRE, BENCHMARK_DAM], dict(BENCHMARK_MODIFIERS), password_valid=True,
+                            rng=RollRandom(SEED), **kwargs)
+    roller.gene_boost = roller.get_gene_boost()
+    return roller
+
+
+def measure(name: str, run: Callable[[], object], pups: int, repeats: int = REPEATS) -> Dict:
+    """Times run repeats times, keeping the best, then runs it once more under tracemalloc for the peak memory."""
+    run()
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        run()
+        times.append(time.perf_counter() - start)
+
+    tracemalloc.start()
+    run()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    best = min(times)
+    return {
+        "name": name,
+        "best_seconds": best,
+        "median_seconds": sorted(times)[len(times) // 2],
+        "pups": pups,
+        "pups_per_second": pups / best if pups else None,
+        "peak_memory_bytes": peak,
+    }
+
+
+def breeding_benchmarks() -> List[Dict]:
+    results = []
+
+    def roll_breeding():
+        get_roller().roll_breeding()
+    results.append(measure("BreedingRoller.roll_breeding", roll_breeding, 0))
+
+    roller = get_roller()
+    results.append(measure("BreedingRoller.get_puppy x1000", lambda: [roller.get_puppy(i) for i in range(1000)], 1000))
+    results.append(measure("BreedingRoller.get_genes x1000", lambda: [roller.get_genes() for _ in range(1000)], 1000))
+    results.append(measure("BreedingRoller.get_colour x1000", lambda: [roller.get_colour() for _ in range(1000)], 1000))
+
+    # A discovery table grown to hundreds of rules, every pair of genes in order until there are enough.
+    from itertools import combinations
+    from .genes import gene_rarity_index
+    from .ruleset import compile_ruleset
+    pairs = list(combinations(sorted(gene_rarity_index), 2))[:DISCOVERY_RULES]
+    big_discovery = compile_ruleset({"genetic_discovery": [
+        {"parents": list(pair), "gene": f"Discovery {number}", "rarity": "rare"} for number, pair in enumerate(pairs)]})
+    discoverer = get_roller(ruleset=big_discovery)
+    results.append(measure(f"BreedingRoller.get_genes x1000 ({DISCOVERY_RULES} discovery rules)",
+                           lambda: [discoverer.get_genes() for _ in range(1000)], 1000))
+
+    pups = [roller.get_puppy(i) for i in range(1000)]
+    results.append(measure("Puppy.dictionary_form x1000", lambda: [pup.dictionary_form for pup in pups], 1000))
+    from io import StringIO
+    from .puppy_columns import PuppyColumns
+    columns = PuppyColumns()
+    for _ in range(10):
+        columns.add_litter("Benchmark", pups)
+    results.append(measure("PuppyColumns.write_csv 10000", lambda: columns.write_csv(StringIO()), 10000))
+
+    stepped = get_roller(compiled_tables=False)
+    results.append(measure("BreedingRoller.get_puppy x1000 (stepped)",
+                           lambda: [stepped.get_puppy(i) for i in range(1000)], 1000))
+    results.append(measure("BreedingRoller.get_colour x1000 (stepped)",
+                           lambda: [stepped.get_colour() for _ in range(1000)], 1000))
+
+    for iterations in [10000, 100000]:
+        def perform_test():
+            tester = get_roller(is_test=True, test_iterations=iterations)
+            tester.perform_test()
+        results.append(measure(f"BreedingRoller.perform_test {iterations}", perform_test, iterations, repeats=3))
+    if get_vectorised_engine() is not None:
+        def perform_vectorised_test():
+            get_roller(is_test=True, test_iterations=VECTORISED_TEST_ITERATIONS).perform_test()
+        results.append(measure(VECTORISED_TEST_BENCHMARK, perform_vectorised_test, VECTORISED_TEST_ITERATIONS,
+                               repeats=3))
+    # Test mode one pup at a time, as it runs without NumPy.
+    results.append(measure("BreedingRoller.get_test_accumulator 10000",
+                           lambda: get_roller().get_test_accumulator(10000), 10000, repeats=3))
+
+    from .population import PopulationSimulator
+    simulator = PopulationSimulator(size=2000)
+    results.append(measure("PopulationSimulator 3 generations x2000",
+                           lambda: simulator.run([BENCHMARK_SIRE], [BENCHMARK_DAM], 3, RollRandom(SEED)), 6000,
+                           repeats=3))
+
+    from .trait_query import TraitQuery
+    query = {"health": "Healthy", "sex": "Female", "base": "Maned", "genes": "Stardust"}
+    results.append(measure("TraitQuery healthy female maned Stardust",
+                           lambda: TraitQuery(BENCHMARK_SIRE, BENCHMARK_DAM, dict(BENCHMARK_MODIFIERS),
+                                              True).probability(query), 0, repeats=3))
+
+    import tempfile
+    from .roll_journal import JournalReader, RollJournal
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "journal.bin")
+        with RollJournal(path) as journal:
+            def roll_journalled():
+                get_roller(journal=journal).roll_breeding()
+            results.append(measure("BreedingRoller.roll_breeding journalled", roll_journalled, 0))
+            for _ in range(5000):
+                get_roller(journal=journal).roll_breeding()
+        with JournalReader(path) as reader:
+            pups = sum(record.count for record in reader.litters)
+            results.append(measure("JournalReader.compare genes=Stardust",
+                                   lambda: reader.compare({"genes": "Stardust"}), pups, repeats=3))
+
+    # measure's warm up run fills the test cache, so this times pressing test again on the same pairing.
+    def repeat_test():
+        get_roller(is_test=True, cache_tests=True).roll_breeding()
+    results.append(measure("BreedingRoller.roll_breeding test (cached)", repeat_test, 0))
+    return results
+
+
+def random_vesper_benchmarks() -> List[Dict]:
+    from .random_vesper_rolling_logic import MaxRarityVesper
+    results = []
+    for rolls in [1, 100, 10000]:
+        def get_results():
+            MaxRarityVesper(rolls, RollRandom(SEED)).get_results()
+        results.append(measure(f"MaxRarityVesper.get_results {rolls}", get_results, rolls))
+    results.append(measure("MaxRarityVesper.tally 10000", lambda: MaxRarityVesper(10000, RollRandom(SEED)).tally(),
+                           10000))
+    results.append(measure("MaxRarityVesper.columns 1000000",
+                           lambda: MaxRarityVesper(1000000, RollRandom(SEED)).columns(), 1000000))
+    results.append(measure("MaxRarityVesper.get_exact_report", lambda: MaxRarityVesper(0).get_exact_report(), 0))
+    return results
+
+
+def cold_start_benchmarks(repeats: int = REPEATS) -> List[Dict]:
+    """Imports BreedingRoller and rolls one litter in a fresh interpreter each time, as a newly started worker would."""
+    package_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    script = COLD_START_SCRIPT.format(lazy_modules=LAZY_MODULES)
+    runs = []
+    for _ in range(repeats):
+        output = subprocess.run([sys.executable, "-c", script], capture_output=True, text=True, check=True,
+                                cwd=package_root).stdout
+        runs.append(json.loads(output))
+
+    results = []
+    for name, times in [("Cold start import", [run["import"] for run in runs]),
+                        ("Cold start import and first litter", [run["import"] + run["first_roll"] for run in runs])]:
+        results.append({
+            "name": name,
+            "best_seconds": min(times),
+            "median_seconds": sorted(times)[len(times) // 2],
+            "pups": 0,
+            "pups_per_second": None,
+            "peak_memory_bytes": None,
+            "lazy_modules_loaded": runs[0]["lazy_modules_loaded"],
+        })
+    return results
+
+
+# The service load test: concurrent clients sharing the requests, every LOAD_TEST_EVERY'th one in test mode.
+LOAD_TEST_REQUESTS = 400
+LOAD_TEST_CLIENTS = 16
+LOAD_TEST_EVERY = 10
+LOAD_TEST_ITERATIONS = 100000
+
+
+def benchmark_record(**options) -> Dict:
+    """BENCHMARK_SIRE and BENCHMARK_DAM as the roster record the service takes, with the breeding form's field names."""
+    data = {}
+    BENCHMARK_SIRE.populate_data(data)
+    BENCHMARK_DAM.populate_data(data)
+    record = {key[:-len("_value")]: value for key, value in data.items()}
+    record.update(BENCHMARK_MODIFIERS)
+    record.update(options)
+    return record
+
+
+async def post_requests(port: int, bodies: List[bytes], clients: int) -> float:
+    """Sends every body to /breeding from clients concurrent connections, returning how long they all took."""
+    import asyncio
+    remaining = list(reversed(bodies))
+
+    async def client():
+        while remaining:
+            body = remaining.pop()
+            reader, writer = await asyncio.open_connection("127.0.0.1", port)
+            writer.write(b"POST /breeding HTTP/1.1\r\nHost: localhost\r\nContent-Type: application/json\r\n"
+                         b"Connection: close\r\nContent-Length: %d\r\n\r\n" % len(body) + body)
+            await writer.drain()
+            response = await reader.read()
+            writer.close()
+            status = response.split(b" ", 2)[1]
+            if status != b"200":
+                raise RuntimeError(f"Load test request failed with {status.decode()}")
+
+    start = time.perf_counter()
+    await asyncio.gather(*(client() for _ in range(clients)))
+    return time.perf_counter() - start
+
+
+async def load_test_service(bodies: List[bytes], warm_up: bytes) -> float:
+    import asyncio
+    from .service import RollService
+    service = RollService()
+    server = await asyncio.start_server(service.handle_connection, "127.0.0.1", 0)
+    port = server.sockets[0].getsockname()[1]
+    try:
+        await post_requests(port, [warm_up], 1)
+        return await post_requests(port, bodies, LOAD_TEST_CLIENTS)
+    finally:
+        server.close()
+        await server.wait_closed()
+        service.close()
+
+
+async def load_test_form_path(bodies: List[bytes], warm_up: bytes) -> float:
+    # Imported here, like everything else the load tests need, so the cold start doesn't load them.
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    from threading import Thread
+
+    class FormPathHandler(BaseHTTPRequestHandler):
+        """One synchronous roll per request, test mode and all, as the breeding form's view does it."""
+
+        def do_POST(self):
+            request = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+            pairing = Pairing.factory(request, 1)
+            roller = BreedingRoller([pairing.sire, pairing.dam], pairing.modifiers, is_test=bool(request.get("test")),
+                                    test_iterations=request.get("test_iterations"))
+            roller.roll_breeding()
+            body = json.dumps({"puppies": roller.puppies, "comments": roller.comments}).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = HTTPServer(("127.0.0.1", 0), FormPathHandler)
+    Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        await post_requests(server.server_port, [warm_up], 1)
+        return await post_requests(server.server_port, bodies, LOAD_TEST_CLIENTS)
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def service_benchmarks() -> List[Dict]:
+    """The same mix of litters and identical test requests, through the form path and through the service."""
+    import asyncio
+    litter = json.dumps(benchmark_record()).encode()
+    test = json.dumps(benchmark_record(test=True, test_iterations=LOAD_TEST_ITERATIONS)).encode()
+    bodies = [test if number % LOAD_TEST_EVERY == 0 else litter for number in range(LOAD_TEST_REQUESTS)]
+
+    results = []
+    for name, load_test in [("Load test, form path", load_test_form_path), ("Load test, service", load_test_service)]:
+        seconds = asyncio.run(load_test(bodies, test))
+        results.append({
+            "name": name,
+            "best_seconds": seconds,
+            "median_seconds": seconds,
+            "pups": 0,
+            "pups_per_second": None,
+            "peak_memory_bytes": None,
+            "requests_per_second": LOAD_TEST_REQUESTS / seconds,
+        })
+    return results
+
+
+def get_commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def compare(results: List[Dict], previous: List[Dict]) -> List[str]:
+    """Prints how each benchmark's best time moved since the previous results, and returns the ones that regressed."""
+    previous_by_name = {result["name"]: result for result in previous}
+    regressed = []
+    for result in results:
+        old = previous_by_name.get(result["name"])
+        if old is None:
+            continue
+        change = result["best_seconds"] / old["best_seconds"] - 1
+        flag = ""
+        if change > REGRESSION_THRESHOLD:
+            regressed.append(result["name"])
+            flag = " - REGRESSION"
+        print(f"{result['name']}: {100 * change:+.1f}% time{flag}")
+    return regressed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m genos.benchmarks", description=__doc__.splitlines()[0])
+    parser.add_argument("--output", help="JSON file to save the results to")
+    parser.add_argument("--compare", help="JSON results from an earlier run to compare against")
+    parser.add_argument("--fail-on-regression", action="store_true",
+                        help="fail if anything is more than REGRESSION_THRESHOLD slower than in --compare")
+    parser.add_argument("--skip-random-vespers", action="store_true",
+                        help="leave out MaxRarityVesper, which needs the rest of the site installed")
+    parser.add_argument("--check-budget", action="store_true",
+                        help="fail if the cold start is over budget or loads an engine it shouldn't")
+    parser.add_argument("--service", action="store_true", help="also load test the service against the form path")
+    args = parser.parse_args(argv)
+
+    cold_start = cold_start_benchmarks()
+    results = cold_start + breeding_benchmarks()
+    if not args.skip_random_vespers:
+        results += random_vesper_benchmarks()
+    if args.service:
+        results += service_benchmarks()
+
+    for result in results:
+        details = [f"{1000 * result['best_seconds']:.2f} ms"]
+        if result["pups_per_second"]:
+            details.append(f"{result['pups_per_second']:,.0f} pups/s")
+        if result.get("requests_per_second"):
+            details.append(f"{result['requests_per_second']:,.0f} requests/s")
+        if result["peak_memory_bytes"] is not None:
+            details.append(f"peak {result['peak_memory_bytes'] / 1024:,.0f} KiB")
+        print(f"{result['name']}: {', '.join(details)}")
+
+    regressed = []
+    if args.compare:
+        with open(args.compare) as previous_file:
+            regressed = compare(results, json.load(previous_file)["results"])
+
+    if args.output:
+        report = {
+            "commit": get_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "results": results,
+        }
+        with open(args.output, "w") as output:
+            json.dump(report, output, indent=2)
+
+    if args.check_budget:
+        first_litter = cold_start[-1]
+        if first_litter["lazy_modules_loaded"]:
+            sys.exit(f"Cold start loaded {', '.join(first_litter['lazy_modules_loaded'])}, which should be lazy")
+        if first_litter["best_seconds"] > COLD_START_BUDGET_SECONDS:
+            sys.exit(f"Cold start took {1000 * first_litter['best_seconds']:.1f} ms, over the "
+                     f"{1000 * COLD_START_BUDGET_SECONDS:.0f} ms budget")
+        for result in results:
+            if result["name"] == VECTORISED_TEST_BENCHMARK and result["best_seconds"] > VECTORISED_TEST_BUDGET_SECONDS:
+                sys.exit(f"Test mode took {result['best_seconds']:.2f} s for {VECTORISED_TEST_ITERATIONS} pups, "
+                         f"over the {VECTORISED_TEST_BUDGET_SECONDS:.1f} s budget")
+    if args.fail_on_regression and regressed:
+        sys.exit(f"Slower than {args.compare}: {', '.join(regressed)}")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
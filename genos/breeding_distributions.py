@@ -0,0 +1,541 @@
+from collections import defaultdict
+from functools import lru_cache
+from itertools import product
+from math import comb
+from typing import Collection, Dict, List, Optional, Tuple
+
+from .genes import (
+    FULL_CHIMERA, Rarity, all_chimeras, all_mutations, colour_index, colour_modifier_base_index, freecolour_genes,
+    gene_codes, health_conditions, minor_mutations,
+)
+
+RARITY_ORDER = [Rarity.COMMON, Rarity.UNCOMMON, Rarity.RARE, Rarity.MYTHIC]
+# Genes with no rarity (like Snowstorm) are never trimmed, so they get their own level after mythics.
+UNTRIMMED = len(RARITY_ORDER)
+NUM_LEVELS = UNTRIMMED + 1
+
+
+def chance(pass_rate) -> float:
+    """The probability of randint(1,100) <= pass_rate."""
+    return min(max(pass_rate, 0), 100) / 100
+
+
+@lru_cache(maxsize=None)
+def hypergeometric(population: int, successes: int, draws: int) -> Tuple[float, ...]:
+    """P(k successes) for k in 0..draws when drawing without replacement."""
+    total = comb(population, draws)
+    return tuple(comb(successes, k) * comb(population - successes, draws - k) / total for k in range(draws + 1))
+
+
+class BreedingDistributions:
+    """Exact per-trait outcome probabilities for a BreedingRoller, worked out from its pass rates rather than sampled."""
+
+    def __init__(self, roller):
+        self.roller = roller
+        self.sire = roller.sire
+        self.dam = roller.dam
+        self.modifiers = roller.modifiers
+
+    def all_distributions(self) -> Dict[str, Dict]:
+        """The same tables perform_test reports, as probabilities. Genes are the expected number of each per pup."""
+        chimera = self.chimera()
+        full_chimera = chimera.get(FULL_CHIMERA, 0)
+        genes = self.genes(10)
+        chimera_genes = self.genes(5)
+
+        gene_expectations = defaultdict(float)
+        for gene, probability in genes.expected.items():
+            gene_expectations[gene] += (1 - full_chimera) * probability
+        for gene, probability in chimera_genes.expected.items():
+            gene_expectations[gene] += full_chimera * 2 * probability
+
+        num_genes = defaultdict(float)
+        for count, probability in genes.counts.items():
+            num_genes[count] += (1 - full_chimera) * probability
+        for (count_one, p_one), (count_two, p_two) in product(chimera_genes.counts.items(), repeat=2):
+            num_genes[count_one + count_two] += full_chimera * p_one * p_two
+
+        return {
+            "Health": self.health(),
+            "Sex": self.sex(),
+            "Base colours": self.colour(),
+            "Horns": self.horns(),
+            "Tails": {f"{tail} Tail": probability for tail, probability in self.tail().items()},
+            "Coat Type": self.base(),
+            "Modifier": self.modifier(),
+            "Subspecies": self.subspecies(),
+            "Major Mutations": self.major_mutations(),
+            "Minor Mutations": self.minor_mutation(),
+            "Chimera": chimera,
+            "Genes": dict(gene_expectations),
+            "Total number of genes": dict(num_genes),
+        }
+
+    # Litter size, health and sex
+
+    def number_cubs(self) -> Dict[int, float]:
+        ruleset = self.roller.ruleset
+        distribution = defaultdict(float)
+        if self.modifiers["SpringBlessing"]:
+            fewest, most = ruleset.spring_litter_range
+            for num_cubs in range(fewest, most + 1):
+                distribution[num_cubs] += 1 / (most - fewest + 1)
+        else:
+            for cub_rng in range(1, 101):
+                distribution[ruleset.litter_size(cub_rng, self.modifiers["SomnisBlessing"])] += 1 / 100
+
+        # Alpha's blessing and a bonded pair can each add a pup.
+        for modifier in ["Alpha", "Bonded"]:
+            if self.modifiers[modifier]:
+                extra_pup = chance(ruleset.extra_pup_chances.get(modifier, 0))
+                boosted = defaultdict(float)
+                for num_cubs, probability in distribution.items():
+                    boosted[num_cubs] += probability * (1 - extra_pup)
+                    boosted[num_cubs + 1] += probability * extra_pup
+                distribution = boosted
+        return dict(distribution)
+
+    def health(self) -> Dict[str, float]:
+        ruleset = self.roller.ruleset
+        virus_reduction = self.modifiers["VirusReduction"]
+        if self.modifiers["Bonded"]:
+            virus_reduction += ruleset.bonded_virus_reduction
+        virus_chance = max(0, ruleset.virus_chance - virus_reduction)
+
+        inbred = self.modifiers["Inbred"]
+        if not inbred:
+            stillborn = chance(virus_chance)
+            return {"Healthy": 1 - stillborn, "Stillborn": stillborn}
+
+        probabilities = [chance(condition_chance + ruleset.inbred_chance_per_ancestor*(inbred - 1))
+                         for condition_chance in ruleset.inbred_chances]
+        probabilities[0] = 1 - (1 - probabilities[0]) * (1 - chance(virus_chance))
+
+        distribution = defaultdict(float)
+        for flags in product([False, True], repeat=len(health_conditions)):
+            probability = 1
+            for flag, condition_probability in zip(flags, probabilities):
+                probability *= condition_probability if flag else 1 - condition_probability
+            conditions = [condition for flag, condition in zip(flags, health_conditions) if flag]
+            distribution[", ".join(conditions) if conditions else "Healthy"] += probability
+        return dict(distribution)
+
+    def sex(self) -> Dict[str, float]:
+        if self.roller.all_male:
+            return {"Male": 1.0}
+        elif self.roller.all_female:
+            return {"Female": 1.0}
+        return {"Male": 0.5, "Female": 0.5}
+
+    def sex_before_boosters(self) -> Dict[str, float]:
+        """A pup's sex before roll_breeding's booster roll: an oak twig or a willow sprig works 80% of the time, and
+        both cancel out."""
+        modifiers = self.roller.modifiers
+        all_male = all_female = 0.0
+        if modifiers["MaleBoost"] and not modifiers["FemaleBoost"]:
+            all_male = 0.8
+        elif modifiers["FemaleBoost"] and not modifiers["MaleBoost"]:
+            all_female = 0.8
+        rolled = 1 - all_male - all_female
+        return {"Male": all_male + rolled / 2, "Female": all_female + rolled / 2}
+
+    # Sire vs dam
+
+    def _pick_rarest(self, sire_outcomes, dam_outcomes) -> Dict[str, float]:
+        """Combines {(value, rarity): probability} for each parent the way get_chimera and get_tail do."""
+        distribution = defaultdict(float)
+        for (sire_value, sire_rarity), p_sire in sire_outcomes.items():
+            for (dam_value, dam_rarity), p_dam in dam_outcomes.items():
+                probability = p_sire * p_dam
+                if sire_rarity > dam_rarity:
+                    distribution[sire_value] += probability
+                elif dam_rarity > sire_rarity:
+                    distribution[dam_value] += probability
+                else:
+                    distribution[sire_value] += probability / 2
+                    distribution[dam_value] += probability / 2
+        return dict(distribution)
+
+    def _pick_passed(self, sire_trait, dam_trait, get_pass_rate, default) -> Dict[str, float]:
+        """The distribution get_horns, get_base and get_modifier give - the rarer passed trait, else the default."""
+        sire_rate, sire_rarity = get_pass_rate(sire_trait)
+        dam_rate, dam_rarity = get_pass_rate(dam_trait)
+        sire_passed = chance(sire_rate)
+        dam_passed = chance(dam_rate)
+
+        distribution = defaultdict(float)
+        both = sire_passed * dam_passed
+        if sire_rarity > dam_rarity:
+            distribution[sire_trait] += both
+        elif dam_rarity > sire_rarity:
+            distribution[dam_trait] += both
+        else:
+            distribution[sire_trait] += both / 2
+            distribution[dam_trait] += both / 2
+        distribution[sire_trait] += sire_passed * (1 - dam_passed)
+        distribution[dam_trait] += dam_passed * (1 - sire_passed)
+        distribution[default] += (1 - sire_passed) * (1 - dam_passed)
+        return {value: probability for value, probability in distribution.items() if probability}
+
+    # Chimera and colour
+
+    def passed_chimera(self, chimera) -> Dict[Tuple[str, Rarity], float]:
+        pass_rate, rarity = self.roller.get_chimera_pass_rate(chimera)
+        passed = chance(pass_rate)
+        outcomes = defaultdict(float)
+        outcomes[(chimera, rarity)] += passed
+        outcomes[("None", Rarity.DEFAULT)] += 1 - passed
+        return {outcome: probability for outcome, probability in outcomes.items() if probability}
+
+    def chimera(self) -> Dict[str, float]:
+        return self._pick_rarest(self.passed_chimera(self.sire.chimera_status),
+                                 self.passed_chimera(self.dam.chimera_status))
+
+    def colour(self) -> Dict[str, float]:
+        possible_colours = [self.sire.colour]
+        if self.sire.chimera_status in all_chimeras:
+            possible_colours.append(self.sire.chimera_colour)
+        possible_colours.append(self.dam.colour)
+        if self.dam.chimera_status in all_chimeras:
+            possible_colours.append(self.dam.chimera_colour)
+
+        mods = []
+        for colour in possible_colours:
+            mod, _, rarity = colour_index[colour]
+            mods.append((mod, rarity, chance(self.roller.get_mod_pass_rate(rarity)) if mod is not None else 0))
+
+        # The chance of each modifier being the one inherited, going through every combination of passes.
+        mod_distribution = defaultdict(float)
+        for passes in product([False, True], repeat=len(mods)):
+            probability = 1
+            for passed, (_, _, pass_chance) in zip(passes, mods):
+                probability *= pass_chance if passed else 1 - pass_chance
+            if not probability:
+                continue
+            passed_mods = [mod for passed, mod in zip(passes, mods) if passed]
+            if not passed_mods:
+                mod_distribution[None] += probability
+                continue
+            max_rarity = max(mod[1] for mod in passed_mods)
+            rarest_mods = [mod[0] for mod in passed_mods if mod[1] == max_rarity]
+            for mod in rarest_mods:
+                mod_distribution[mod] += probability / len(rarest_mods)
+
+        distribution = defaultdict(float)
+        for colour in possible_colours:
+            base = colour_index[colour][1]
+            for mod, probability in mod_distribution.items():
+                probability /= len(possible_colours)
+                key = (mod, base)
+                if key not in colour_modifier_base_index:
+                    distribution[base] += probability
+                else:
+                    for result in colour_modifier_base_index[key]:
+                        distribution[result] += probability / len(colour_modifier_base_index[key])
+        return dict(distribution)
+
+    # Horns, tail, modifier and base
+
+    def horns(self) -> Dict[str, float]:
+        return self._pick_passed(self.sire.horns, self.dam.horns, self.roller.get_horns_pass_rate, "None")
+
+    def modifier(self) -> Dict[str, float]:
+        return self._pick_passed(self.sire.modifier, self.dam.modifier, self.roller.get_modifier_pass_rate, "None")
+
+    def passed_tail(self, tail) -> Dict[Tuple[str, Rarity], float]:
+        outcomes = defaultdict(float)
+        covered = 0
+        for pass_rate, possible_tails, rarity in self.roller.get_tail_ladder(tail):
+            # First match wins, so each step only gets the rolls the steps before it didn't take.
+            threshold = min(max(pass_rate, 0), 100)
+            probability = max(0, threshold - covered) / 100
+            covered = max(covered, threshold)
+            for possible_tail in possible_tails:
+                outcomes[(possible_tail, rarity)] += probability / len(possible_tails)
+        outcomes[("Domestic", Rarity.DEFAULT)] += 1 - covered / 100
+        return {outcome: probability for outcome, probability in outcomes.items() if probability}
+
+    def tail(self) -> Dict[str, float]:
+        return self._pick_rarest(self.passed_tail(self.sire.tail), self.passed_tail(self.dam.tail))
+
+    def subspecies(self) -> Dict[str, float]:
+        sirespecies = self.sire.subspecies
+        damspecies = self.dam.subspecies
+        if (sirespecies == "None") and (damspecies == "None"):
+            return {"None": 1.0}
+        elif sirespecies == "Bat Eared Pygmy Vesper" and damspecies == "Bat Eared Pygmy Vesper":
+            return {"Bat Eared Pygmy Vesper": 1.0}
+        return {"Bat Eared Pygmy Vesper": 0.25, "None": 0.75}
+
+    def base(self) -> Dict[str, float]:
+        distribution = defaultdict(float)
+        for subspecies, p_subspecies in self.subspecies().items():
+            for base, probability in self.base_given_subspecies(subspecies).items():
+                distribution[base] += p_subspecies * probability
+        return dict(distribution)
+
+    def base_given_subspecies(self, subspecies) -> Dict[str, float]:
+        distribution = self._pick_passed(self.sire.base, self.dam.base, self.roller.get_base_pass_rate, "Smooth")
+        # Fix base for pygmies - they can't be woolen
+        if subspecies == "Bat Eared Pygmy Vesper" and "Woolen" in distribution:
+            woolen = distribution.pop("Woolen")
+            distribution["Smooth"] = distribution.get("Smooth", 0) + woolen
+        return distribution
+
+    # Mutations
+
+    def major_mutations(self) -> Dict[str, float]:
+        """The chance of each mutation appearing, plus the chance of none at all."""
+        parent_mutations = [mutation for mutation in [self.sire.mutation, self.dam.mutation] if mutation != "None"]
+        distribution = {}
+        for mutation in dict.fromkeys(all_mutations + parent_mutations):
+            missing = 1 - 0.01 / len(all_mutations) if mutation in all_mutations else 1
+            for parent_mutation in parent_mutations:
+                if parent_mutation == mutation:
+                    missing *= 0.97
+            if missing < 1:
+                distribution[f"{mutation} Mutation"] = 1 - missing
+        distribution["None"] = 0.99 * 0.97 ** len(parent_mutations)
+        return distribution
+
+    def minor_mutation(self) -> Dict[str, float]:
+        distribution = {mutation: 0.01 / len(minor_mutations) for mutation in minor_mutations}
+        distribution["None"] = 0.99
+        return distribution
+
+    # Genes
+
+    def gene_sources(self) -> List[Tuple[str, float]]:
+        """Every (gene, pass chance) roll get_genes makes. A gene in both parents gets rolled twice."""
+        roller = self.roller
+        siregenes = self.sire.genes
+        damgenes = self.dam.genes
+        sources = [(gene, chance(roller.get_gene_pass_rate(roller.get_gene_rarity(gene))))
+                   for gene in list(siregenes) + list(damgenes)]
+        if self.modifiers["Stardust"]:
+            sources.append(("Stardust", chance(self.modifiers["Stardust"])))
+        if roller.genetic_discovery:
+            for code, rarity in roller.parent_genes.discoveries(roller.ruleset):
+                sources.append((gene_codes.names[code], chance(roller.get_gene_pass_rate(rarity))))
+        return sources
+
+    def genes(self, max_genes: int, only: Optional[Collection[str]] = None) -> 'GeneDistribution':
+        gene_chances = {}
+        for gene, pass_chance in self.gene_sources():
+            gene_chances[gene] = 1 - (1 - gene_chances.get(gene, 0)) * (1 - pass_chance)
+
+        genes = []
+        for gene, pass_chance in gene_chances.items():
+            rarity = self.roller.get_gene_rarity(gene)
+            level = RARITY_ORDER.index(rarity) if rarity in RARITY_ORDER else UNTRIMMED
+            genes.append(_Gene(gene, pass_chance, level, gene not in freecolour_genes and gene != "Gleam"))
+        return GeneDistribution(genes, max_genes, only)
+
+
+class _Gene:
+    __slots__ = ("name", "pass_chance", "level", "gleamable")
+
+    def __init__(self, name, pass_chance, level, gleamable):
+        self.name = name
+        self.pass_chance = pass_chance
+        self.level = level
+        self.gleamable = gleamable
+
+    @property
+    def key(self):
+        return self.pass_chance, self.level, self.gleamable, self.name == "Gleam"
+
+
+class GeneDistribution:
+    """Exact results of one get_genes(max) call.
+
+    Genes only matter to trimming and Gleam through their rarity, so the state tracked is how many genes passed at
+    each rarity, how many of those could take Gleam, and whether Gleam itself passed.
+    """
+
+    def __init__(self, genes: List[_Gene], max_genes: int, only: Optional[Collection[str]] = None):
+        self.max_genes = max_genes
+        self.has_gleam = any(gene.name == "Gleam" for gene in genes)
+        self._kept_cache = {}
+        self._summary_cache = {}
+        self._chances_cache = {}
+        # Expected number of times each gene string ("Mask", "Mask (Gleam)", "Gleam") appears in the result. Pass only
+        # to just work out the genes in it, which is much quicker when only one or two are wanted.
+        self.expected = {}
+        self._counts = None
+
+        gleam_kept = 0
+        gleam_attached = 0
+        self._all_states = all_states = self._states(genes)
+        for state, probability in all_states.items():
+            if self.has_gleam and state[-1] and (only is None or "Gleam" in only):
+                kept = self._kept_chance(state, UNTRIMMED - 1)
+                gleam_kept += probability * kept
+                gleam_attached += probability * kept * (1 - self._unattached_chance(state))
+
+        # Genes with the same pass chance and rarity are interchangeable, so each group only needs working out once.
+        groups = defaultdict(list)
+        for gene in genes:
+            groups[gene.key].append(gene)
+        for group in groups.values():
+            gene = group[0]
+            if gene.name == "Gleam":
+                continue
+            if only is not None and not any(member.name in only for member in group):
+                continue
+            kept = 0
+            attached = 0
+            for state, probability in self._states_without(all_states, genes, gene).items():
+                kept_chance, attached_chance = self._gene_chances(self._add(state, gene), gene.level, gene.gleamable)
+                kept += probability * kept_chance
+                attached += probability * attached_chance
+            kept *= gene.pass_chance
+            attached *= gene.pass_chance
+            for member in group:
+                if kept - attached > 1e-15:
+                    self.expected[member.name] = kept - attached
+                if attached > 1e-15:
+                    self.expected[f"{member.name} (Gleam)"] = attached
+
+        if gleam_kept - gleam_attached > 1e-15:
+            self.expected["Gleam"] = gleam_kept - gleam_attached
+
+    @property
+    def counts(self) -> Dict[int, float]:
+        """Distribution of the number of genes shown."""
+        if self._counts is None:
+            counts = defaultdict(float)
+            for state, probability in self._all_states.items():
+                for count, count_probability in self._count_distribution(state).items():
+                    counts[count] += probability * count_probability
+            self._counts = {count: probability for count, probability in counts.items() if probability > 1e-15}
+        return self._counts
+
+    def _add(self, state, gene: _Gene):
+        """State is (passed per level..., gleamable passed per level..., Gleam passed)."""
+        state = list(state)
+        state[gene.level] += 1
+        if gene.gleamable and self.has_gleam:
+            state[NUM_LEVELS + gene.level] += 1
+        if gene.name == "Gleam":
+            state[-1] = 1
+        return tuple(state)
+
+    def _states(self, genes: List[_Gene]) -> Dict[tuple, float]:
+        states = {(0,) * (2 * NUM_LEVELS + 1): 1.0}
+        for gene in genes:
+            next_states = defaultdict(float)
+            for state, probability in states.items():
+                next_states[state] += probability * (1 - gene.pass_chance)
+                next_states[self._add(state, gene)] += probability * gene.pass_chance
+            states = next_states
+        return states
+
+    def _states_without(self, states, genes: List[_Gene], gene: _Gene) -> Dict[tuple, float]:
+        """The state distribution of every gene but this one.
+
+        Undoing the gene's pass is much cheaper than rebuilding the distribution, but is only numerically stable
+        while the gene passes less often than not.
+        """
+        if gene.pass_chance > 0.5:
+            others = list(genes)
+            others.remove(gene)
+            return self._states(others)
+
+        without = {}
+        for state in sorted(states, key=lambda state: state[gene.level]):
+            probability = states[state]
+            if state[gene.level]:
+                previous = list(state)
+                previous[gene.level] -= 1
+                if gene.gleamable and self.has_gleam:
+                    previous[NUM_LEVELS + gene.level] -= 1
+                probability -= gene.pass_chance * without.get(tuple(previous), 0)
+            without[state] = probability / (1 - gene.pass_chance)
+        return without
+
+    def _kept(self, state) -> List[int]:
+        """How many passed genes survive trim_genes at each level."""
+        kept = self._kept_cache.get(state)
+        if kept is None:
+            excess = max(0, sum(state[:NUM_LEVELS]) - self.max_genes)
+            kept = []
+            for level in range(NUM_LEVELS):
+                removed = min(state[level], excess) if level < UNTRIMMED else 0
+                excess -= removed
+                kept.append(state[level] - removed)
+            self._kept_cache[state] = kept
+        return kept
+
+    def _gene_chances(self, state, level, gleamable) -> Tuple[float, float]:
+        """The chances a particular passed gene is kept, and is kept with Gleam attached."""
+        key = (state, level, gleamable)
+        chances = self._chances_cache.get(key)
+        if chances is None:
+            attached = self._attached_chance(state, level) if gleamable and state[-1] else 0
+            chances = self._chances_cache[key] = (self._kept_chance(state, level), attached)
+        return chances
+
+    def _kept_chance(self, state, level) -> float:
+        """The chance a particular passed gene at this level survives trimming."""
+        return self._kept(state)[level] / state[level]
+
+    def _trim_summary(self, state) -> Tuple[List[int], int, int]:
+        """(kept per level, gleamable genes at untouched levels, the partially trimmed level or None).
+
+        Trimming takes whole levels until the last one it needs, so at most one level is partially trimmed.
+        """
+        summary = self._summary_cache.get(state)
+        if summary is None:
+            kept = self._kept(state)
+            fixed = 0
+            partial = None
+            for level in range(NUM_LEVELS):
+                if kept[level] == state[level]:
+                    fixed += state[NUM_LEVELS + level]
+                elif kept[level]:
+                    partial = level
+            summary = self._summary_cache[state] = (kept, fixed, partial)
+        return summary
+
+    def _unattached_chance(self, state) -> float:
+        """Given Gleam was kept, the chance there's nothing to attach it to."""
+        kept, fixed, partial = self._trim_summary(state)
+        if fixed:
+            return 0
+        if partial is None:
+            return 1
+        gleam_here = partial == UNTRIMMED - 1
+        return hypergeometric(state[partial] - gleam_here, state[NUM_LEVELS + partial], kept[partial] - gleam_here)[0]
+
+    def _attached_chance(self, state, level) -> float:
+        """The chance a particular passed gleamable gene at this level ends up as "Gene (Gleam)"."""
+        kept, fixed, partial = self._trim_summary(state)
+        mythic = UNTRIMMED - 1
+        # Both this gene and Gleam have to survive trimming
+        both_kept = kept[mythic] / state[mythic]
+        if level == mythic:
+            both_kept *= (kept[mythic] - 1) / (state[mythic] - 1)
+        else:
+            both_kept *= kept[level] / state[level]
+        if not both_kept:
+            return 0
+
+        # Then Gleam picks uniformly from every gleamable gene left, this one included.
+        if partial is None:
+            return both_kept / fixed
+        if level != partial:
+            fixed -= 1
+        conditioned = (partial == mythic) + (partial == level)
+        others = hypergeometric(state[partial] - conditioned, state[NUM_LEVELS + partial] - (partial == level),
+                                kept[partial] - conditioned)
+        return both_kept * sum(probability / (fixed + 1 + count) for count, probability in enumerate(others))
+
+    def _count_distribution(self, state) -> Dict[int, float]:
+        shown = sum(self._kept(state))
+        if not (self.has_gleam and state[-1]):
+            return {shown: 1.0}
+        # Gleam merges into another gene when it has something to attach to.
+        gleam_kept = self._kept_chance(state, UNTRIMMED - 1)
+        attached = gleam_kept * (1 - self._unattached_chance(state))
+        return {shown: 1 - attached, shown - 1: attached}
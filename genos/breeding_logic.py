@@ -1,11 +1,28 @@
-from random import randint, choice, shuffle
-from .genes import *
+from .rng import RollRandom
+from .genes import (
+    BICOLOUR_CHIMERA, BLIND, DEAF, DYSTONIA, FEMALE, FULL_CHIMERA, GLEAM_CODE, GLEAM_FLAG, HEMOPHILIA, MALE,
+    STARDUST_CODE, STERILE, STILLBORN, Rarity, all_chimeras, all_mutations, base_codes, base_rarity_index,
+    chimera_codes, colour_codes, colour_index, colour_modifier_base_index, common_tails, gene_codes,
+    gene_rarity_index, health_codes, horn_codes, horn_rarity_index, minor_mutation_codes, minor_mutations,
+    modifier_codes, mutation_codes, rare_tails, sex_codes, subspecies_codes, tail_codes, uncommon_tails,
+)
+from .gene_sets import (
+    FREECOLOUR_MASK, GLEAM_BIT, RARITY_MASKS, STARDUST_BIT, TRIM_ORDER, discovery_index, gene_bit, gene_mask,
+    has_duplicates,
+)
+from .histogram import Share, TraitAccumulator
+from .ruleset import Ruleset, get_active_ruleset
 from dataclasses import dataclass
-from typing import List, Dict, Set
-from collections import Counter
+from typing import List, Dict, Iterable, Set, Tuple
+from array import array
 
 from enum import Enum
 
+# Test mode sample sizes - the vectorised engine can afford enough pups to see mythic outcomes. A million takes about
+# 0.4 s for a plain pairing and 0.85 s for the benchmark pairing, which benchmarks --check-budget holds to a second.
+TEST_ITERATIONS = 10000
+VECTORISED_TEST_ITERATIONS = 1000000
+
 @dataclass
 class BreedingVesper:
     """Class for keeping track of a vesper which is being bred."""
@@ -57,36 +74,169 @@ class BreedingVesper:
         data[f"{self.name}chimera_value"] = self.chimera_status
         data[f"{self.name}chimeracolour_value"] = self.chimera_colour
 
-@dataclass
+class CodedTrait:
+    """A Puppy attribute stored as an integer code in Puppy.traits, read and written as the usual string."""
+
+    def __init__(self, index, codes):
+        self.index = index
+        self.codes = codes
+
+    def __get__(self, pup, owner=None):
+        if pup is None:
+            return self
+        return self.codes.name(pup.traits[self.index])
+
+    def __set__(self, pup, value):
+        pup.traits[self.index] = self.codes.code(value)
+
+
+class CodedTraits:
+    """A Puppy attribute stored as a tuple of integer codes, read and written as a list of strings."""
+
+    def __init__(self, attribute, codes):
+        self.attribute = attribute
+        self.codes = codes
+
+    def __get__(self, pup, owner=None):
+        if pup is None:
+            return self
+        return [self.codes.name(code) for code in getattr(pup, self.attribute)]
+
+    def __set__(self, pup, values):
+        setattr(pup, self.attribute, tuple(self.codes.code(value) for value in values))
+
+
+# Where each single valued trait lives in Puppy.traits
+(HEALTH, SEX, COLOUR, CHIMERA_COLOUR, HORNS, TAIL, BASE, MODIFIER, SUBSPECIES, MINOR_MUTATION,
+ CHIMERA_STATUS) = range(11)
+PUPPY_TRAIT_CODES = [health_codes, sex_codes, colour_codes, colour_codes, horn_codes, tail_codes, base_codes,
+                     modifier_codes, subspecies_codes, minor_mutation_codes, chimera_codes]
+
+
+# Gene lists already written out, by their codes, as pups from the same parents share a lot of them.
+GENE_STRING_CACHE_SIZE = 4096
+_gene_strings: Dict[tuple, str] = {}
+
+BICOLOUR_CHIMERA_CODE = chimera_codes.code(BICOLOUR_CHIMERA)
+FULL_CHIMERA_CODE = chimera_codes.code(FULL_CHIMERA)
+
+
+def format_gene_list(genes: List[str]) -> str:
+    if len(genes) == 0:
+        genes = ["None"]
+    elif len(genes) > 1:
+        genes = sorted(genes)
+        last_gene = genes.pop(-1)
+        genes[-1] = "{} and {}".format(genes[-1], last_gene)
+    gene_string = ", ".join(genes)
+    return gene_string
+
+
+def format_gene_codes(codes: tuple) -> str:
+    gene_string = _gene_strings.get(codes)
+    if gene_string is None:
+        if len(_gene_strings) >= GENE_STRING_CACHE_SIZE:
+            _gene_strings.clear()
+        gene_string = _gene_strings[codes] = format_gene_list([gene_codes.name(code) for code in codes])
+    return gene_string
+
+
+def format_appearance(traits, genes: tuple, chimera_genes: tuple) -> str:
+    """Puppy.appearance from the pup's trait codes."""
+    chimera_status = traits[CHIMERA_STATUS]
+    if chimera_status == 0:
+        return f"{format_gene_codes(genes)} on {colour_codes.name(traits[COLOUR])}"
+    elif chimera_status == BICOLOUR_CHIMERA_CODE:
+        return (f"{format_gene_codes(genes)} on {colour_codes.name(traits[COLOUR])} // "
+                f"{colour_codes.name(traits[CHIMERA_COLOUR])}")
+    elif chimera_status == FULL_CHIMERA_CODE:
+        return (f"{format_gene_codes(genes)} on {colour_codes.name(traits[COLOUR])} // "
+                f"{format_gene_codes(chimera_genes)} on {colour_codes.name(traits[CHIMERA_COLOUR])}")
+
+
+def format_abnormalities(traits, major_mutations: tuple) -> str:
+    """Puppy.abnormalities from the pup's trait codes. Code 0 is no modifier, no horns, a Domestic Tail and not a
+    chimera."""
+    abnormalities_list = []
+    if traits[MODIFIER]:
+        abnormalities_list.append(modifier_codes.name(traits[MODIFIER]))
+
+    if traits[HORNS]:
+        abnormalities_list.append(horn_codes.name(traits[HORNS]))
+
+    if traits[TAIL]:
+        abnormalities_list.append(tail_codes.name(traits[TAIL]))
+
+    if traits[CHIMERA_STATUS]:
+        abnormalities_list.append(chimera_codes.name(traits[CHIMERA_STATUS]))
+
+    # Get the list of mutations - probably just one, but there's the chance for spontaneous occurrence
+
+    abnormalities_list.extend(mutation_codes.name(code) for code in major_mutations)
+
+    # Decide how to present them - if no abnormalities put none.
+    if len(abnormalities_list) > 3:
+        # Do stuff to make it 3
+        start = abnormalities_list[0]
+        end = abnormalities_list[-1]
+        middle = ", ".join(abnormalities_list[1:-1])
+        abnormalities_list = [start, middle, end]
+
+    if len(abnormalities_list) == 3:
+        abnormalities = "{} with {} and {}".format(*abnormalities_list)
+    elif len(abnormalities_list) == 2:
+        abnormalities = "{} with {}".format(*abnormalities_list)
+    elif len(abnormalities_list) == 1:
+        abnormalities = "{}".format(*abnormalities_list)
+    else:
+        abnormalities = "None"
+    return abnormalities
+
+
 class Puppy:
-    name: str
-    health: str
-    sex: str
-    colour: str
-    horns: str
-    tail: str
-    base: str
-    modifier: str
-    subspecies: str
-    major_mutations: List[str]
-    minor_mutation: str
-    chimera_status: str
-    chimera_colour: str
-    genes: List[str]
-    chimera_genes: List[str]
+    """A rolled pup. Traits are held as the integer codes from genes.py, and turned into strings when read.
+
+    appearance and abnormalities are written out once and kept, until any of the codes they're made from change.
+    """
+    __slots__ = ("name", "traits", "major_mutation_codes", "gene_codes", "chimera_gene_codes", "_rendered",
+                 "_rendered_key")
+
+    health = CodedTrait(HEALTH, health_codes)
+    sex = CodedTrait(SEX, sex_codes)
+    colour = CodedTrait(COLOUR, colour_codes)
+    chimera_colour = CodedTrait(CHIMERA_COLOUR, colour_codes)
+    horns = CodedTrait(HORNS, horn_codes)
+    tail = CodedTrait(TAIL, tail_codes)
+    base = CodedTrait(BASE, base_codes)
+    modifier = CodedTrait(MODIFIER, modifier_codes)
+    subspecies = CodedTrait(SUBSPECIES, subspecies_codes)
+    minor_mutation = CodedTrait(MINOR_MUTATION, minor_mutation_codes)
+    chimera_status = CodedTrait(CHIMERA_STATUS, chimera_codes)
+    major_mutations = CodedTraits("major_mutation_codes", mutation_codes)
+    genes = CodedTraits("gene_codes", gene_codes)
+    chimera_genes = CodedTraits("chimera_gene_codes", gene_codes)
 
     def __init__(self, name):
         self.name = name
+        # Every code 0 is the plain option - Healthy, Male, no horns, Domestic Tail, Smooth and so on.
+        self.traits = array("H", bytes(2 * len(PUPPY_TRAIT_CODES)))
+        self.major_mutation_codes = ()
+        self.gene_codes = ()
+        self.chimera_gene_codes = ()
+        self._rendered = None
+        self._rendered_key = None
 
     def format_genes(self, genes: List[str]) -> str:
-        if len(genes) == 0:
-            genes = ["None"]
-        elif len(genes) > 1:
-            genes = sorted(genes)
-            last_gene = genes.pop(-1)
-            genes[-1] = "{} and {}".format(genes[-1], last_gene)
-        gene_string = ", ".join(genes)
-        return gene_string
+        return format_gene_list(genes)
+
+    def rendered(self) -> Tuple[str, str]:
+        """(appearance, abnormalities), from the cache unless the pup has changed since they were written out."""
+        key = (self.traits.tobytes(), self.gene_codes, self.chimera_gene_codes, self.major_mutation_codes)
+        if key != self._rendered_key:
+            self._rendered = (format_appearance(self.traits, self.gene_codes, self.chimera_gene_codes),
+                              format_abnormalities(self.traits, self.major_mutation_codes))
+            self._rendered_key = key
+        return self._rendered
 
     @property
     def all_genes(self) -> List[str]:
@@ -94,67 +244,131 @@ class Puppy:
 
     @property
     def appearance(self) -> str:
-        if self.chimera_status == "None":
-            return f"{self.format_genes(self.genes)} on {self.colour}"
-        elif self.chimera_status == BICOLOUR_CHIMERA:
-            return f"{self.format_genes(self.genes)} on {self.colour} // {self.chimera_colour}"
-        elif self.chimera_status == FULL_CHIMERA:
-            return f"{self.format_genes(self.genes)} on {self.colour} // {self.format_genes(self.chimera_genes)} on {self.chimera_colour}"
+        return self.rendered()[0]
 
     @property
     def abnormalities(self) -> str:
-        abnormalities_list = []
-        if self.modifier and self.modifier != "None":
-            abnormalities_list.append(self.modifier)
-
-        if self.horns and self.horns != "None":
-            abnormalities_list.append(self.horns)
-
-        if self.tail and self.tail != "Domestic Tail":
-            abnormalities_list.append(self.tail)
-
-        if self.chimera_status and self.chimera_status != "None":
-            abnormalities_list.append(self.chimera_status)
-
-        # Get the list of mutations - probably just one, but there's the chance for spontaneous occurrence
-
-        abnormalities_list.extend(self.major_mutations)
-
-        # Decide how to present them - if no abnormalities put none.
-        if len(abnormalities_list) > 3:
-            # Do stuff to make it 3
-            start = abnormalities_list[0]
-            end = abnormalities_list[-1]
-            middle = ", ".join(abnormalities_list[1:-1])
-            abnormalities_list = [start, middle, end]
-
-        if len(abnormalities_list) == 3:
-            abnormalities = "{} with {} and {}".format(*abnormalities_list)
-        elif len(abnormalities_list) == 2:
-            abnormalities = "{} with {}".format(*abnormalities_list)
-        elif len(abnormalities_list) == 1:
-            abnormalities = "{}".format(*abnormalities_list)
-        else:
-            abnormalities = "None"
-        return abnormalities
+        return self.rendered()[1]
 
     @property
     def dictionary_form(self):
+        # A new dictionary every time, as roll_breeding adds to the health of the last one.
+        appearance, abnormalities = self.rendered()
         dictionary_form = {
             "Name": self.name,
             "Health": self.health,
             "Subspecies": self.subspecies,
             "Base": self.base,
             "Sex": self.sex,
-            "Appearance": self.appearance,
-            "Abnormalities": self.abnormalities,
+            "Appearance": appearance,
+            "Abnormalities": abnormalities,
             "MinorMutation": self.minor_mutation,
         }
         return dictionary_form
 
 
+# The traits test mode reports on, in order, and the codes each is counted by. The number of genes is just a number.
+PUPPY_COUNTER_CODES = {
+    "Health": health_codes,
+    "Sex": sex_codes,
+    "Base colours": colour_codes,
+    "Horns": horn_codes,
+    "Tails": tail_codes,
+    "Coat Type": base_codes,
+    "Modifier": modifier_codes,
+    "Subspecies": subspecies_codes,
+    "Major Mutations": mutation_codes,
+    "Minor Mutations": minor_mutation_codes,
+    "Chimera": chimera_codes,
+    "Genes": gene_codes,
+    "Total number of genes": None,
+}
+
+
+# Where each single valued trait in PUPPY_COUNTER_CODES is in Puppy.traits
+PUPPY_COUNTER_TRAITS = [("Health", HEALTH), ("Sex", SEX), ("Base colours", COLOUR), ("Horns", HORNS),
+                        ("Tails", TAIL), ("Coat Type", BASE), ("Modifier", MODIFIER), ("Subspecies", SUBSPECIES),
+                        ("Minor Mutations", MINOR_MUTATION), ("Chimera", CHIMERA_STATUS)]
+
+
+def new_test_accumulator() -> TraitAccumulator:
+    """Counts for test mode: litter sizes, then every trait in PUPPY_COUNTER_CODES."""
+    return TraitAccumulator({"Number of pups": None, **PUPPY_COUNTER_CODES}, multi=["Major Mutations", "Genes"],
+                            flags={"Genes": GLEAM_FLAG})
+
+
+def count_puppies(puppies: Iterable[Puppy], accumulator: TraitAccumulator = None) -> TraitAccumulator:
+    """Counts each trait of the pups by code into accumulator (a new test accumulator if not given)."""
+    if accumulator is None:
+        accumulator = new_test_accumulator()
+    single_traits = [(accumulator[trait].add, index) for trait, index in PUPPY_COUNTER_TRAITS]
+    add_major_mutation = accumulator["Major Mutations"].add
+    add_gene = accumulator["Genes"].add
+    add_gene_count = accumulator["Total number of genes"].add
+
+    counted = 0
+    for puppy in puppies:
+        traits = puppy.traits
+        for add, index in single_traits:
+            add(traits[index])
+        if len(puppy.major_mutation_codes) == 0:
+            add_major_mutation(None)
+        for mut in puppy.major_mutation_codes:
+            add_major_mutation(mut)
+        for gene in puppy.gene_codes:
+            add_gene(gene)
+        for gene in puppy.chimera_gene_codes:
+            add_gene(gene)
+        add_gene_count(len(puppy.gene_codes) + len(puppy.chimera_gene_codes))
+        counted += 1
+    accumulator.items += counted
+    return accumulator
+
+
+def format_shares(shares: List[Share], label_format: str = "{}") -> str:
+    """Each value's share as a percentage with its 95% interval, e.g. "Sand: 35.20% (34.26-36.15%) "."""
+    return "".join(f"{label_format.format('None' if share.value is None else share.value)}: {100*share.share:.2f}% "
+                   f"({100*share.low:.2f}-{100*share.high:.2f}%) " for share in shares)
+
+
+def get_vectorised_engine():
+    try:
+        from .vectorised_breeding import VectorisedBreedingEngine
+    except ImportError:
+        return None
+    return VectorisedBreedingEngine
+
+
+class ParentGenes:
+    """A pairing's genes as codes and masks, worked out once per roller rather than for every pup."""
+    __slots__ = ("sire", "dam", "sire_codes", "dam_codes", "sire_mask", "dam_mask", "rolls", "_discoveries")
+
+    def __init__(self, sire: BreedingVesper, dam: BreedingVesper):
+        self.sire = sire
+        self.dam = dam
+        self.sire_codes = [gene_codes.code(gene) for gene in sire.genes]
+        self.dam_codes = [gene_codes.code(gene) for gene in dam.genes]
+        self.sire_mask = gene_mask(self.sire_codes)
+        self.dam_mask = gene_mask(self.dam_codes)
+        # (code, bit, rarity) for each pass roll. A gene in both parents gets two.
+        self.rolls = [(code, gene_bit(code), gene_rarity_index.get(gene))
+                      for gene, code in zip(list(sire.genes) + list(dam.genes), self.sire_codes + self.dam_codes)]
+        self._discoveries = (None, [])
+
+    def discoveries(self, ruleset: Ruleset) -> List[tuple]:
+        """(gene code, rarity) for each genetic discovery the pairing can make under the ruleset."""
+        fingerprint, discoveries = self._discoveries
+        if fingerprint != ruleset.fingerprint:
+            discoveries = discovery_index(ruleset).discoveries(self.sire_mask, self.dam_mask)
+            self._discoveries = (ruleset.fingerprint, discoveries)
+        return discoveries
+
+
 class BreedingRoller:
-    def __init__(self, vespers: List[BreedingVesper], modifiers, password_valid=False, is_test=False):
+    def __init__(self, vespers: List[BreedingVesper], modifiers, password_valid=False, is_test=False, exact_test=False,
+                 rng: RollRandom = None, test_iterations: int = None, test_workers: int = 1,
+                 compiled_tables=True, stats=None, stats_hook=None, ruleset: Ruleset = None, cache_tests=None,
+                 journal=None):
         #Vespers were [{'Colour': 'Sand', 'Horns': 'None', 'Tail': 'Hook', 'Base': 'Maned', 'Genes': []}, {'Colour': 'Sand', 'Horns': 'None', 'Tail': 'Hook', 'Base': 'Maned', 'Genes': []}]
         #                                "Subspecies": data["{}species".format(id)],
         #                        "Mutation": data["{}mut".format(id)],
@@ -163,198 +377,263 @@ class BreedingRoller:
         self.dam = vespers[1]
         self.modifiers = modifiers
         self.comments = []
-        self.puppies = []
         self.puppies_class_format = []
+        self._puppies = None
         self.all_male = False
         self.all_female = False
         self.gene_boost = 0
         self.genetic_discovery = password_valid
         self.is_test = is_test
+        self.exact_test = exact_test
+        # Pass rates, litter sizes and so on, see ruleset.py. None takes the active ruleset as it is right now, so a
+        # reload never changes the rules half way through a litter.
+        self.ruleset = ruleset if ruleset is not None else get_active_ruleset()
+        # Pass a seeded RollRandom to get the same litter every time.
+        self.rng = rng if rng is not None else RollRandom()
+        # Test mode sample size (None picks a default for the engine) and process count (None uses every core).
+        self.test_iterations = test_iterations
+        self.test_workers = test_workers
+        # Draw single-roll traits from compiled alias tables rather than rolling each step.
+        self.compiled_tables = compiled_tables
+        self._inheritance_tables = None
+        self._parent_genes = None
+        # Answer a test already run for the same parents from result_cache.test_cache rather than rolling it again.
+        # None only does for an unseeded roller, as a seeded test has to repeat exactly.
+        self.cache_tests = rng is None if cache_tests is None else cache_tests
+        # Pass a roll_journal.RollJournal to append every litter rolled to it.
+        self.journal = journal
+        self.journalled_litters = 0
+        # Pass a RollStats to time each step and count RNG draws, see instrumentation.py. Off costs nothing.
+        self.stats = stats
+        if stats is not None:
+            from .instrumentation import instrument
+            instrument(self, stats, stats_hook)
 
     def roll_breeding(self):
+        if not self.check_valid():
+            return
+
+        if self.journal is None:
+            pups = self.roll_litter()
+        else:
+            pups = self.roll_journalled_litter()
+
+        self.puppies_class_format.extend(pups)
+        self._puppies = None
+
+        if self.is_test:
+            self.perform_cached_test()
+
+    def roll_journalled_litter(self) -> List[Puppy]:
+        """Rolls the litter from its own seed, spawned from self.rng, and journals it with that seed. The journal can
+        then replay it however many litters this roller rolled before."""
+        rng = self.rng
+        self.rng = rng.spawn(self.journalled_litters)
+        self.journalled_litters += 1
+        try:
+            pups = self.roll_litter()
+            self.journal.record_litter(self, pups, self.rng.seed)
+        finally:
+            self.rng = rng
+        return pups
+
+    @property
+    def puppies(self) -> List[Dict]:
+        """puppies_class_format as dictionaries, made the first time they're asked for."""
+        if self._puppies is None:
+            #Pup 1
+            #Stillborn
+            #Coat Type: Smooth
+            #Sex: Male
+            #Appearance: Points and Mask on Coal.
+            #Abnormalities: Docked Tail.
+            self._puppies = [pup.dictionary_form for pup in self.puppies_class_format]
+            if self._puppies and self.last_health_note():
+                self._puppies[-1]["Health"] += self.last_health_note()
+        return self._puppies
+
+    def last_health_note(self) -> str:
+        """Added to the last pup's health when it's written out."""
+        # roll_litter keeps the spring blessing cub alive, unless it's inbred, which needs a person to sort out.
+        if self.modifiers["SpringBlessing"] and self.modifiers["Inbred"]:
+            return "MANUALLY ADJUST - Inbred but should be alive"
+        return ""
+
+    def check_valid(self):
         # Check there aren't any duplicate genes - this is the only
-        if len(set(self.sire.genes)) < len(self.sire.genes):
+        if has_duplicates(self.parent_genes.sire_codes):
             self.comments.append("THIS BREEDING IS NOT VALID! The same gene has been entered more than once for the sire.")
-            return
-        if len(set(self.dam.genes)) < len(self.dam.genes):
+            return False
+        if has_duplicates(self.parent_genes.dam_codes):
             self.comments.append("THIS BREEDING IS NOT VALID! The same gene has been entered more than once for the dam.")
-            return
+            return False
         if self.modifiers["VirusReduction"] < 0:
             self.comments.append("THIS BREEDING IS NOT VALID! Negative virus reduction is not possible")
-            return
+            return False
         if self.modifiers["Inbred"] < 0:
             self.comments.append("THIS BREEDING IS NOT VALID! Negative shared ancestors are not possible")
-            return
+            return False
+        return True
 
+    def roll_litter(self) -> List['Puppy']:
+        """Rolls the litter as Puppy objects, without the dictionaries and test results roll_breeding adds."""
         num_cubs = self.get_number_cubs()
 
+        # A booster only lasts the litter it activated for, so a roller that's reused starts each one afresh.
+        self.all_male = False
+        self.all_female = False
         if self.modifiers['MaleBoost'] and self.modifiers['FemaleBoost']:
             self.comments.append("You applied two different gender boosters to this litter, neither can activate")
-        elif (randint(1,100) < 81) and self.modifiers['MaleBoost']:
+        elif (self.rng.randint(1,100) < 81) and self.modifiers['MaleBoost']:
             self.comments.append("Your oak twig activated, the litter will be all male")
             self.all_male = True
-        elif (randint(1,100) < 81) and self.modifiers['FemaleBoost']:
+        elif (self.rng.randint(1,100) < 81) and self.modifiers['FemaleBoost']:
             self.comments.append("Your willow sprig activated, the litter will be all female")
             self.all_female = True
 
-        if self.modifiers["Bonded"]:
-            self.gene_boost += 5
+        self.gene_boost = self.get_gene_boost()
 
-        for cub in range(num_cubs):
-            #Pup 1
-            #Stillborn
-            #Coat Type: Smooth
-            #Sex: Male
-            #Appearance: Points and Mask on Coal.
-            #Abnormalities: Docked Tail.
-            pup = self.get_puppy(cub+1)
+        pups = [self.get_puppy(cub+1) for cub in range(num_cubs)]
+        # This is a bit hacky, but the last, spring blessing cub, should always be alive, so set that retroactively.
+        if self.modifiers["SpringBlessing"] and not self.modifiers["Inbred"]:
+            pups[-1].traits[HEALTH] = 0
+        return pups
 
-            self.puppies.append(pup.dictionary_form)
-            self.puppies_class_format.append(pup)
+    @property
+    def inheritance_tables(self):
+        # Tables depend on gene_boost and the ruleset, so rebuild them if either has changed since.
+        tables = self._inheritance_tables
+        if tables is None or tables.gene_boost != self.gene_boost or tables.ruleset is not self.ruleset:
+            from .inheritance_tables import InheritanceTables
+            self._inheritance_tables = InheritanceTables(self)
+        return self._inheritance_tables
+
+    def get_gene_boost(self):
+        # A bonded pair passes everything on more often.
+        if self.modifiers["Bonded"]:
+            return self.ruleset.bonded_gene_boost
+        return 0
 
-        # This is a bit hacky, but the last, spring blessing cub, should always be alive, so set that retroactively.
-        if self.modifiers["SpringBlessing"]:
-            blessed_cub = self.puppies[-1]
-            if self.modifiers["Inbred"]:
-                blessed_cub["Health"] += "MANUALLY ADJUST - Inbred but should be alive"
-            else:
-                blessed_cub["Health"] = "Healthy"
+    def perform_cached_test(self):
+        if not self.cache_tests:
+            self.run_test()
+            return
 
-        if self.is_test:
+        from .result_cache import test_cache, test_cache_key
+        key = test_cache_key(self, None if self.exact_test else self.get_test_iterations())
+        comments = test_cache.get(key)
+        if comments is None:
+            first_comment = len(self.comments)
+            self.run_test()
+            test_cache.put(key, tuple(self.comments[first_comment:]))
+        else:
+            self.comments.extend(comments)
+
+    def run_test(self):
+        if self.exact_test:
+            self.perform_exact_test()
+        else:
             self.perform_test()
 
-    def perform_test(self):
-        iterations = 10000
-        pups_counter = Counter()
-        for iter in range(iterations):
-            pups_counter[self.get_number_cubs()] += 1
+    def get_test_iterations(self):
+        if self.test_iterations is not None:
+            return self.test_iterations
+        return VECTORISED_TEST_ITERATIONS if get_vectorised_engine() else TEST_ITERATIONS
 
-        pup_distribution = []
-        for num, count in pups_counter.items():
-            pup_distribution.append((num, f"{100*count/iterations:.2f}%",count))
-        pup_distribution.sort(key=lambda x: x[2], reverse=True)
+    def perform_test(self):
+        iterations = self.get_test_iterations()
 
-        pup_dist_str = ""
-        for num, percentage, count in pup_distribution:
-            pup_dist_str += f"{num} pups: {percentage} "
+        if self.test_workers == 1:
+            accumulator = self.roll_test_accumulator(iterations)
+        else:
+            from .parallel import run_parallel_test
+            accumulator = run_parallel_test(self, iterations, self.test_workers)
+        self.add_test_comments(iterations, accumulator)
+
+    def roll_test_accumulator(self, iterations) -> TraitAccumulator:
+        engine = get_vectorised_engine()
+        if engine is None:
+            # No NumPy, so roll the test pups one at a time.
+            return self.get_test_accumulator(iterations)
+        return engine(self, self.rng.getrandbits(64)).run(iterations)
+
+    def perform_exact_test(self):
+        from .breeding_distributions import BreedingDistributions
+        distributions = BreedingDistributions(self)
+
+        self.comments.append("Exact number of pups per litter is")
+        self.comments.append(self.format_distribution(distributions.number_cubs(), "{} pups: {:.2f}% "))
+
+        self.comments.append("Exact chances for each puppy are as follows.")
+        for distribution_name, distribution in distributions.all_distributions().items():
+            self.comments.append(f"{distribution_name} occurrence is {self.format_distribution(distribution)}")
+
+    def format_distribution(self, distribution, value_format="{}: {:.2f}% "):
+        return "".join(value_format.format(value, 100*probability)
+                       for value, probability in sorted(distribution.items(), key=lambda x: x[1], reverse=True))
+
+    def get_test_accumulator(self, iterations) -> TraitAccumulator:
+        accumulator = new_test_accumulator()
+        add_litter = accumulator["Number of pups"].add
+        for iter in range(iterations):
+            add_litter(self.get_number_cubs())
+        return count_puppies((self.get_puppy(iter) for iter in range(iterations)), accumulator)
 
+    def add_test_comments(self, iterations, accumulator: TraitAccumulator):
         self.comments.append(f"Number of pups per litter averaged over {iterations} litters is")
-        self.comments.append(f"{pup_dist_str}")
-
-        health_counter = Counter()
-        sex_counter = Counter()
-        colours_counter = Counter()
-        horns_counter = Counter()
-        tail_counter = Counter()
-        base_counter = Counter()
-        modifier_counter = Counter()
-        subspecies_counter = Counter()
-        major_mutation_counter = Counter()
-        minor_mutation_counter = Counter()
-        chimera_counter = Counter()
-        genes_counter = Counter()
-        num_gene_counter = Counter()
-
-        all_counters = {
-            "Health": health_counter,
-            "Sex": sex_counter,
-            "Base colours": colours_counter,
-            "Horns": horns_counter,
-            "Tails": tail_counter,
-            "Coat Type": base_counter,
-            "Modifier": modifier_counter,
-            "Subspecies": subspecies_counter,
-            "Major Mutations": major_mutation_counter,
-            "Minor Mutations": minor_mutation_counter,
-            "Chimera": chimera_counter,
-            "Genes": genes_counter,
-            "Total number of genes": num_gene_counter
-        }
-
-        for iter in range(iterations):
-            puppy = self.get_puppy(iter)
-            health_counter[puppy.health] += 1
-            sex_counter[puppy.sex] += 1
-            colours_counter[puppy.colour] += 1
-            horns_counter[puppy.horns] +=1
-            tail_counter[puppy.tail] += 1
-            base_counter[puppy.base] += 1
-            modifier_counter[puppy.modifier] += 1
-            subspecies_counter[puppy.subspecies] += 1
-            if len(puppy.major_mutations) == 0:
-                major_mutation_counter["None"] += 1
-            for mut in puppy.major_mutations:
-                major_mutation_counter[mut] += 1
-            minor_mutation_counter[puppy.minor_mutation] +=1
-            chimera_counter[puppy.chimera_status] += 1
-            gene_count = 0
-            for gene in puppy.genes:
-                genes_counter[gene] += 1
-                gene_count += 1
-            if puppy.chimera_status == FULL_CHIMERA:
-                for gene in puppy.chimera_genes:
-                    genes_counter[gene] += 1
-                    gene_count += 1
-            num_gene_counter[gene_count] += 1
+        self.comments.append(format_shares(accumulator.shares("Number of pups"), "{} pups"))
 
         self.comments.append(f"Test rolling {iterations} puppies we got the following results.")
-        for counter_name, counter in all_counters.items():
-            if counter_name in ["Genes", "Major Mutations"]:
-                total = iterations
-            else:
-                total = sum(counter.values())
-            distribution = []
-            for num, count in counter.items():
-                distribution.append((num, f"{100*count/total:.2f}%", count))
-            distribution.sort(key=lambda x: x[2], reverse=True)
-            distribution_string = ""
-            for value, percentage, count in distribution:
-                distribution_string += f"{value}: {percentage} "
-            self.comments.append(f"{counter_name} occurrence is {distribution_string}")
-
+        for trait in PUPPY_COUNTER_CODES:
+            self.comments.append(f"{trait} occurrence is {format_shares(accumulator.shares(trait))}")
 
     def get_puppy(self, number):
         pup = Puppy(f"Pup {number}")
+        traits = pup.traits
         if self.all_male:
-            pup.sex = "Male"
+            traits[SEX] = MALE
         elif self.all_female:
-            pup.sex = "Female"
-        elif (randint(1, 100) < 51):
-            pup.sex = "Male"
+            traits[SEX] = FEMALE
+        elif (self.rng.randint(1, 100) < 51):
+            traits[SEX] = MALE
         else:
-            pup.sex = "Female"
-        pup.health = self.get_health()
+            traits[SEX] = FEMALE
+        traits[HEALTH] = self.get_health()
 
         # Sort out chimera first, as this affects a lot.
-        pup.chimera_status = self.get_chimera()
+        chimera_status = self.get_chimera()
+        pup.chimera_status = chimera_status
         pup.colour = self.get_colour()
-        if pup.chimera_status in [BICOLOUR_CHIMERA, FULL_CHIMERA]:
+        if chimera_status in [BICOLOUR_CHIMERA, FULL_CHIMERA]:
             pup.chimera_colour = self.get_colour()
 
-        if pup.chimera_status == FULL_CHIMERA:
-            pup.genes = self.get_genes(max=5)
-            pup.chimera_genes = self.get_genes(max=5)
+        if chimera_status == FULL_CHIMERA:
+            pup.gene_codes = self.get_genes(max=5)
+            pup.chimera_gene_codes = self.get_genes(max=5)
         else:
-            pup.genes = self.get_genes()
+            pup.gene_codes = self.get_genes()
 
         # Get horns
         pup.horns = self.get_horns()
         # Get tail
-        tail = self.get_tail()
-        pup.tail = "{} Tail".format(tail)
+        traits[TAIL] = tail_codes.code(self.get_tail())
         pup.modifier = self.get_modifier()
 
-        pup.base = self.get_base()
-        pup.subspecies = self.get_species()
+        base = self.get_base()
+        subspecies = self.get_species()
 
         # Fix base for pygmies - they can't be woolen or maned
-        if pup.subspecies == "Bat Eared Pygmy Vesper" and pup.base == "Woolen":
-            pup.base = "Smooth"
-        pup.major_mutations = self.get_major_mutations()
+        if subspecies == "Bat Eared Pygmy Vesper" and base == "Woolen":
+            base = "Smooth"
+        pup.base = base
+        pup.subspecies = subspecies
+        pup.major_mutation_codes = self.get_major_mutations()
         pup.minor_mutation = self.get_minor_mutation()
         return pup
 
     def get_colour(self):
+        if self.compiled_tables:
+            return self.inheritance_tables.colour.draw(self.rng)
         possible_colours = []
         possible_colours.append(self.sire.colour)
         if self.sire.chimera_status in all_chimeras:
@@ -364,16 +643,16 @@ class BreedingRoller:
             possible_colours.append(self.dam.chimera_colour)
 
         # Which base colour do we have? Pick one at random.
-        shuffle(possible_colours)
-        base = colours_with_details[possible_colours[0]][1]
+        self.rng.shuffle(possible_colours)
+        base = colour_index[possible_colours[0]][1]
 
-        # colour_modifier_base_lookup - for at the end
-        # colours_with_details
+        # colour_modifier_base_index - for at the end
+        # colour_index
         # "Quartz Amaranth": ("Quartz", "Earth", Rarity.RARE)
         # What modifier, if any, is inherited?
         possible_mods = []
         for colour in possible_colours:
-            possible_mods.append((colours_with_details[colour][0], colours_with_details[colour][2]))
+            possible_mods.append((colour_index[colour][0], colour_index[colour][2]))
         passed_mods = []
         for mod in possible_mods:
             if self.get_does_mod_pass(mod[0], mod[1]):
@@ -385,129 +664,142 @@ class BreedingRoller:
             mod = passed_mods[0][0]
         else:
             # Find what is the rarity of the rarest mod passed
-            max_rarity_value = max([mod[1].value for mod in passed_mods])
+            max_rarity = max([mod[1] for mod in passed_mods])
             # Get all the mods with that rarity
             rarest_mods = []
             for mod in passed_mods:
-                if mod[1].value == max_rarity_value:
+                if mod[1] == max_rarity:
                     rarest_mods.append(mod[0])
             # Pick one at random
-            shuffle(rarest_mods)
+            self.rng.shuffle(rarest_mods)
             mod = rarest_mods[0]
 
         # What does base + modifier give?
         key = (mod, base)
-        if key not in colour_modifier_base_lookup:
+        if key not in colour_modifier_base_index:
             return base
         else:
-            possible_colours = colour_modifier_base_lookup[key]
-            return choice(possible_colours)
+            possible_colours = colour_modifier_base_index[key]
+            return self.rng.choice(possible_colours)
 
     def get_does_mod_pass(self, mod, rarity):
         if mod == None:
             return False
 
-        pass_rate = 0
-        if rarity == Rarity.RARE:
-            pass_rate = RARE_PASS_RATE + self.gene_boost
-        elif rarity == Rarity.UNCOMMON:
-            pass_rate = UNCOMMON_PASS_RATE + self.gene_boost
-        if randint(1, 100) <= pass_rate:
+        pass_rate = self.get_mod_pass_rate(rarity)
+        if self.rng.randint(1, 100) <= pass_rate:
             return True
         else:
             return False
 
+    def get_mod_pass_rate(self, rarity):
+        pass_rate = 0
+        if rarity == Rarity.RARE:
+            pass_rate = self.ruleset.rare_pass_rate + self.gene_boost
+        elif rarity == Rarity.UNCOMMON:
+            pass_rate = self.ruleset.uncommon_pass_rate + self.gene_boost
+        return pass_rate
+
+    @property
+    def parent_genes(self) -> 'ParentGenes':
+        parent_genes = self._parent_genes
+        if parent_genes is None or parent_genes.sire is not self.sire or parent_genes.dam is not self.dam:
+            parent_genes = self._parent_genes = ParentGenes(self.sire, self.dam)
+        return parent_genes
+
     def get_genes(self, max=10):
-        siregenes = self.sire.genes
-        damgenes = self.dam.genes
-        allpossiblegenes = list(siregenes) + list(damgenes)
-        output_genes = []
-        for gene in allpossiblegenes:
-            if self.get_does_gene_pass(gene, self.get_gene_rarity(gene)):
-                output_genes.append(gene)
+        """Returns the codes of the genes passed on, see gene_codes."""
+        parent_genes = self.parent_genes
+        # The genes passed so far as a mask, for de-duplicating, and in the order they passed in so seeded rolls repeat
+        passed = 0
+        final_genes = []
+        for code, bit, rarity in parent_genes.rolls:
+            if self.get_does_gene_pass(code, rarity) and not passed & bit:
+                passed |= bit
+                final_genes.append(code)
 
         # Add stardust if we have a chance for it
         if self.modifiers["Stardust"]:
-            rng = randint(1,100)
-            if rng <= self.modifiers["Stardust"]:
-                output_genes.append("Stardust")
+            rng = self.rng.randint(1,100)
+            if rng <= self.modifiers["Stardust"] and not passed & STARDUST_BIT:
+                passed |= STARDUST_BIT
+                final_genes.append(STARDUST_CODE)
 
         # Also genetic discovery genes - but only if the password is valid
         if self.genetic_discovery:
             # Genetic discovery section. Hush.
-            for parent_genes, child_gene in genetic_discovery_genes.items():
-                one, two = parent_genes
-                gene, rarity = child_gene
-                if (((one in siregenes) and (two in damgenes)) or
-                    ((two in siregenes) and (one in damgenes))):
-                    # Discovery possible
-                    if self.get_does_gene_pass(gene,rarity):
-                        output_genes.append(gene)
-
-        # Remove duplicates by transforming into set
-        final_genes = list(set(output_genes))
+            for code, rarity in parent_genes.discoveries(self.ruleset):
+                if self.get_does_gene_pass(code, rarity) and not passed & gene_bit(code):
+                    passed |= gene_bit(code)
+                    final_genes.append(code)
 
         # Get rid of any genes above threshold
         if len(final_genes) > max:
-            self.trim_genes(final_genes, max)
+            passed = self.trim_genes(final_genes, max, passed)
 
         # So theoretically we need to restrict colour modifiers, but I figure the user can deal with it if it ever happens
         # given they're mythic.
-        if "Gleam" in final_genes:
-            final_genes.remove("Gleam")
-            gleam_genes = final_genes.copy()
-            for gene in freecolour_genes:
-                if gene in gleam_genes:
-                    gleam_genes.remove(gene)
+        if passed & GLEAM_BIT:
+            final_genes.remove(GLEAM_CODE)
+            gleam_genes = [gene for gene in final_genes if not gene_bit(gene) & FREECOLOUR_MASK]
             if len(gleam_genes) > 0:
-                random_gene_num = randint(0, len(gleam_genes)-1)
+                random_gene_num = self.rng.randint(0, len(gleam_genes)-1)
                 random_gene_value = gleam_genes[random_gene_num]
                 random_gene_index = final_genes.index(random_gene_value)
-                final_genes[random_gene_index] = "{} (Gleam)".format(final_genes[random_gene_index])
+                final_genes[random_gene_index] |= GLEAM_FLAG
             else:
                 # Nothing we could sensibly attach to, add gleam unassigned.
-                final_genes.append("Gleam")
-
-        return final_genes
-
-    def trim_genes(self, gene_list, max_genes):
-        rarity_order = [Rarity.COMMON, Rarity.UNCOMMON, Rarity.RARE, Rarity.MYTHIC]
-        for rarity in rarity_order:
-            rarity_genes = []
-            for gene in gene_list:
-                if self.get_gene_rarity(gene) == rarity:
-                    rarity_genes.append(gene)
-            shuffle(rarity_genes)
-            for gene in rarity_genes:
-                if len(gene_list) <= max_genes:
-                    return
-                gene_list.remove(gene)
+                final_genes.append(GLEAM_CODE)
+
+        return tuple(final_genes)
+
+    def trim_genes(self, gene_list, max_genes, passed=None):
+        """Drops random genes from gene_list, commonest first, until there are max_genes. Returns the mask left."""
+        if passed is None:
+            passed = gene_mask(gene_list)
+        excess = len(gene_list) - max_genes
+        removed = 0
+        for rarity in TRIM_ORDER:
+            rarity_mask = passed & RARITY_MASKS[rarity]
+            if not rarity_mask:
+                continue
+            # Shuffled in the order they passed, so seeded rolls repeat.
+            rarity_genes = [gene for gene in gene_list if gene_bit(gene) & rarity_mask]
+            self.rng.shuffle(rarity_genes)
+            # Removing a gene at a time, a rarity that exactly used up the excess left the next one still shuffled
+            # before stopping, so that shuffle stays too.
+            if excess <= 0:
+                break
+            for gene in rarity_genes[:excess]:
+                removed |= gene_bit(gene)
+            excess -= len(rarity_genes)
+            if excess < 0:
+                break
+        gene_list[:] = [gene for gene in gene_list if not gene_bit(gene) & removed]
+        return passed & ~removed
 
     def get_gene_rarity(self, gene):
-            if gene in all_mythic_genes:
-                return Rarity.MYTHIC
-            elif gene in all_rare_genes:
-                return Rarity.RARE
-            elif gene in all_uncommon_genes:
-                return Rarity.UNCOMMON
-            elif gene in all_common_genes:
-                return Rarity.COMMON
+            return gene_rarity_index.get(gene)
 
 
     def get_does_gene_pass(self, gene, rarity):
+        pass_rate = self.get_gene_pass_rate(rarity)
+        if self.rng.randint(1, 100) <= pass_rate:
+            return True
+        else:
+            return False
+
+    def get_gene_pass_rate(self, rarity):
         pass_rate = 0
         if rarity == Rarity.MYTHIC:
-            pass_rate = MYTHIC_PASS_RATE + self.gene_boost
+            pass_rate = self.ruleset.mythic_pass_rate + self.gene_boost
         elif rarity == Rarity.RARE:
-            pass_rate = RARE_PASS_RATE + self.gene_boost
+            pass_rate = self.ruleset.rare_pass_rate + self.gene_boost
         elif rarity == Rarity.UNCOMMON:
-            pass_rate = UNCOMMON_PASS_RATE + self.gene_boost
+            pass_rate = self.ruleset.uncommon_pass_rate + self.gene_boost
         elif rarity == Rarity.COMMON:
-            pass_rate = COMMON_PASS_RATE + self.gene_boost
-        if randint(1, 100) <= pass_rate:
-            return True
-        else:
-            return False
+            pass_rate = self.ruleset.common_pass_rate + self.gene_boost
+        return pass_rate
 
     def get_species(self):
         sirespecies = self.sire.subspecies
@@ -518,7 +810,7 @@ class BreedingRoller:
             return "Bat Eared Pygmy Vesper"
         else:
             # Two different species, randomise
-            rng = randint(1,100)
+            rng = self.rng.randint(1,100)
             if rng <= 25:
                 return "Bat Eared Pygmy Vesper"
             else:
@@ -527,36 +819,38 @@ class BreedingRoller:
     def get_major_mutations(self):
         siremut = self.sire.mutation
         dammut = self.dam.mutation
-        mutations = set()
+        mutations = []
         if siremut != "None":
-            if randint(1,100) <= 3:
-                mutations.add(siremut + " Mutation")
+            if self.rng.randint(1,100) <= 3:
+                mutations.append(mutation_codes.code(siremut))
         if dammut != "None":
-            if randint(1,100) <= 3:
-                mutations.add(dammut + " Mutation")
+            if self.rng.randint(1,100) <= 3:
+                mutations.append(mutation_codes.code(dammut))
         # random major mutation
-        if randint(1,100) <= 1:
-            mutations.add(choice(all_mutations) + " Mutation")
-        return list(mutations)
+        if self.rng.randint(1,100) <= 1:
+            mutations.append(mutation_codes.code(self.rng.choice(all_mutations)))
+        return tuple(dict.fromkeys(mutations))
 
     def get_minor_mutation(self):
-        if randint(1,100) <= 1:
-            return choice(minor_mutations)
+        if self.rng.randint(1,100) <= 1:
+            return self.rng.choice(minor_mutations)
         return "None"
 
     def get_base(self):
+        if self.compiled_tables:
+            return self.inheritance_tables.base.draw(self.rng)
         sirebase = self.sire.base
         dambase = self.dam.base
         sire_passed, sire_rarity = self.get_passed_base(sirebase)
         dam_passed, dam_rarity = self.get_passed_base(dambase)
         base = "Error"
         if sire_passed and dam_passed:
-            if sire_rarity.value > dam_rarity.value:
+            if sire_rarity > dam_rarity:
                 base = sirebase
-            elif dam_rarity.value > sire_rarity.value:
+            elif dam_rarity > sire_rarity:
                 base = dambase
             else:
-                base = sirebase if (randint(1,2) == 1) else dambase
+                base = sirebase if (self.rng.randint(1,2) == 1) else dambase
         elif sire_passed:
             base = sirebase
         elif dam_passed:
@@ -566,36 +860,41 @@ class BreedingRoller:
         return base
 
     def get_passed_base(self, base):
-        pass_rate = 0
-        rarity = Rarity.COMMON
-        if base in rare_bases:
-            # Rare coat = 15% pass rate
-            pass_rate = MANED_PASS_RATE + self.gene_boost
-            rarity = Rarity.RARE
-        elif base in uncommon_bases:
-            pass_rate = UNCOMMON_PASS_RATE + self.gene_boost
-            rarity = Rarity.UNCOMMON
-        elif base in common_bases:
-            pass_rate = COMMON_PASS_RATE + self.gene_boost
-            rarity = Rarity.COMMON
-        if randint(1,100) <= pass_rate:
+        pass_rate, rarity = self.get_base_pass_rate(base)
+        if self.rng.randint(1,100) <= pass_rate:
             return True, rarity
         else:
             return False, rarity
 
+    def get_base_pass_rate(self, base):
+        pass_rate = 0
+        rarity = base_rarity_index.get(base)
+        if rarity == Rarity.RARE:
+            # Rare coat = 15% pass rate
+            pass_rate = self.ruleset.maned_pass_rate + self.gene_boost
+        elif rarity == Rarity.UNCOMMON:
+            pass_rate = self.ruleset.uncommon_pass_rate + self.gene_boost
+        elif rarity == Rarity.COMMON:
+            pass_rate = self.ruleset.common_pass_rate + self.gene_boost
+        else:
+            rarity = Rarity.COMMON
+        return pass_rate, rarity
+
     def get_modifier(self):
+        if self.compiled_tables:
+            return self.inheritance_tables.modifier.draw(self.rng)
         siremod = self.sire.modifier
         dammod = self.dam.modifier
         sire_passed, sire_rarity = self.get_passed_modifier(siremod)
         dam_passed, dam_rarity = self.get_passed_modifier(dammod)
         mod = "Error"
         if sire_passed and dam_passed:
-            if sire_rarity.value > dam_rarity.value:
+            if sire_rarity > dam_rarity:
                 mod = siremod
-            elif dam_rarity.value > sire_rarity.value:
+            elif dam_rarity > sire_rarity:
                 mod = dammod
             else:
-                mod = siremod if (randint(1, 2) == 1) else dammod
+                mod = siremod if (self.rng.randint(1, 2) == 1) else dammod
         elif sire_passed:
             mod = siremod
         elif dam_passed:
@@ -605,30 +904,33 @@ class BreedingRoller:
         return mod
 
     def get_passed_modifier(self, modifier):
-        if modifier == "None":
-            return False, Rarity.COMMON
-        pass_rate = MYTHIC_PASS_RATE + self.gene_boost
-        rarity = Rarity.MYTHIC
-
-        if pass_rate and randint(1,100) <= pass_rate:
+        pass_rate, rarity = self.get_modifier_pass_rate(modifier)
+        if pass_rate and self.rng.randint(1,100) <= pass_rate:
             return True, rarity
         else:
             return False, Rarity.COMMON
 
+    def get_modifier_pass_rate(self, modifier):
+        if modifier == "None":
+            return 0, Rarity.COMMON
+        return self.ruleset.mythic_pass_rate + self.gene_boost, Rarity.MYTHIC
+
 
     def get_horns(self):
+        if self.compiled_tables:
+            return self.inheritance_tables.horns.draw(self.rng)
         sirehorns = self.sire.horns
         damhorns = self.dam.horns
         sire_passed, sire_rarity = self.get_passed_horns(sirehorns)
         dam_passed, dam_rarity = self.get_passed_horns(damhorns)
         horns = "Error"
         if sire_passed and dam_passed:
-            if sire_rarity.value > dam_rarity.value:
+            if sire_rarity > dam_rarity:
                 horns = sirehorns
-            elif dam_rarity.value > sire_rarity.value:
+            elif dam_rarity > sire_rarity:
                 horns = damhorns
             else:
-                horns = sirehorns if (randint(1,2) == 1) else damhorns
+                horns = sirehorns if (self.rng.randint(1,2) == 1) else damhorns
         elif sire_passed:
             horns = sirehorns
         elif dam_passed:
@@ -638,196 +940,165 @@ class BreedingRoller:
         return horns
 
     def get_passed_horns(self, horns):
-        pass_rate = 0
-        rarity = Rarity.COMMON
-        if horns in mythic_horns:
-            pass_rate = MYTHIC_PASS_RATE + self.gene_boost
-            rarity = Rarity.MYTHIC
-        if horns in rare_horns:
-            pass_rate = RARE_PASS_RATE + self.gene_boost
-            rarity = Rarity.RARE
-        elif horns in uncommon_horns:
-            pass_rate = UNCOMMON_PASS_RATE + self.gene_boost
-            rarity = Rarity.UNCOMMON
-
-        if pass_rate and randint(1,100) <= pass_rate:
+        pass_rate, rarity = self.get_horns_pass_rate(horns)
+        if pass_rate and self.rng.randint(1,100) <= pass_rate:
             return True, rarity
         else:
             return False, Rarity.COMMON
 
+    def get_horns_pass_rate(self, horns):
+        pass_rate = 0
+        rarity = horn_rarity_index.get(horns, Rarity.COMMON)
+        if rarity == Rarity.MYTHIC:
+            pass_rate = self.ruleset.mythic_pass_rate + self.gene_boost
+        elif rarity == Rarity.RARE:
+            pass_rate = self.ruleset.rare_pass_rate + self.gene_boost
+        elif rarity == Rarity.UNCOMMON:
+            pass_rate = self.ruleset.uncommon_pass_rate + self.gene_boost
+        return pass_rate, rarity
+
     def get_tail(self):
+        if self.compiled_tables:
+            return self.inheritance_tables.tail.draw(self.rng)
         siretail = self.sire.tail
         damtail = self.dam.tail
         sire_passed, sire_rarity = self.get_passed_tail(siretail)
         dam_passed, dam_rarity = self.get_passed_tail(damtail)
 
-        if sire_rarity.value > dam_rarity.value:
+        if sire_rarity > dam_rarity:
             tail = sire_passed
-        elif dam_rarity.value > sire_rarity.value:
+        elif dam_rarity > sire_rarity:
             tail = dam_passed
         else:
-            tail = sire_passed if (randint(1,2) == 1) else dam_passed
+            tail = sire_passed if (self.rng.randint(1,2) == 1) else dam_passed
 
         return tail
 
 
     def get_passed_tail(self, tail):
-        if tail == "Domestic":
+        tail_ladder = self.get_tail_ladder(tail)
+        if not tail_ladder:
             return "Domestic", Rarity.DEFAULT
 
-        if tail in ["Skeletal", "Starchaser", "Scorpivias"]:
-            roll = randint(1,100)
-            if roll <= (MYTHIC_PASS_RATE + self.gene_boost):
-                return tail, Rarity.MYTHIC
-            elif roll <= (RARE_PASS_RATE + self.gene_boost):
-                return choice(rare_tails), Rarity.RARE
-            elif roll <= (UNCOMMON_PASS_RATE + self.gene_boost):
-                return choice(uncommon_tails), Rarity.UNCOMMON
-            elif roll <= (COMMON_PASS_RATE + self.gene_boost):
-                return choice(common_tails), Rarity.COMMON
-            else:
-                return "Domestic", Rarity.DEFAULT
+        roll = self.rng.randint(1,100)
+        for pass_rate, possible_tails, rarity in tail_ladder:
+            if roll <= pass_rate:
+                return self.rng.choice(possible_tails), rarity
+        return "Domestic", Rarity.DEFAULT
+
+    def get_tail_ladder(self, tail):
+        """The (pass rate, possible tails, rarity) steps a parent's tail is rolled against, first match wins."""
+        if tail == "Domestic":
+            return []
+
+        tail_details = self.ruleset.tail_index[tail]
 
+        # Skeletal and the other unfamilied mythics can go to any tail of a lower rarity.
         # Tailless is a rare tail which can go to anything else if it would be uncommon or below.
-        if tail in ["Tailless"]:
-            roll = randint(1,100)
-            if roll <= (MYTHIC_PASS_RATE + self.gene_boost):
-                return tail, Rarity.MYTHIC
-            elif roll <= (RARE_PASS_RATE + self.gene_boost):
-                return choice(rare_tails), Rarity.RARE
-            elif roll <= (UNCOMMON_PASS_RATE + self.gene_boost):
-                return choice(uncommon_tails), Rarity.UNCOMMON
-            elif roll <= (COMMON_PASS_RATE + self.gene_boost):
-                return choice(common_tails), Rarity.COMMON
-            else:
-                return "Domestic", Rarity.DEFAULT
+        if tail_details.family is None:
+            return [(self.ruleset.mythic_pass_rate + self.gene_boost, [tail], Rarity.MYTHIC),
+                    (self.ruleset.rare_pass_rate + self.gene_boost, rare_tails, Rarity.RARE),
+                    (self.ruleset.uncommon_pass_rate + self.gene_boost, uncommon_tails, Rarity.UNCOMMON),
+                    (self.ruleset.common_pass_rate + self.gene_boost, common_tails, Rarity.COMMON)]
 
         # Dealt with skeletal, the rest of the tails now all follow the same pattern - we can inherit a tail which is
         # from the same family as the one we started with and the same or lower rarity.
-        tail_rarity = tails_by_rarity[tail]
+        tail_rarity = tail_details.rarity
 
         # Get the tails of the appropriate family
-        tail_family = None
-        if tail in reptile_tails:
-            tail_family = reptile_tails
-        elif tail in silk_tails:
-            tail_family = silk_tails
-        elif tail in curled_tails:
-            tail_family = curled_tails
-        elif tail in bobbed_tails:
-            tail_family = bobbed_tails
-
-        roll = randint(1,100)
-
-        if (tail_rarity.value >= Rarity.MYTHIC.value) and (roll <= (MYTHIC_PASS_RATE + self.gene_boost)):
-            return tail_family[0], Rarity.MYTHIC
-        if (tail_rarity.value >= Rarity.RARE.value) and (roll <= (RARE_PASS_RATE + self.gene_boost)):
-            return tail_family[1], Rarity.RARE
-        if (tail_rarity.value >= Rarity.UNCOMMON.value) and (roll <= (UNCOMMON_PASS_RATE + self.gene_boost)):
-            return tail_family[2], Rarity.UNCOMMON
-        if (tail_rarity.value >= Rarity.COMMON.value) and (roll <= (COMMON_PASS_RATE + self.gene_boost)):
-            return tail_family[3], Rarity.COMMON
-        return "Domestic", Rarity.DEFAULT
+        tail_family = self.ruleset.tail_families[tail_details.family]
+
+        tail_ladder = []
+        if tail_rarity >= Rarity.MYTHIC:
+            tail_ladder.append((self.ruleset.mythic_pass_rate + self.gene_boost, [tail_family[0]], Rarity.MYTHIC))
+        if tail_rarity >= Rarity.RARE:
+            tail_ladder.append((self.ruleset.rare_pass_rate + self.gene_boost, [tail_family[1]], Rarity.RARE))
+        if tail_rarity >= Rarity.UNCOMMON:
+            tail_ladder.append((self.ruleset.uncommon_pass_rate + self.gene_boost, [tail_family[2]], Rarity.UNCOMMON))
+        if tail_rarity >= Rarity.COMMON:
+            tail_ladder.append((self.ruleset.common_pass_rate + self.gene_boost, [tail_family[3]], Rarity.COMMON))
+        return tail_ladder
 
     def get_chimera(self):
+        if self.compiled_tables:
+            return self.inheritance_tables.chimera.draw(self.rng)
         sirechimera = self.sire.chimera_status
         damchimera = self.dam.chimera_status
         sire_passed, sire_rarity = self.get_passed_chimera(sirechimera)
         dam_passed, dam_rarity = self.get_passed_chimera(damchimera)
 
-        if sire_rarity.value > dam_rarity.value:
+        if sire_rarity > dam_rarity:
             chimera = sire_passed
-        elif dam_rarity.value > sire_rarity.value:
+        elif dam_rarity > sire_rarity:
             chimera = dam_passed
         else:
-            chimera = sire_passed if (randint(1,2) == 1) else dam_passed
+            chimera = sire_passed if (self.rng.randint(1,2) == 1) else dam_passed
 
         return chimera
 
     def get_passed_chimera(self, chimera):
-        roll = randint(1, 100)
-        if chimera == "None":
-            return "None", Rarity.DEFAULT
-        elif chimera == BICOLOUR_CHIMERA:
-            if roll <= (RARE_PASS_RATE + self.gene_boost):
-                return BICOLOUR_CHIMERA, Rarity.RARE
-        elif chimera == FULL_CHIMERA:
-            if roll <= (MYTHIC_PASS_RATE + self.gene_boost):
-                return FULL_CHIMERA, Rarity.MYTHIC
+        roll = self.rng.randint(1, 100)
+        pass_rate, rarity = self.get_chimera_pass_rate(chimera)
+        if roll <= pass_rate:
+            return chimera, rarity
         return "None", Rarity.DEFAULT
 
+    def get_chimera_pass_rate(self, chimera):
+        if chimera == BICOLOUR_CHIMERA:
+            return self.ruleset.rare_pass_rate + self.gene_boost, Rarity.RARE
+        elif chimera == FULL_CHIMERA:
+            return self.ruleset.mythic_pass_rate + self.gene_boost, Rarity.MYTHIC
+        return 0, Rarity.DEFAULT
+
     def get_health(self):
-        health = []
+        """Returns the health code, a bit per condition in health_conditions."""
+        if self.compiled_tables:
+            return self.inheritance_tables.health.draw(self.rng)
+        health = 0
+        ruleset = self.ruleset
 
-        virus_chance = 50
+        virus_chance = ruleset.virus_chance
         virus_reduction = self.modifiers["VirusReduction"]
         if self.modifiers["Bonded"]:
-            virus_reduction += 20
+            virus_reduction += ruleset.bonded_virus_reduction
 
         virus_chance = max(0, virus_chance - virus_reduction)
 
         inbred = self.modifiers["Inbred"]
 
         if inbred:
-            stillborn_chance = 80 + 5*(inbred -1)
-            sterile_chance = 80 + 5*(inbred -1)
-            blind_chance = 80 + 5*(inbred -1)
-            deaf_chance = 80 + 5*(inbred -1)
-            dystonia_chance = 60 + 5*(inbred -1)
-            hemophilia_chance = 60 + 5*(inbred -1)
-
-            if randint(1,100) <= stillborn_chance or randint(1,100) <= virus_chance:
-                health.append("Stillborn")
-            if randint(1,100) <= sterile_chance:
-                health.append("Sterile")
-            if randint(1,100) <= blind_chance:
-                health.append("Blind")
-            if randint(1,100) <= deaf_chance:
-                health.append("Deaf")
-            if randint(1,100) <= dystonia_chance:
-                health.append("Dystonia")
-            if randint(1,100) <= hemophilia_chance:
-                health.append("Hemophilia")
+            stillborn_chance, sterile_chance, blind_chance, deaf_chance, dystonia_chance, hemophilia_chance = [
+                chance + ruleset.inbred_chance_per_ancestor*(inbred -1) for chance in ruleset.inbred_chances]
+
+            if self.rng.randint(1,100) <= stillborn_chance or self.rng.randint(1,100) <= virus_chance:
+                health |= STILLBORN
+            if self.rng.randint(1,100) <= sterile_chance:
+                health |= STERILE
+            if self.rng.randint(1,100) <= blind_chance:
+                health |= BLIND
+            if self.rng.randint(1,100) <= deaf_chance:
+                health |= DEAF
+            if self.rng.randint(1,100) <= dystonia_chance:
+                health |= DYSTONIA
+            if self.rng.randint(1,100) <= hemophilia_chance:
+                health |= HEMOPHILIA
         else:
-            if randint(1,100) <= virus_chance:
-                health.append("Stillborn")
-
-        if not health:
-            health_string = "Healthy"
-        else:
-            health_string = ", ".join(health)
-        return health_string
+            if self.rng.randint(1,100) <= virus_chance:
+                health |= STILLBORN
+        return health
 
     def get_number_cubs(self):
-        cub_rng = randint(1,100)
-        if self.modifiers["SomnisBlessing"]:
-            if cub_rng < 11:
-                num_cubs = 6
-            elif cub_rng < 21:
-                num_cubs = 5
-            elif cub_rng < 31:
-                num_cubs = 4
-            elif cub_rng < 71:
-                num_cubs = 3
-            else:
-                num_cubs = 2
-        else:
-            if cub_rng < 11:
-                num_cubs = 4
-            elif cub_rng < 21:
-                num_cubs = 3
-            elif cub_rng < 61:
-                num_cubs = 2
-            else:
-                num_cubs = 1
+        ruleset = self.ruleset
+        cub_rng = self.rng.randint(1,100)
+        num_cubs = ruleset.litter_size(cub_rng, self.modifiers["SomnisBlessing"])
         if self.modifiers["SpringBlessing"]:
-            num_cubs = randint(3,6)
+            num_cubs = self.rng.randint(*ruleset.spring_litter_range)
         if self.modifiers["Alpha"]:
-            if randint(1,100) < 11:
+            if self.rng.randint(1,100) <= ruleset.extra_pup_chances.get("Alpha", 0):
                 num_cubs += 1
                 self.comments.append("Alpha's Blessing activated. An extra pup has been born!")
         if self.modifiers["Bonded"]:
-            if randint(1,100) < 11:
+            if self.rng.randint(1,100) <= ruleset.extra_pup_chances.get("Bonded", 0):
                 num_cubs += 1
                 self.comments.append("Due to your pair's bond an extra pup has been born!")
         return num_cubs
\ No newline at end of file
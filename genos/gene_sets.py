@@ -0,0 +1,101 @@
+"""Gene sets as integer bitmasks, where bit n is gene code n from genes.gene_codes.
+
+There are only around 60 genes, so a set of them fits in one int, and union, membership, counting and picking out
+a rarity are each a single bit operation. Masks only go back to codes, and codes to names, when a pup is shown.
+"""
+from typing import Dict, Iterable, List, Sequence, Tuple
+
+from .genes import (
+    GLEAM_CODE, GLEAM_FLAG, STARDUST_CODE, Rarity, freecolour_gene_codes, gene_codes, gene_rarity_index,
+)
+
+GeneMask = int
+
+# trim_genes drops the commonest genes first.
+TRIM_ORDER = [Rarity.COMMON, Rarity.UNCOMMON, Rarity.RARE, Rarity.MYTHIC]
+
+
+def gene_bit(code: int) -> GeneMask:
+    """The bit for a gene code, Gleam attached or not."""
+    return 1 << (code & ~GLEAM_FLAG)
+
+
+def gene_mask(codes: Iterable[int]) -> GeneMask:
+    mask = 0
+    for code in codes:
+        mask |= 1 << (code & ~GLEAM_FLAG)
+    return mask
+
+
+def names_mask(names: Iterable[str]) -> GeneMask:
+    return gene_mask(gene_codes.code(name) for name in names)
+
+
+def mask_codes(mask: GeneMask) -> List[int]:
+    """The codes in a mask, lowest first."""
+    codes = []
+    while mask:
+        low = mask & -mask
+        codes.append(low.bit_length() - 1)
+        mask ^= low
+    return codes
+
+
+def mask_names(mask: GeneMask) -> List[str]:
+    """The names in a mask, sorted as Puppy shows them."""
+    return sorted(gene_codes.names[code] for code in mask_codes(mask))
+
+
+def has_duplicates(codes: Sequence[int]) -> bool:
+    return gene_mask(codes).bit_count() < len(codes)
+
+
+# Every gene of each rarity. A gene that isn't in gene_rarity_index is in none of them, so is never trimmed.
+RARITY_MASKS: Dict[Rarity, GeneMask] = {
+    rarity: names_mask(gene for gene, gene_rarity in gene_rarity_index.items() if gene_rarity == rarity)
+    for rarity in TRIM_ORDER
+}
+# Genes Gleam won't attach to
+FREECOLOUR_MASK = gene_mask(freecolour_gene_codes)
+GLEAM_BIT = gene_bit(GLEAM_CODE)
+STARDUST_BIT = gene_bit(STARDUST_CODE)
+
+class DiscoveryIndex:
+    """A ruleset's genetic_discovery_genes as an inverted index, from each parent gene to the rules it's part of.
+
+    Finding a pairing's possible discoveries looks up each of the sire's genes rather than going through every rule,
+    so it costs the same however many rules there are.
+    """
+
+    def __init__(self, genetic_discovery_genes):
+        # (child gene code, rarity) for each rule, in table order
+        self.outcomes: List[Tuple[int, Rarity]] = []
+        # Parent gene code to (the other parent gene's bit, rule number) for every rule it's in, either way round
+        self.partners: Dict[int, List[Tuple[GeneMask, int]]] = {}
+        for rule, ((one, two), (gene, rarity)) in enumerate(genetic_discovery_genes.items()):
+            one_code = gene_codes.code(one)
+            two_code = gene_codes.code(two)
+            self.outcomes.append((gene_codes.code(gene), rarity))
+            self.partners.setdefault(one_code, []).append((gene_bit(two_code), rule))
+            self.partners.setdefault(two_code, []).append((gene_bit(one_code), rule))
+
+    def discoveries(self, sire_mask: GeneMask, dam_mask: GeneMask) -> List[Tuple[int, Rarity]]:
+        """(child gene code, rarity) for every rule with one parent gene in the sire and the other in the dam, in
+        table order, so they're rolled in the order get_genes always has."""
+        # A bit per rule number, there can be hundreds of them.
+        found = 0
+        for code in mask_codes(sire_mask):
+            for partner_bit, rule in self.partners.get(code, ()):
+                if partner_bit & dam_mask:
+                    found |= 1 << rule
+        return [self.outcomes[rule] for rule in mask_codes(found)]
+
+
+_discovery_indexes: Dict[str, DiscoveryIndex] = {}
+
+
+def discovery_index(ruleset) -> DiscoveryIndex:
+    index = _discovery_indexes.get(ruleset.fingerprint)
+    if index is None:
+        index = _discovery_indexes[ruleset.fingerprint] = DiscoveryIndex(ruleset.genetic_discovery_genes)
+    return index
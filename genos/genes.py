@@ -1,7 +1,15 @@
-from enum import Enum
+"""Every trait's options and rarities, and the read-only indexes and integer codes built from them.
+
+The indexes and codes are built here at import, and _check_tables() checks them every time. That's around 2 ms of the
+cold start, well inside benchmarks.COLD_START_BUDGET_SECONDS, so a precomputed snapshot of them isn't worth keeping in
+step with these lists.
+"""
+from enum import IntEnum
 from collections import defaultdict
+from types import MappingProxyType
+from typing import Iterable, Mapping, NamedTuple, Optional, Tuple
 
-class Rarity(Enum):
+class Rarity(IntEnum):
     DEFAULT = 0
     COMMON = 1
     UNCOMMON = 2
@@ -155,6 +163,8 @@ all_mutations = ["Extra Eyes", "Feathers", "Fins", "Gills", "Quills", "Scales"]
 minor_mutations = ["Cheek Pouches", "Heightened Hearing", "Infravision", "Large Whiskers", "Oddly Shaped Tongue", "Poison/Venom Glands", "Raptor Claw", "Secondary Row of Teeth", "Sonar/Echolocation"]
 
 
+health_conditions = ["Stillborn", "Sterile", "Blind", "Deaf", "Dystonia", "Hemophilia"]
+
 FULL_CHIMERA = "Chimera"
 BICOLOUR_CHIMERA = "Bicolor"
 all_chimeras = [BICOLOUR_CHIMERA, FULL_CHIMERA]
@@ -190,4 +200,173 @@ genetic_discovery_genes = {
     ("Sable","Underbelly"): ("Melted", Rarity.UNCOMMON),
     ("Barring","Dapple"): ("Snowstorm", Rarity.RARE),
     ("Washed","Merle"): ("Fog", Rarity.RARE),
-}
\ No newline at end of file
+}
+
+
+# Lookup indexes, so the rollers never have to scan the lists above. Built once and read-only.
+
+class TailDetails(NamedTuple):
+    family: Optional[str]
+    rarity: Rarity
+    # Where the tail sits in its family list, 0 being the mythic end.
+    position: Optional[int]
+
+
+tail_families = MappingProxyType({
+    "Reptile": tuple(reptile_tails),
+    "Silk": tuple(silk_tails),
+    "Curled": tuple(curled_tails),
+    "Bobbed": tuple(bobbed_tails),
+})
+
+
+def _rarity_index(tables, kind):
+    index = {}
+    for rarity, items in tables:
+        for item in items:
+            if item in index and index[item] != rarity:
+                raise ValueError(f"{item} is listed as both a {index[item].name.lower()} and a "
+                                 f"{rarity.name.lower()} {kind}")
+            index[item] = rarity
+    return MappingProxyType(index)
+
+
+def build_tail_index(families) -> Mapping[str, TailDetails]:
+    """Indexes every tail by its rarity and, for tails in one of families, its family and place in it."""
+    index = {}
+    for tail, rarity in tails_by_rarity.items():
+        index[tail] = TailDetails(None, rarity, None)
+    for family_name, family in families.items():
+        for position, tail in enumerate(family):
+            if tail == "None":
+                continue
+            if index.get(tail, TailDetails(None, None, None)).family is not None:
+                raise ValueError(f"{tail} tail is in both the {index[tail].family} and {family_name} families")
+            if tail not in tails_by_rarity:
+                raise ValueError(f"{tail} tail is in the {family_name} family but has no rarity")
+            if tails_by_rarity[tail] != Rarity(Rarity.MYTHIC - position):
+                raise ValueError(f"{tail} tail is in the wrong place for its rarity in the {family_name} family")
+            index[tail] = TailDetails(family_name, tails_by_rarity[tail], position)
+    return MappingProxyType(index)
+
+
+gene_rarity_index = _rarity_index([(Rarity.MYTHIC, all_mythic_genes), (Rarity.RARE, all_rare_genes),
+                                   (Rarity.UNCOMMON, all_uncommon_genes), (Rarity.COMMON, all_common_genes)], "gene")
+horn_rarity_index = _rarity_index([(Rarity.MYTHIC, mythic_horns), (Rarity.RARE, rare_horns),
+                                   (Rarity.UNCOMMON, uncommon_horns), (Rarity.COMMON, common_horns)], "horn")
+base_rarity_index = _rarity_index([(Rarity.RARE, rare_bases), (Rarity.UNCOMMON, uncommon_bases),
+                                   (Rarity.COMMON, common_bases)], "base")
+_rarity_index([(Rarity.MYTHIC, mythic_tails), (Rarity.RARE, rare_tails),
+               (Rarity.UNCOMMON, uncommon_tails), (Rarity.COMMON, common_tails)], "tail")
+tail_index = build_tail_index(tail_families)
+# colour -> (modifier, base, rarity)
+colour_index = MappingProxyType(dict(colours_with_details))
+# (modifier, base) -> the colours it makes
+colour_modifier_base_index = MappingProxyType({key: tuple(colours) for key, colours in colour_modifier_base_lookup.items()})
+vesper_modifier_index = frozenset(all_colour_mods)
+gene_modifier_index = frozenset(all_gene_modifiers)
+
+
+def _check_tables():
+    for colour, (modifier, base, rarity) in colour_index.items():
+        if base not in colour_index:
+            raise ValueError(f"{colour} is based on {base}, which isn't a colour")
+        if (modifier is None) != (rarity == Rarity.COMMON):
+            raise ValueError(f"{colour} should have a modifier if and only if it isn't common")
+    for gene in freecolour_genes:
+        if gene not in gene_rarity_index:
+            raise ValueError(f"Free colour gene {gene} isn't a known gene")
+
+
+_check_tables()
+
+
+# Integer codes for every trait value. Pups hold these rather than strings, which are only built when a pup is shown.
+
+class TraitCodes:
+    """Interned integer codes for one kind of trait.
+
+    Known values get their codes at import, in table order, so a code means the same thing in every process. Anything
+    else is given the next code the first time it's seen. The suffix ("Hook" + " Tail") is only added when shown.
+    """
+
+    def __init__(self, names: Iterable[str], suffix: str = ""):
+        self.suffix = suffix
+        self.names = []
+        self.codes = {}
+        for name in names:
+            self.code(name)
+
+    def code(self, name: str) -> int:
+        code = self.codes.get(name)
+        if code is None:
+            if self.suffix and name.endswith(self.suffix):
+                return self.code(name[:-len(self.suffix)])
+            code = len(self.names)
+            self.names.append(name)
+            self.codes[name] = code
+        return code
+
+    def name(self, code: int) -> str:
+        return self.names[code] + self.suffix
+
+    def __len__(self):
+        return len(self.names)
+
+
+# Set on a gene code when Gleam has attached to it
+GLEAM_FLAG = 1 << 15
+
+
+class GeneCodes(TraitCodes):
+    """Gene codes, where "Mask (Gleam)" is the code for Mask with GLEAM_FLAG set."""
+
+    def code(self, name: str) -> int:
+        if name.endswith(" (Gleam)"):
+            return super().code(name[:-len(" (Gleam)")]) | GLEAM_FLAG
+        return super().code(name)
+
+    def name(self, code: int) -> str:
+        if code & GLEAM_FLAG:
+            return "{} (Gleam)".format(self.names[code & ~GLEAM_FLAG])
+        return self.names[code]
+
+
+class HealthCodes:
+    """Health is a bit per condition in health_conditions, so 0 is Healthy and 3 is "Stillborn, Sterile"."""
+
+    def code(self, name: str) -> int:
+        if name == "Healthy":
+            return 0
+        code = 0
+        for condition in name.split(", "):
+            code |= 1 << health_conditions.index(condition)
+        return code
+
+    def name(self, code: int) -> str:
+        if not code:
+            return "Healthy"
+        return ", ".join(condition for bit, condition in enumerate(health_conditions) if code & (1 << bit))
+
+    def __len__(self):
+        return 1 << len(health_conditions)
+
+
+sex_codes = TraitCodes(["Male", "Female"])
+health_codes = HealthCodes()
+colour_codes = TraitCodes(colours_with_details)
+horn_codes = TraitCodes(["None"] + all_horns)
+tail_codes = TraitCodes(["Domestic"] + all_tails, suffix=" Tail")
+base_codes = TraitCodes(all_bases)
+modifier_codes = TraitCodes(["None"] + all_modifiers)
+subspecies_codes = TraitCodes(["None"] + all_subspecies)
+mutation_codes = TraitCodes(all_mutations, suffix=" Mutation")
+minor_mutation_codes = TraitCodes(["None"] + minor_mutations)
+chimera_codes = TraitCodes(["None"] + all_chimeras)
+gene_codes = GeneCodes(all_genes + [gene for gene, rarity in genetic_discovery_genes.values()])
+MALE = sex_codes.code("Male")
+FEMALE = sex_codes.code("Female")
+GLEAM_CODE = gene_codes.code("Gleam")
+STARDUST_CODE = gene_codes.code("Stardust")
+freecolour_gene_codes = frozenset(gene_codes.code(gene) for gene in freecolour_genes)
+STILLBORN, STERILE, BLIND, DEAF, DYSTONIA, HEMOPHILIA = (1 << bit for bit in range(len(health_conditions)))
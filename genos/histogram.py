@@ -0,0 +1,142 @@
+from array import array
+from math import sqrt
+from typing import Collection, Dict, Iterator, List, NamedTuple, Optional, Tuple
+
+# z for the 95% intervals reported alongside each share.
+CONFIDENCE_Z = 1.96
+
+
+class Share(NamedTuple):
+    value: object
+    count: int
+    # As fractions of the trait's total, with the Wilson score interval around it.
+    share: float
+    low: float
+    high: float
+
+
+class Histogram:
+    """Counts of one integer-coded trait, in an array indexed by code.
+
+    The array starts as big as the trait's code table, so it only grows if a code is added to the table later on.
+    flag is a bit set on some codes (GLEAM_FLAG on genes), and those are counted in a second array. None is counted
+    separately, for pups with none of a trait that can have several. With no codes, values are counted as themselves.
+    """
+    __slots__ = ("codes", "flag", "counts", "flagged", "none")
+
+    def __init__(self, codes=None, flag: int = 0):
+        self.codes = codes
+        self.flag = flag
+        size = len(codes) if codes is not None else 0
+        self.counts = array("q", bytes(8 * size))
+        self.flagged = array("q", bytes(8 * size)) if flag else None
+        self.none = 0
+
+    def add(self, code: Optional[int], count: int = 1):
+        if code is None:
+            self.none += count
+            return
+        counts = self.counts
+        if code & self.flag:
+            counts = self.flagged
+            code &= ~self.flag
+        if code >= len(counts):
+            counts.extend(bytes(8 * (code + 1 - len(counts))))
+        counts[code] += count
+
+    def add_counts(self, counts, codes: Optional[List[int]] = None):
+        """Adds a whole array of counts at once, e.g. a bincount, at the codes given (or at their own index)."""
+        for index, count in enumerate(counts):
+            if count:
+                self.add(codes[index] if codes is not None else index, int(count))
+
+    def merge(self, other: 'Histogram'):
+        if other.codes is self.codes:
+            for counts, other_counts in ((self.counts, other.counts), (self.flagged, other.flagged)):
+                if other_counts is None:
+                    continue
+                if len(other_counts) > len(counts):
+                    counts.extend(bytes(8 * (len(other_counts) - len(counts))))
+                for code, count in enumerate(other_counts):
+                    counts[code] += count
+        else:
+            # From another process, whose code table may have added values in a different order, so go by name.
+            for value, count in other.items():
+                if value is not None:
+                    self.add(self.code(value), count)
+        self.none += other.none
+
+    def code(self, value) -> int:
+        return self.codes.code(value) if self.codes is not None else value
+
+    def name(self, code: int):
+        return self.codes.name(code) if self.codes is not None else code
+
+    def items(self) -> Iterator[Tuple[object, int]]:
+        """(value, count) for every value counted at least once, None last."""
+        for counts, flag in ((self.counts, 0), (self.flagged, self.flag)):
+            if counts is None:
+                continue
+            for code, count in enumerate(counts):
+                if count:
+                    yield self.name(code | flag), count
+        if self.none:
+            yield None, self.none
+
+    @property
+    def total(self) -> int:
+        return sum(self.counts) + (sum(self.flagged) if self.flagged is not None else 0) + self.none
+
+
+class TraitAccumulator:
+    """Streaming counts of several coded traits, which can be merged with counts from other runs or processes.
+
+    Memory is a fixed array per trait whatever the number counted. Traits in multi can have several values per item
+    (genes) or none, so their shares are out of the items counted rather than out of their own total.
+    """
+
+    def __init__(self, traits: Dict[str, object], multi: Collection[str] = (), flags: Optional[Dict[str, int]] = None):
+        flags = flags or {}
+        self.histograms = {trait: Histogram(codes, flags.get(trait, 0)) for trait, codes in traits.items()}
+        self.multi = frozenset(multi)
+        self.items = 0
+
+    def __getitem__(self, trait: str) -> Histogram:
+        return self.histograms[trait]
+
+    def merge(self, other: 'TraitAccumulator') -> 'TraitAccumulator':
+        for trait, histogram in other.histograms.items():
+            if trait not in self.histograms:
+                self.histograms[trait] = Histogram(histogram.codes, histogram.flag)
+            self.histograms[trait].merge(histogram)
+        self.multi |= other.multi
+        self.items += other.items
+        return self
+
+    def total(self, trait: str) -> int:
+        return self.items if trait in self.multi else self.histograms[trait].total
+
+    def shares(self, trait: str, z: float = CONFIDENCE_Z) -> List[Share]:
+        """Every value counted for the trait, most common first, with its share and confidence interval."""
+        total = self.total(trait)
+        shares = [Share(value, count, *wilson_interval(count, total, z))
+                  for value, count in self.histograms[trait].items()]
+        shares.sort(key=lambda share: share.count, reverse=True)
+        return shares
+
+    def report(self, z: float = CONFIDENCE_Z) -> Dict[str, List[Share]]:
+        return {trait: self.shares(trait, z) for trait in self.histograms}
+
+
+def wilson_interval(count: int, total: int, z: float = CONFIDENCE_Z) -> Tuple[float, float, float]:
+    """(share, low, high) for count out of total. Stays inside 0 to 1 and sensible for rare outcomes, unlike the
+    normal approximation."""
+    if not total:
+        return 0.0, 0.0, 0.0
+    share = count / total
+    # A trait that can show up more than once per item (a gene in both chimera halves) can go past 1.
+    bounded = min(share, 1.0)
+    denominator = 1 + z * z / total
+    centre = (bounded + z * z / (2 * total)) / denominator
+    margin = z * sqrt(bounded * (1 - bounded) / total + z * z / (4 * total * total)) / denominator
+    return share, max(0.0, centre - margin), min(1.0, centre + margin)
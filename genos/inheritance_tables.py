@@ -0,0 +1,107 @@
+from collections import OrderedDict
+from threading import Lock
+from typing import Callable, Dict, Hashable
+
+from .breeding_distributions import BreedingDistributions
+from .genes import all_chimeras, health_codes
+
+# Compiled tables kept across rollers. Each one is only a few outcomes, so this is plenty for a busy season.
+TABLE_CACHE_SIZE = 4096
+
+_table_cache: "OrderedDict[Hashable, AliasTable]" = OrderedDict()
+_table_cache_lock = Lock()
+
+
+class AliasTable:
+    """Draws from a fixed set of outcomes in O(1), with Vose's alias method."""
+    __slots__ = ("values", "probabilities", "aliases", "size")
+
+    def __init__(self, distribution: Dict):
+        values = [value for value, probability in distribution.items() if probability > 0]
+        total = sum(distribution[value] for value in values)
+        size = len(values)
+        scaled = [distribution[value] * size / total for value in values]
+        probabilities = [1.0] * size
+        aliases = list(values)
+
+        small = [index for index, probability in enumerate(scaled) if probability < 1]
+        large = [index for index, probability in enumerate(scaled) if probability >= 1]
+        while small and large:
+            less = small.pop()
+            more = large.pop()
+            probabilities[less] = scaled[less]
+            aliases[less] = values[more]
+            scaled[more] += scaled[less] - 1
+            if scaled[more] < 1:
+                small.append(more)
+            else:
+                large.append(more)
+
+        self.values = values
+        self.probabilities = probabilities
+        self.aliases = aliases
+        self.size = size
+
+    def draw(self, rng):
+        if self.size == 1:
+            return self.values[0]
+        # One uniform picks the column and decides between it and its alias.
+        column = rng.random() * self.size
+        index = int(column)
+        if column - index < self.probabilities[index]:
+            return self.values[index]
+        return self.aliases[index]
+
+
+class InheritanceTables:
+    """The outcome of each single-roll inheritance step for one BreedingRoller, compiled into alias tables.
+
+    The tables come from the exact distributions in BreedingDistributions, and are cached by just the parent traits,
+    gene_boost, modifiers and ruleset each step depends on, so rollers that share a parent's tail share its tail table.
+    """
+
+    def __init__(self, roller):
+        distributions = BreedingDistributions(roller)
+        sire = roller.sire
+        dam = roller.dam
+        modifiers = roller.modifiers
+        self.gene_boost = gene_boost = roller.gene_boost
+        self.ruleset = roller.ruleset
+        rules = roller.ruleset.fingerprint
+
+        self.tail = get_table(("tail", rules, sire.tail, dam.tail, gene_boost), distributions.tail)
+        self.horns = get_table(("horns", rules, sire.horns, dam.horns, gene_boost), distributions.horns)
+        self.modifier = get_table(("modifier", rules, sire.modifier, dam.modifier, gene_boost),
+                                  distributions.modifier)
+        # get_puppy still applies the pygmy fix, so this is the base before it.
+        self.base = get_table(("base", rules, sire.base, dam.base, gene_boost),
+                              lambda: distributions.base_given_subspecies("None"))
+        self.chimera = get_table(("chimera", rules, sire.chimera_status, dam.chimera_status, gene_boost),
+                                 distributions.chimera)
+        self.colour = get_table(("colour", rules, colour_inputs(sire), colour_inputs(dam), gene_boost),
+                                distributions.colour)
+        self.health = get_table(("health", rules, modifiers["VirusReduction"], modifiers["Bonded"],
+                                 modifiers["Inbred"]),
+                                lambda: {health_codes.code(health): probability
+                                         for health, probability in distributions.health().items()})
+
+
+def colour_inputs(vesper) -> tuple:
+    if vesper.chimera_status in all_chimeras:
+        return vesper.colour, vesper.chimera_colour
+    return vesper.colour,
+
+
+def get_table(key: Hashable, distribution: Callable[[], Dict]) -> AliasTable:
+    with _table_cache_lock:
+        table = _table_cache.get(key)
+        if table is not None:
+            _table_cache.move_to_end(key)
+            return table
+
+    table = AliasTable(distribution())
+    with _table_cache_lock:
+        _table_cache[key] = table
+        if len(_table_cache) > TABLE_CACHE_SIZE:
+            _table_cache.popitem(last=False)
+    return table
@@ -0,0 +1,112 @@
+from collections import defaultdict
+from functools import wraps
+from time import perf_counter
+from typing import Callable, Dict, Optional
+
+# BreedingRoller methods that get timed. Times are inclusive, so get_genes includes the trim_genes inside it.
+INSTRUMENTED_STEPS = [
+    "get_number_cubs",
+    "get_puppy",
+    "get_health",
+    "get_chimera",
+    "get_colour",
+    "get_genes",
+    "trim_genes",
+    "get_horns",
+    "get_tail",
+    "get_modifier",
+    "get_base",
+    "get_species",
+    "get_major_mutations",
+    "get_minor_mutation",
+    "perform_test",
+    "perform_exact_test",
+]
+
+
+class RollStats:
+    """What an instrumented BreedingRoller spent its time on. One RollStats can be shared by several rollers."""
+
+    def __init__(self):
+        self.step_seconds: Dict[str, float] = defaultdict(float)
+        self.step_calls: Dict[str, int] = defaultdict(int)
+        self.pups = 0
+        self.rng_draws = 0
+
+    @property
+    def draws_per_pup(self) -> float:
+        return self.rng_draws / self.pups if self.pups else 0.0
+
+    def as_dict(self) -> Dict:
+        return {
+            "steps": {step: {"calls": self.step_calls[step], "seconds": self.step_seconds[step]}
+                      for step in self.step_calls},
+            "pups": self.pups,
+            "rng_draws": self.rng_draws,
+            "draws_per_pup": self.draws_per_pup,
+        }
+
+
+class CountingRandom:
+    """Wraps a RollRandom and counts the draws made through it into a RollStats."""
+
+    def __init__(self, rng, stats: RollStats):
+        self.rng = rng
+        self.stats = stats
+
+    def randint(self, low: int, high: int) -> int:
+        self.stats.rng_draws += 1
+        return self.rng.randint(low, high)
+
+    def random(self) -> float:
+        self.stats.rng_draws += 1
+        return self.rng.random()
+
+    def choice(self, items):
+        self.stats.rng_draws += 1
+        return self.rng.choice(items)
+
+    def shuffle(self, items):
+        self.stats.rng_draws += 1
+        self.rng.shuffle(items)
+
+    def spawn(self, index: int) -> "CountingRandom":
+        return CountingRandom(self.rng.spawn(index), self.stats)
+
+    def __getattr__(self, name):
+        # seed, getrandbits and so on come straight from the wrapped stream.
+        return getattr(self.rng, name)
+
+
+def instrument(roller, stats: RollStats, hook: Optional[Callable[[str, float], None]] = None):
+    """Times every step in INSTRUMENTED_STEPS on this roller, and counts its RNG draws and pups, into stats.
+
+    The timed steps are set on the roller instance, so an uninstrumented roller runs the plain methods untouched.
+    hook, if given, is called with (step, seconds) after every timed call - e.g. to feed a metrics exporter.
+    """
+    roller.rng = CountingRandom(roller.rng, stats)
+    for step in INSTRUMENTED_STEPS:
+        setattr(roller, step, _timed(getattr(roller, step), step, stats, hook))
+
+    get_puppy = roller.get_puppy
+
+    @wraps(get_puppy)
+    def counted_get_puppy(*args, **kwargs):
+        stats.pups += 1
+        return get_puppy(*args, **kwargs)
+    roller.get_puppy = counted_get_puppy
+
+
+def _timed(method, step: str, stats: RollStats, hook):
+    @wraps(method)
+    def timed(*args, **kwargs):
+        start = perf_counter()
+        try:
+            return method(*args, **kwargs)
+        finally:
+            seconds = perf_counter() - start
+            stats.step_seconds[step] += seconds
+            stats.step_calls[step] += 1
+            if hook is not None:
+                hook(step, seconds)
+    return timed
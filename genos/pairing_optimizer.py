@@ -0,0 +1,234 @@
+import heapq
+from collections import defaultdict
+from typing import Callable, Dict, Iterable, List, NamedTuple, Tuple
+
+from .breeding_distributions import BreedingDistributions
+from .breeding_logic import BreedingRoller, BreedingVesper
+from .genes import FULL_CHIMERA
+from .ruleset import Ruleset, get_active_ruleset
+from .trait_query import check_value
+
+# Traits whose outcome is decided by one roll that nothing else in get_puppy looks at, and the parent fields it uses.
+INDEPENDENT_TRAITS = {
+    "Health": (),
+    "Sex": (),
+    "Base colours": ("colour", "chimera_status", "chimera_colour"),
+    "Horns": ("horns",),
+    "Tails": ("tail",),
+    "Modifier": ("modifier",),
+    "Major Mutations": ("mutation",),
+    "Minor Mutations": (),
+}
+# Chimera status decides how many genes are rolled, and subspecies can change the coat type, so those are joint.
+TARGET_TRAITS = list(INDEPENDENT_TRAITS) + ["Chimera", "Genes", "Subspecies", "Coat Type"]
+# The trait_query field each trait's values are written like.
+TARGET_FIELDS = {
+    "Health": "health", "Sex": "sex", "Base colours": "colour", "Horns": "horns", "Tails": "tail",
+    "Modifier": "modifier", "Major Mutations": "major_mutations", "Minor Mutations": "minor_mutation",
+    "Chimera": "chimera_status", "Genes": "genes", "Subspecies": "subspecies", "Coat Type": "base",
+}
+
+
+class PairingScore(NamedTuple):
+    probability: float
+    sire: BreedingVesper
+    dam: BreedingVesper
+    modifiers: Dict
+
+
+class TraitTarget:
+    """The pup outcome to optimise for, as the values that count for each perform_test trait.
+
+    e.g. TraitTarget({"Coat Type": ["Maned"], "Genes": ["Stardust"]}) is a Maned pup showing Stardust. Every trait
+    has to match. Genes and Major Mutations take a single value each, which counts if the pup has it at all, Gleam
+    or not. Values are written as they are on a pup, e.g. "Skeletal Tail", and "None" is no major mutation.
+    """
+
+    def __init__(self, conditions: Dict[str, Iterable[str]], ruleset: Ruleset = None):
+        ruleset = ruleset if ruleset is not None else get_active_ruleset()
+        discoveries = [gene for gene, _ in ruleset.genetic_discovery_genes.values()]
+        self.conditions = {}
+        for trait, values in conditions.items():
+            if trait not in TARGET_TRAITS:
+                raise ValueError(f"Can't target {trait}, pick from {', '.join(TARGET_TRAITS)}")
+            values = tuple(values)
+            if trait in ["Genes", "Major Mutations"] and len(values) != 1:
+                raise ValueError(f"{trait} targets take exactly one value")
+            # A value no pup can have would just score every pairing 0.
+            for value in values:
+                if not (trait == "Major Mutations" and value == "None"):
+                    check_value(TARGET_FIELDS[trait], value, discoveries)
+            self.conditions[trait] = values
+
+
+class PairingOptimizer:
+    """Ranks every sire/dam pairing, under each choice of modifiers, by the chance a pup hits a target.
+
+    Probabilities are exact, from BreedingDistributions. Results that only depend on some of a pairing's traits are
+    cached, so pairings sharing a parent's tail or a gene pool don't work them out again, and pairings that can't beat
+    the current top K on their genes' pass chances alone never get the full gene calculation.
+    """
+
+    def __init__(self, target: TraitTarget, password_valid=False, ruleset: Ruleset = None):
+        self.target = target
+        self.password_valid = password_valid
+        # Fixed for the optimizer's lifetime, as its caches are only right for one set of rules.
+        self.ruleset = ruleset if ruleset is not None else get_active_ruleset()
+        self._trait_cache: Dict[tuple, float] = {}
+        self._gene_cache: Dict[tuple, float] = {}
+
+    def best_pairings(self, sires: List[BreedingVesper], dams: List[BreedingVesper], modifier_options: List[Dict],
+                      top: int = 10) -> List[PairingScore]:
+        candidates = []
+        for sire in sires:
+            for dam in dams:
+                for modifiers in modifier_options:
+                    roller = self.get_roller(sire, dam, modifiers)
+                    probability, gene_bound = self.score_without_genes(roller)
+                    if probability * gene_bound > 0:
+                        candidates.append((probability * gene_bound, probability, roller))
+
+        # Best upper bound first, stopping once nothing left can beat the top K we already have.
+        candidates.sort(key=lambda candidate: candidate[0], reverse=True)
+        best: List[Tuple[float, int, BreedingRoller]] = []
+        for number, (bound, probability, roller) in enumerate(candidates):
+            if len(best) == top and bound <= best[0][0]:
+                break
+            if "Genes" in self.target.conditions:
+                probability *= self.get_gene_chance(roller)
+            if len(best) < top:
+                heapq.heappush(best, (probability, -number, roller))
+            elif probability > best[0][0]:
+                heapq.heapreplace(best, (probability, -number, roller))
+
+        return [PairingScore(probability, roller.sire, roller.dam, roller.modifiers)
+                for probability, _, roller in sorted(best, key=lambda result: (-result[0], -result[1]))]
+
+    def get_roller(self, sire: BreedingVesper, dam: BreedingVesper, modifiers: Dict) -> BreedingRoller:
+        roller = BreedingRoller([sire, dam], modifiers, password_valid=self.password_valid, ruleset=self.ruleset)
+        roller.gene_boost = roller.get_gene_boost()
+        return roller
+
+    def score_without_genes(self, roller: BreedingRoller) -> Tuple[float, float]:
+        """(The chance of every condition but the genes one, an upper bound on the genes one given those)."""
+        conditions = self.target.conditions
+        probability = 1.0
+        for trait, fields in INDEPENDENT_TRAITS.items():
+            if trait in conditions:
+                probability *= self._cached(("trait", trait, self._inputs(roller, fields)),
+                                            lambda: self._trait_chance(roller, trait))
+                if not probability:
+                    return 0.0, 0.0
+
+        if "Subspecies" in conditions or "Coat Type" in conditions:
+            probability *= self._cached(("trait", "Coat Type", self._inputs(roller, ("base", "subspecies"))),
+                                        lambda: self._coat_chance(roller))
+
+        if "Genes" not in conditions:
+            if "Chimera" in conditions:
+                probability *= self._cached(("trait", "Chimera", self._inputs(roller, ("chimera_status",))),
+                                            lambda: self._trait_chance(roller, "Chimera"))
+            return probability, 1.0
+
+        # Ignoring trimming, a gene shows up whenever it passes.
+        gene = conditions["Genes"][0]
+        passed = self._gene_pass_chance(roller, gene)
+        bound = 0.0
+        for chimera, p_chimera in self._chimera_chances(roller).items():
+            bound += p_chimera * (1 - (1 - passed) ** 2 if chimera == FULL_CHIMERA else passed)
+        return probability, bound
+
+    def get_gene_chance(self, roller: BreedingRoller) -> float:
+        """The exact chance the target gene shows on a pup, across every chimera status the target allows."""
+        gene = self.target.conditions["Genes"][0]
+        distributions = BreedingDistributions(roller)
+        gene_chances = self._gene_chances(distributions)
+        probability = 0.0
+        for chimera, p_chimera in self._chimera_chances(roller).items():
+            if chimera == FULL_CHIMERA:
+                # Two separate calls of up to 5 genes
+                present = self._gene_present(gene_chances, 5, gene, distributions)
+                probability += p_chimera * (1 - (1 - present) ** 2)
+            else:
+                probability += p_chimera * self._gene_present(gene_chances, 10, gene, distributions)
+        return probability
+
+    def _cached(self, key, work: Callable[[], float]) -> float:
+        if key not in self._trait_cache:
+            self._trait_cache[key] = work()
+        return self._trait_cache[key]
+
+    def _inputs(self, roller: BreedingRoller, fields) -> tuple:
+        return (tuple(getattr(roller.sire, field) for field in fields),
+                tuple(getattr(roller.dam, field) for field in fields),
+                tuple(sorted(roller.modifiers.items())), roller.gene_boost)
+
+    def _trait_chance(self, roller: BreedingRoller, trait: str) -> float:
+        distributions = BreedingDistributions(roller)
+        trait_distributions = {
+            "Health": distributions.health,
+            "Sex": distributions.sex_before_boosters,
+            "Base colours": distributions.colour,
+            "Horns": distributions.horns,
+            "Tails": lambda: {f"{tail} Tail": p for tail, p in distributions.tail().items()},
+            "Modifier": distributions.modifier,
+            "Major Mutations": distributions.major_mutations,
+            "Minor Mutations": distributions.minor_mutation,
+            "Chimera": distributions.chimera,
+        }
+        distribution = trait_distributions[trait]()
+        return sum(distribution.get(value, 0) for value in self.target.conditions[trait])
+
+    def _coat_chance(self, roller: BreedingRoller) -> float:
+        distributions = BreedingDistributions(roller)
+        wanted_subspecies = self.target.conditions.get("Subspecies")
+        wanted_bases = self.target.conditions.get("Coat Type")
+        probability = 0.0
+        for subspecies, p_subspecies in distributions.subspecies().items():
+            if wanted_subspecies is not None and subspecies not in wanted_subspecies:
+                continue
+            if wanted_bases is None:
+                probability += p_subspecies
+                continue
+            bases = distributions.base_given_subspecies(subspecies)
+            probability += p_subspecies * sum(bases.get(base, 0) for base in wanted_bases)
+        return probability
+
+    def _chimera_chances(self, roller: BreedingRoller) -> Dict[str, float]:
+        distribution = self._cached(("chimera", self._inputs(roller, ("chimera_status",))),
+                                    lambda: BreedingDistributions(roller).chimera())
+        wanted = self.target.conditions.get("Chimera")
+        return {chimera: p for chimera, p in distribution.items() if wanted is None or chimera in wanted}
+
+    def _gene_pass_chance(self, roller: BreedingRoller, gene: str) -> float:
+        missed = 1.0
+        for source, pass_chance in BreedingDistributions(roller).gene_sources():
+            if source == gene:
+                missed *= 1 - pass_chance
+        return 1 - missed
+
+    def _gene_chances(self, distributions: BreedingDistributions) -> Dict[str, float]:
+        gene_chances = defaultdict(float)
+        for gene, pass_chance in distributions.gene_sources():
+            gene_chances[gene] = 1 - (1 - gene_chances[gene]) * (1 - pass_chance)
+        return gene_chances
+
+    def _gene_present(self, gene_chances: Dict[str, float], max_genes: int, gene: str,
+                      distributions: BreedingDistributions) -> float:
+        # Nothing gets trimmed if every possible gene fits, so the gene shows whenever it passes.
+        if len(gene_chances) <= max_genes:
+            return gene_chances.get(gene, 0.0)
+
+        key = (tuple(sorted(gene_chances.items())), max_genes, gene)
+        if key not in self._gene_cache:
+            expected = distributions.genes(max_genes).expected
+            self._gene_cache[key] = sum(probability for shown, probability in expected.items()
+                                        if gene_shown(gene, shown))
+        return self._gene_cache[key]
+
+
+def gene_shown(gene: str, shown: str) -> bool:
+    """Whether a gene string from get_genes counts as the pup having this gene - plain, with Gleam, or as Gleam."""
+    if shown == gene or shown == f"{gene} (Gleam)":
+        return True
+    return gene == "Gleam" and shown.endswith(" (Gleam)")
@@ -0,0 +1,70 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Optional
+
+from .histogram import TraitAccumulator
+from .rng import RollRandom
+
+# Test pups rolled per job. The split doesn't depend on the worker count, so neither do a seeded roller's totals.
+JOB_ITERATIONS = 10000
+
+# Kept between tests, so pressing test again doesn't wait for a new set of processes to start.
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_workers = 0
+
+
+def run_parallel_test(roller, iterations: int, workers: Optional[int] = None) -> TraitAccumulator:
+    """Splits a roller's test pups across a process pool and merges the accumulators each worker sends back.
+
+    Each job gets its own RNG stream spawned from the roller's, so a seeded roller gives the same totals every run,
+    whatever the worker count. One worker rolls the jobs in this process.
+    """
+    if workers is None:
+        workers = os.cpu_count() or 1
+
+    jobs = []
+    for job, job_iterations in enumerate(split_iterations(iterations, max(1, -(-iterations // JOB_ITERATIONS)))):
+        jobs.append((roller.sire, roller.dam, roller.modifiers, roller.genetic_discovery, roller.gene_boost,
+                     roller.all_male, roller.all_female, roller.rng.spawn(job).seed, job_iterations,
+                     roller.ruleset))
+    workers = max(1, min(workers, len(jobs)))
+
+    pool_map = map if workers == 1 else get_pool(workers).map
+    accumulator = None
+    for job_accumulator in pool_map(roll_test_accumulator, jobs):
+        accumulator = job_accumulator if accumulator is None else accumulator.merge(job_accumulator)
+    return accumulator
+
+
+def get_pool(workers: int) -> ProcessPoolExecutor:
+    """The shared pool, started again if it was started with a different number of workers."""
+    global _pool, _pool_workers
+    if _pool is None or _pool_workers != workers:
+        shutdown_pool()
+        _pool = ProcessPoolExecutor(max_workers=workers)
+        _pool_workers = workers
+    return _pool
+
+
+def shutdown_pool():
+    global _pool
+    if _pool is not None:
+        _pool.shutdown()
+        _pool = None
+
+
+def split_iterations(iterations: int, parts: int) -> List[int]:
+    share, extra = divmod(iterations, parts)
+    return [share + 1 if part < extra else share for part in range(parts)]
+
+
+def roll_test_accumulator(job) -> TraitAccumulator:
+    # Runs in the worker process, so the roller is rebuilt from its picklable parts.
+    from .breeding_logic import BreedingRoller
+    sire, dam, modifiers, genetic_discovery, gene_boost, all_male, all_female, seed, iterations, ruleset = job
+    roller = BreedingRoller([sire, dam], modifiers, password_valid=genetic_discovery, is_test=True,
+                            rng=RollRandom(seed), ruleset=ruleset)
+    roller.gene_boost = gene_boost
+    roller.all_male = all_male
+    roller.all_female = all_female
+    return roller.roll_test_accumulator(iterations)
@@ -0,0 +1,288 @@
+"""Simulates a breeding line over several generations, and reports how common each trait is in every generation.
+
+Each generation's pups are rolled with BreedingRoller, kept as the coded Puppy objects it rolls, and counted by code.
+Only the pups picked to breed are turned back into BreedingVespers, so a generation of thousands never builds the
+display strings and dictionaries a litter shown on the site does.
+"""
+import argparse
+import json
+import sys
+from typing import Dict, Iterator, List, NamedTuple, Optional, Sequence, Tuple
+
+from .batch import DEFAULT_MODIFIERS, GENE_FIELDS, load_roster
+from .breeding_logic import (
+    BASE, CHIMERA_COLOUR, CHIMERA_STATUS, COLOUR, HEALTH, HORNS, MODIFIER, SEX, SUBSPECIES, TAIL, BreedingRoller,
+    BreedingVesper, Puppy, count_puppies,
+)
+from .genes import (
+    GLEAM_CODE, GLEAM_FLAG, MALE, STERILE, STILLBORN, base_codes, chimera_codes, colour_codes, gene_codes, horn_codes,
+    modifier_codes, mutation_codes, subspecies_codes, tail_codes,
+)
+from .pairing_optimizer import TraitTarget
+from .rng import RollRandom
+from .ruleset import Ruleset, get_active_ruleset, load_ruleset
+
+# Pups kept in each generation, after the last litter is trimmed to fit.
+POPULATION_SIZE = 1000
+# Stillborn and sterile pups never breed.
+CANT_BREED = STILLBORN | STERILE
+
+# The BreedingVesper field each TraitTarget trait is read from. Health, sex and minor mutations aren't passed on.
+TARGET_FIELDS = {
+    "Base colours": "colour",
+    "Horns": "horns",
+    "Tails": "tail",
+    "Coat Type": "base",
+    "Modifier": "modifier",
+    "Subspecies": "subspecies",
+    "Major Mutations": "mutation",
+    "Chimera": "chimera_status",
+    "Genes": "genes",
+}
+
+# Fields whose target values have a suffix the BreedingVesper doesn't, "Skeletal Tail" for a "Skeletal" tail.
+SUFFIXED_FIELDS = {"tail": tail_codes, "mutation": mutation_codes}
+
+ParentPairs = Iterator[Tuple[BreedingVesper, BreedingVesper]]
+
+
+class GenerationReport(NamedTuple):
+    generation: int
+    pups: int
+    litters: int
+    # How many of the pups can breed, so how many the next generation's parents are picked from.
+    breeding_sires: int
+    breeding_dams: int
+    # The share of pups with each value of each perform_test trait. Genes and Major Mutations are per pup, so a
+    # trait's shares can add up to more than 1.
+    frequencies: Dict[str, Dict[str, float]]
+
+
+class RandomMating:
+    """Every pairing is a sire and a dam picked at random from everyone who can breed."""
+
+    def __call__(self, sires: List[BreedingVesper], dams: List[BreedingVesper], rng: RollRandom) -> ParentPairs:
+        while True:
+            yield rng.choice(sires), rng.choice(dams)
+
+
+class TargetSelection:
+    """Only the sires and dams closest to a TraitTarget breed, paired at random.
+
+    Parents are ranked by how many of the target's conditions they meet, and the top keep fraction of each sex is
+    kept, ties going to whichever was born first.
+    """
+
+    def __init__(self, target: TraitTarget, keep: float = 0.5):
+        for trait in target.conditions:
+            if trait not in TARGET_FIELDS:
+                raise ValueError(f"{trait} isn't passed on, so can't be selected for")
+        if not 0 < keep <= 1:
+            raise ValueError("keep should be more than 0 and at most 1")
+        self.target = target
+        self.keep = keep
+        # The values to look for in each BreedingVesper field
+        self.wanted = {}
+        for trait, values in target.conditions.items():
+            field = TARGET_FIELDS[trait]
+            codes = SUFFIXED_FIELDS.get(field)
+            self.wanted[field] = frozenset(values if codes is None else
+                                           (codes.names[codes.code(value)] for value in values))
+
+    def __call__(self, sires: List[BreedingVesper], dams: List[BreedingVesper], rng: RollRandom) -> ParentPairs:
+        return RandomMating()(self.best(sires), self.best(dams), rng)
+
+    def best(self, vespers: List[BreedingVesper]) -> List[BreedingVesper]:
+        kept = max(1, int(len(vespers) * self.keep))
+        return sorted(vespers, key=self.score, reverse=True)[:kept]
+
+    def score(self, vesper: BreedingVesper) -> int:
+        score = 0
+        for field, values in self.wanted.items():
+            if field == "genes":
+                score += not values.isdisjoint(vesper.genes)
+            else:
+                score += getattr(vesper, field) in values
+        return score
+
+
+def puppy_to_vesper(pup: Puppy) -> BreedingVesper:
+    """The pup as a parent. A vesper only carries one major mutation, so a pup with more passes on the first.
+
+    Values are the names the breeding form uses, so no " Tail" or " Mutation", and a gene Gleam attached to is
+    passed on as the plain gene plus Gleam itself, the way the form has it entered. The form takes ten genes, so a
+    full chimera whose two sides and Gleam come to more loses the last of its second side's genes.
+    """
+    traits = pup.traits
+    major_mutations = pup.major_mutation_codes
+    # A full chimera's two sides can share a gene, which it only carries once.
+    codes = pup.gene_codes + pup.chimera_gene_codes
+    genes = list(dict.fromkeys(code & ~GLEAM_FLAG for code in codes))
+    if GLEAM_CODE in genes or any(code & GLEAM_FLAG for code in codes):
+        genes = [code for code in genes if code != GLEAM_CODE][:len(GENE_FIELDS) - 1] + [GLEAM_CODE]
+    del genes[len(GENE_FIELDS):]
+    return BreedingVesper(name="sire" if traits[SEX] == MALE else "dam",
+                          colour=colour_codes.names[traits[COLOUR]],
+                          horns=horn_codes.names[traits[HORNS]],
+                          tail=tail_codes.names[traits[TAIL]],
+                          base=base_codes.names[traits[BASE]],
+                          modifier=modifier_codes.names[traits[MODIFIER]],
+                          subspecies=subspecies_codes.names[traits[SUBSPECIES]],
+                          mutation=mutation_codes.names[major_mutations[0]] if major_mutations else "None",
+                          chimera_status=chimera_codes.names[traits[CHIMERA_STATUS]],
+                          chimera_colour=colour_codes.names[traits[CHIMERA_COLOUR]],
+                          genes=[gene_codes.names[code] for code in genes])
+
+
+class PopulationSimulator:
+    """Breeds a population forward a generation at a time, each generation's parents picked from the last's pups.
+
+    Every litter uses the same modifiers. The ruleset is fixed when the simulator is made, so a reload can't change
+    the rules part way through a line.
+    """
+
+    def __init__(self, policy=None, size: int = POPULATION_SIZE, modifiers: Optional[Dict] = None,
+                 password_valid=False, ruleset: Ruleset = None):
+        self.policy = policy if policy is not None else RandomMating()
+        self.size = size
+        self.modifiers = dict(DEFAULT_MODIFIERS, **(modifiers or {}))
+        self.password_valid = password_valid
+        self.ruleset = ruleset if ruleset is not None else get_active_ruleset()
+
+    def run(self, sires: Sequence[BreedingVesper], dams: Sequence[BreedingVesper], generations: int,
+            rng: RollRandom = None) -> List[GenerationReport]:
+        """Breeds generations generations from the founders, stopping early if either sex dies out."""
+        rng = rng if rng is not None else RollRandom()
+        sires = list(sires)
+        dams = list(dams)
+        for vesper in sires + dams:
+            if len(set(vesper.genes)) < len(vesper.genes):
+                raise ValueError(f"The same gene has been entered more than once for {vesper.name}")
+
+        reports = []
+        for generation in range(1, generations + 1):
+            if not sires or not dams:
+                break
+            pups, litters = self.breed(sires, dams, rng)
+            sires, dams = breeding_parents(pups)
+            reports.append(GenerationReport(generation, len(pups), litters, len(sires), len(dams),
+                                            frequencies(pups)))
+        return reports
+
+    def breed(self, sires: List[BreedingVesper], dams: List[BreedingVesper], rng: RollRandom) -> Tuple[List[Puppy], int]:
+        pairs = self.policy(sires, dams, rng)
+        pups = []
+        litters = 0
+        while len(pups) < self.size:
+            sire, dam = next(pairs)
+            roller = BreedingRoller([sire, dam], self.modifiers, password_valid=self.password_valid, rng=rng,
+                                    ruleset=self.ruleset)
+            pups.extend(roller.roll_litter())
+            litters += 1
+        del pups[self.size:]
+        return pups, litters
+
+
+def breeding_parents(pups: List[Puppy]) -> Tuple[List[BreedingVesper], List[BreedingVesper]]:
+    sires = []
+    dams = []
+    for pup in pups:
+        traits = pup.traits
+        if traits[HEALTH] & CANT_BREED:
+            continue
+        (sires if traits[SEX] == MALE else dams).append(puppy_to_vesper(pup))
+    return sires, dams
+
+
+def frequencies(pups: List[Puppy]) -> Dict[str, Dict[str, float]]:
+    total = len(pups)
+    accumulator = count_puppies(pups)
+    return {trait: {"None" if share.value is None else str(share.value): share.count / total
+                    for share in accumulator.shares(trait)}
+            for trait in accumulator.histograms if trait != "Number of pups"}
+
+
+def simulate(job) -> List[GenerationReport]:
+    simulator, sires, dams, generations, seed = job
+    return simulator.run(sires, dams, generations, RollRandom(seed))
+
+
+def run_replicates(simulator: PopulationSimulator, sires: Sequence[BreedingVesper], dams: Sequence[BreedingVesper],
+                   generations: int, replicates: int, seed: Optional[int] = None,
+                   workers: int = 1) -> List[List[GenerationReport]]:
+    """Runs the simulation replicates times, each on its own RNG stream, so a seed gives the same runs whatever the
+    worker count."""
+    rng = RollRandom(seed)
+    jobs = [(simulator, list(sires), list(dams), generations, rng.spawn(number).seed) for number in range(replicates)]
+    if workers == 1:
+        return list(map(simulate, jobs))
+
+    from concurrent.futures import ProcessPoolExecutor
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(simulate, jobs))
+
+
+def mean_frequencies(replicates: List[List[GenerationReport]]) -> List[Dict]:
+    """Each generation's trait shares averaged over the replicates that got that far."""
+    summary = []
+    for generation in range(max((len(reports) for reports in replicates), default=0)):
+        reports = [reports[generation] for reports in replicates if len(reports) > generation]
+        traits: Dict[str, Dict[str, float]] = {}
+        for report in reports:
+            for trait, shares in report.frequencies.items():
+                totals = traits.setdefault(trait, {})
+                for value, share in shares.items():
+                    totals[value] = totals.get(value, 0.0) + share / len(reports)
+        summary.append({
+            "generation": generation + 1,
+            "replicates": len(reports),
+            "frequencies": {trait: dict(sorted(shares.items(), key=lambda item: item[1], reverse=True))
+                            for trait, shares in traits.items()},
+        })
+    return summary
+
+
+def parse_target(conditions: List[str], ruleset: Ruleset = None) -> TraitTarget:
+    """TraitTarget from "Trait=Value" strings, e.g. ["Coat Type=Maned", "Genes=Stardust"]."""
+    values: Dict[str, List[str]] = {}
+    for condition in conditions:
+        trait, separator, value = condition.partition("=")
+        if not separator:
+            raise ValueError(f"Targets look like Trait=Value, not {condition}")
+        values.setdefault(trait.strip(), []).append(value.strip())
+    return TraitTarget(values, ruleset)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m genos.population", description=__doc__.splitlines()[0])
+    parser.add_argument("roster", help="JSON or CSV roster whose sires and dams are the founders")
+    parser.add_argument("--roster-format", choices=["json", "csv"], help="defaults to the roster's file extension")
+    parser.add_argument("--generations", type=int, default=5)
+    parser.add_argument("--size", type=int, default=POPULATION_SIZE, help="pups kept in each generation")
+    parser.add_argument("--replicates", type=int, default=1)
+    parser.add_argument("--seed", type=int, help="seed for repeatable simulations")
+    parser.add_argument("--workers", type=int, default=1, help="processes to run replicates across")
+    parser.add_argument("--target", action="append", default=[],
+                        help="breed only from the parents closest to Trait=Value, can be given more than once")
+    parser.add_argument("--keep", type=float, default=0.5, help="share of each sex kept when selecting for --target")
+    parser.add_argument("--genetic-discovery", action="store_true", help="allow genetic discovery genes")
+    parser.add_argument("--ruleset", help="JSON or TOML ruleset to roll with instead of the standard rules")
+    args = parser.parse_args(argv)
+
+    roster_format = args.roster_format or args.roster.rsplit(".", 1)[-1].lower()
+    try:
+        ruleset = load_ruleset(args.ruleset) if args.ruleset else get_active_ruleset()
+        with open(args.roster, newline="") as roster_file:
+            pairings = load_roster(roster_file, roster_format, args.genetic_discovery, ruleset)
+        policy = TargetSelection(parse_target(args.target, ruleset), args.keep) if args.target else RandomMating()
+    except ValueError as error:
+        parser.error(str(error))
+    simulator = PopulationSimulator(policy, args.size, password_valid=args.genetic_discovery, ruleset=ruleset)
+    replicates = run_replicates(simulator, [pairing.sire for pairing in pairings], [pairing.dam for pairing in pairings],
+                                args.generations, args.replicates, args.seed, args.workers)
+    for generation in mean_frequencies(replicates):
+        sys.stdout.write(json.dumps(generation) + "\n")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,243 @@
+"""Rolled litters as columns of trait codes, written straight out as CSV, JSONL or a binary column file.
+
+PuppyColumns keeps every pup in flat arrays of the codes Puppy already holds, so no dictionary is made for any of them
+and a million pups take a few tens of MB. Rows are only turned into strings as they're written. The binary file is
+those arrays as they are, plus the name for every code, so it reads back the same in a process whose code tables have
+grown differently.
+
+python -m genos roster.csv --output-format columns --output litters.bin writes a roster's litters this way.
+"""
+import csv
+import json
+import struct
+import sys
+from array import array
+from json.encoder import encode_basestring_ascii
+from typing import BinaryIO, Dict, Iterable, Iterator, List, Sequence, TextIO
+
+from .batch import PUPPY_FIELDS
+from .breeding_logic import (
+    BASE, HEALTH, MINOR_MUTATION, PUPPY_TRAIT_CODES, SEX, SUBSPECIES, Puppy, format_abnormalities, format_appearance,
+)
+from .genes import GLEAM_FLAG, base_codes, health_codes, minor_mutation_codes, sex_codes, subspecies_codes
+from .roll_journal import JOURNAL_TABLES, TRAIT_TABLES
+
+MAGIC = b"GENOSC1\n"
+# Bytes of JSON header after the magic, which says what's in the columns that follow it.
+HEADER_LENGTH = struct.Struct("<I")
+TRAITS_PER_PUP = len(PUPPY_TRAIT_CODES)
+# The Puppy attribute each list column is from, and the table its codes are in.
+LIST_COLUMNS = {"major_mutations": ("major_mutation_codes", "mutation"), "genes": ("gene_codes", "gene"),
+                "chimera_genes": ("chimera_gene_codes", "gene")}
+ROW_FIELDS = ["Pairing"] + PUPPY_FIELDS
+
+
+class PuppyColumns:
+    """Pups from any number of litters, a row each, in the order they were added."""
+
+    def __init__(self):
+        self.pairings: List[str] = []
+        # Index into pairings for each pup
+        self.pairing = array("I")
+        self.names: List[str] = []
+        # Every pup's Puppy.traits, one after another
+        self.traits = array("H")
+        # Each list column's codes for every pup, one after another, and where each pup's end.
+        self.lists = {column: array("H") for column in LIST_COLUMNS}
+        self.list_ends = {column: array("I") for column in LIST_COLUMNS}
+        # Added to the health of the pup in that row, see BreedingRoller.last_health_note
+        self.health_notes: Dict[int, str] = {}
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    def add_litter(self, pairing: str, pups: Sequence[Puppy], last_health_note: str = ""):
+        number = len(self.pairings)
+        self.pairings.append(pairing)
+        for pup in pups:
+            self.pairing.append(number)
+            self.names.append(pup.name)
+            self.traits.extend(pup.traits)
+            for column, (attribute, _) in LIST_COLUMNS.items():
+                codes = self.lists[column]
+                codes.extend(getattr(pup, attribute))
+                self.list_ends[column].append(len(codes))
+        if pups and last_health_note:
+            self.health_notes[len(self) - 1] = last_health_note
+
+    def add_roller(self, pairing: str, roller):
+        """Adds the litter a BreedingRoller has rolled."""
+        self.add_litter(pairing, roller.puppies_class_format, roller.last_health_note())
+
+    def extend(self, other: 'PuppyColumns') -> 'PuppyColumns':
+        first_pairing = len(self.pairings)
+        first_row = len(self)
+        self.pairings.extend(other.pairings)
+        self.pairing.extend(first_pairing + number for number in other.pairing)
+        self.names.extend(other.names)
+        self.traits.extend(other.traits)
+        for column in LIST_COLUMNS:
+            start = len(self.lists[column])
+            self.lists[column].extend(other.lists[column])
+            self.list_ends[column].extend(start + end for end in other.list_ends[column])
+        self.health_notes.update({first_row + row: note for row, note in other.health_notes.items()})
+        return self
+
+    def codes(self, column: str, row: int) -> tuple:
+        ends = self.list_ends[column]
+        return tuple(self.lists[column][ends[row - 1] if row else 0:ends[row]])
+
+    def puppy(self, row: int) -> Puppy:
+        pup = Puppy(self.names[row])
+        pup.traits[:] = self.traits[row * TRAITS_PER_PUP:(row + 1) * TRAITS_PER_PUP]
+        for column, (attribute, _) in LIST_COLUMNS.items():
+            setattr(pup, attribute, self.codes(column, row))
+        return pup
+
+    def puppies(self) -> Iterator[Puppy]:
+        return (self.puppy(row) for row in range(len(self)))
+
+    # Writing out
+
+    def rows(self) -> Iterator[List[str]]:
+        """Each pup's ROW_FIELDS as strings, the rows write_csv writes."""
+        health_names = _names(health_codes)
+        subspecies_names = _names(subspecies_codes)
+        base_names = _names(base_codes)
+        sex_names = _names(sex_codes)
+        minor_mutation_names = _names(minor_mutation_codes)
+        traits = self.traits
+        for row in range(len(self)):
+            pup_traits = traits[row * TRAITS_PER_PUP:(row + 1) * TRAITS_PER_PUP]
+            health = health_names[pup_traits[HEALTH]]
+            if row in self.health_notes:
+                health += self.health_notes[row]
+            yield [self.pairings[self.pairing[row]], self.names[row], health,
+                   subspecies_names[pup_traits[SUBSPECIES]], base_names[pup_traits[BASE]], sex_names[pup_traits[SEX]],
+                   format_appearance(pup_traits, self.codes("genes", row), self.codes("chimera_genes", row)),
+                   format_abnormalities(pup_traits, self.codes("major_mutations", row)),
+                   minor_mutation_names[pup_traits[MINOR_MUTATION]]]
+
+    def write_csv(self, output: TextIO, header: bool = True) -> int:
+        writer = csv.writer(output)
+        if header:
+            writer.writerow(ROW_FIELDS)
+        writer.writerows(self.rows())
+        return len(self)
+
+    def write_jsonl(self, output: TextIO) -> int:
+        """One JSON object per pup, the same as json.dumps gives for its ROW_FIELDS."""
+        keys = [encode_basestring_ascii(field) + ": " for field in ROW_FIELDS]
+        for row in self.rows():
+            output.write("{" + ", ".join(key + encode_basestring_ascii(value) for key, value in zip(keys, row)) +
+                         "}\n")
+        return len(self)
+
+    def columns(self) -> Dict[str, array]:
+        columns = {"pairing": self.pairing, "traits": self.traits}
+        for column in LIST_COLUMNS:
+            columns[column] = self.lists[column]
+            columns[f"{column}_ends"] = self.list_ends[column]
+        return columns
+
+    def write_binary(self, output: BinaryIO) -> int:
+        columns = self.columns()
+        header = {
+            "rows": len(self),
+            "traits_per_pup": TRAITS_PER_PUP,
+            "pairings": self.pairings,
+            "names": self.names,
+            "health_notes": {str(row): note for row, note in self.health_notes.items()},
+            "tables": {table: list(codes.names) for table, codes in JOURNAL_TABLES.items()},
+            "columns": [[name, column.typecode, len(column)] for name, column in columns.items()],
+        }
+        encoded = json.dumps(header).encode()
+        output.write(MAGIC + HEADER_LENGTH.pack(len(encoded)) + encoded)
+        for column in columns.values():
+            output.write(_little_endian(column).tobytes())
+        return len(self)
+
+    @classmethod
+    def read_binary(cls, data: BinaryIO) -> 'PuppyColumns':
+        """Reads a write_binary file back, with its codes turned into this process's codes."""
+        if data.read(len(MAGIC)) != MAGIC:
+            raise ValueError("Not a puppy columns file")
+        header = json.loads(data.read(HEADER_LENGTH.unpack(data.read(HEADER_LENGTH.size))[0]))
+        if header["traits_per_pup"] != TRAITS_PER_PUP:
+            raise ValueError("The columns file has a different set of traits per pup")
+        columns = {}
+        for name, typecode, length in header["columns"]:
+            column = array(typecode)
+            column.frombytes(data.read(length * column.itemsize))
+            columns[name] = _little_endian(column)
+
+        translations = {}
+        for table, names in header["tables"].items():
+            codes = JOURNAL_TABLES[table]
+            translation = [codes.code(name) for name in names]
+            # Usually the tables are the same in both processes, so there's nothing to translate.
+            translations[table] = None if translation == list(range(len(names))) else translation
+
+        self = cls()
+        self.pairings = header["pairings"]
+        self.pairing = columns["pairing"]
+        self.names = header["names"]
+        self.traits = columns["traits"]
+        for index, table in enumerate(TRAIT_TABLES):
+            translation = translations.get(table)
+            if translation is not None:
+                traits = self.traits
+                for position in range(index, len(traits), TRAITS_PER_PUP):
+                    traits[position] = translation[traits[position]]
+        for column, (_, table) in LIST_COLUMNS.items():
+            codes = columns[column]
+            translation = translations[table]
+            if translation is not None:
+                flag = GLEAM_FLAG if table == "gene" else 0
+                for position, code in enumerate(codes):
+                    codes[position] = translation[code & ~flag] | (code & flag)
+            self.lists[column] = codes
+            self.list_ends[column] = columns[f"{column}_ends"]
+        self.health_notes = {int(row): note for row, note in header["health_notes"].items()}
+        return self
+
+
+_name_lists: Dict[int, List[str]] = {}
+
+
+def _names(codes) -> List[str]:
+    """Every name in a code table by code, looked up once rather than once per pup, and again if the table grows."""
+    names = _name_lists.get(id(codes))
+    if names is None or len(names) != len(codes):
+        names = _name_lists[id(codes)] = [codes.name(code) for code in range(len(codes))]
+    return names
+
+
+def _little_endian(column: array) -> array:
+    if sys.byteorder == "little":
+        return column
+    swapped = array(column.typecode, column)
+    swapped.byteswap()
+    return swapped
+
+
+def write_litters(litters: Iterable[PuppyColumns], output, output_format: str) -> int:
+    """Writes each litter's rows as it comes in, flushing after each, with one header for CSV. Returns the rows.
+
+    The columns format has to have every litter before it can write its header, and needs a binary output.
+    """
+    if output_format == "columns":
+        columns = PuppyColumns()
+        for litter in litters:
+            columns.extend(litter)
+        return columns.write_binary(output)
+    written = 0
+    header = True
+    for litter in litters:
+        if output_format == "csv":
+            written += litter.write_csv(output, header)
+            header = False
+        else:
+            written += litter.write_jsonl(output)
+        output.flush()
+    return written
@@ -1,195 +1,358 @@
 from collections import Counter
-from random import randint
+from typing import List, NamedTuple, Optional, TextIO
+from .rng import RollRandom
 from .item_text_prettification import inventory_update_text, items_to_user_string
-from .genes import *
-
-def vesper_roller_factory(generator, rolls):
+from .genes import (
+    GLEAM_FLAG, all_mythic_options, base_codes, colour_codes, common_bases, common_colours, common_genes,
+    common_tails, gene_codes, gene_modifier_index, horn_codes, modifier_codes, rare_bases, rare_colours, rare_genes,
+    rare_horns, rare_tails, sex_codes, tail_codes, tail_index, uncommon_bases, uncommon_colours, uncommon_genes,
+    uncommon_horns, uncommon_tails, vesper_modifier_index,
+)
+from .histogram import TraitAccumulator
+from .ruleset import Ruleset, get_active_ruleset
+
+# Fields of each roll, in the order they're shown
+RESULT_FIELDS = ["name", "coat", "sex", "appearance", "abnormalities"]
+
+
+class VesperTraits(NamedTuple):
+    """One MaxRarityVesper roll before it's written out. None is no horns, a domestic tail or no modifier."""
+    coat: str
+    sex: str
+    colour: str
+    horns: Optional[str]
+    tail: Optional[str]
+    colour_mod: Optional[str]
+    genes: List[str]
+    # gene_mod attached to genes[gene_mod_index]
+    gene_mod: Optional[str]
+    gene_mod_index: Optional[int]
+
+
+def new_vesper_accumulator() -> TraitAccumulator:
+    return TraitAccumulator({"Coat Type": base_codes, "Sex": sex_codes, "Base colours": colour_codes,
+                             "Horns": horn_codes, "Tails": tail_codes, "Modifier": modifier_codes,
+                             "Genes": gene_codes}, multi=["Genes"], flags={"Genes": GLEAM_FLAG})
+
+def vesper_roller_factory(generator, rolls, rng=None, ruleset=None, journal=None):
     if generator == 'Default':
-        return DefaultVesper(rolls)
+        return DefaultVesper(rolls, rng, ruleset, journal)
     elif generator == "Max Rarity Based":
-        return MaxRarityVesper(rolls)
+        return MaxRarityVesper(rolls, rng, ruleset, journal)
 
 class VesperRoller:
-    def __init__(self, rolls):
+    # The name vesper_roller_factory knows it by
+    generator = None
+
+    def __init__(self, rolls, rng: RollRandom = None, ruleset: Ruleset = None, journal=None):
         self.rolls = rolls
         self.results = []
+        # Pass a seeded RollRandom to get the same vespers every time.
+        self.rng = rng if rng is not None else RollRandom()
+        # See ruleset.py. None takes the active ruleset as it is right now, and keeps it for every roll.
+        self.ruleset = ruleset if ruleset is not None else get_active_ruleset()
+        # Pass a roll_journal.RollJournal to append each batch of rolls to it, with the traits rolled.
+        self.journal = journal
+        self.journalled = []
+        self.journalled_batches = 0
 
     def get_results(self):
+        for result in self.iter_results():
+            self.results.append(result)
+        return self.results
+
+    def iter_results(self):
+        """Yields the rolls one at a time, without keeping them in self.results. A journal gets the rolls made so far
+        even if the rest are never asked for. Each journalled batch rolls from its own seed, spawned from self.rng, so
+        the journal can replay it however many batches came before."""
+        if self.journal is None:
+            for i in range(0, self.rolls):
+                yield self.roll_vesper(i + 1)
+            return
+        rng = self.rng
+        self.rng = rng.spawn(self.journalled_batches)
+        self.journalled_batches += 1
+        try:
+            for i in range(0, self.rolls):
+                yield self.roll_vesper(i + 1)
+        finally:
+            self.journal.record_vespers(self, self.journalled, self.rng.seed)
+            self.journalled = []
+            self.rng = rng
+
+    def roll_vesper(self, number):
         pass
 
+    def write_results(self, output: TextIO, output_format: str = "jsonl") -> int:
+        """Streams iter_results to output as JSON lines or CSV with RESULT_FIELDS, see sinks.py. Returns how many
+        rolls were written."""
+        from . import sinks
+        if output_format == "jsonl":
+            return sinks.write_jsonl(self.iter_results(), output)
+        if output_format == "csv":
+            return sinks.write_csv(self.iter_results(), output, RESULT_FIELDS)
+        raise ValueError(f"Can't write {output_format}, pick jsonl or csv")
+
     def pick_items_from_list(self, num, possible_items):
         items = []
         for i in range(0,num):
-            rng = randint(1,len(possible_items)) - 1
+            rng = self.rng.randint(1,len(possible_items)) - 1
             item_name = possible_items[rng]
             items.append(item_name)
         return Counter(items)
 
     def pick_item_from_list(self, possible_items):
-        rng = randint(1,len(possible_items)) - 1
+        rng = self.rng.randint(1,len(possible_items)) - 1
         item_name = possible_items[rng]
         return item_name
 
     def get_sex(self):
-        if randint(1, 2) == 1:
+        if self.rng.randint(1, 2) == 1:
             return "Female"
         else:
             return "Male"
 
 
 class DefaultVesper(VesperRoller):
+    generator = "Default"
 
-    def get_results(self):
-        for i in range(0, self.rolls):
-            result = {"name": "Roll {}".format(i + 1)}
+    def roll_vesper(self, number):
+        result = {"name": "Roll {}".format(number)}
 
-            result["coat"] = "Unknown coat"
-            result["sex"] = self.get_sex()
-            result["appearance"] = "Unknown appearance"
-            result["abnormalities"] = "Unknown abnormalities"
-            self.results.append(result)
-        return self.results
+        result["coat"] = "Unknown coat"
+        result["sex"] = self.get_sex()
+        result["appearance"] = "Unknown appearance"
+        result["abnormalities"] = "Unknown abnormalities"
+        return result
 
 
 class MaxRarityVesper(VesperRoller):
+    generator = "Max Rarity Based"
 
     def get_explanation(self):
         return "This randomly selects "
 
-    def get_results(self):
-        for i in range(0, self.rolls):
-            result = {"name": "Roll {}".format(i + 1)}
-
-            genes = {"rare": 0, "mythic": 0, "common": 0, "uncommon": 0}
-
-            colour = None
-            coat = None
-            horns = None
-            tail = None
-            colour_mod = None
-            gene_mod = None
-            coat_genes = []
-
-            self.get_rare_and_mythic_genes(genes)
-
-            if genes["mythic"] == 1:
-                mythic_gene = self.pick_item_from_list(all_mythic_options)
-                if mythic_gene in all_tails:
-                    tail = mythic_gene + " Tail"
-                elif mythic_gene in all_colour_mods:
-                    colour_mod = mythic_gene
-                elif mythic_gene in all_gene_modifiers:
-                    gene_mod = mythic_gene
-
-            get_rare_gene = False
-            get_rare_abnormality = False
-            if genes["rare"] == 2:
-                get_rare_gene = True
-                get_rare_abnormality = True
-
-            if get_rare_gene:
-                coat_genes.append(self.pick_item_from_list(rare_genes))
-
-            if get_rare_abnormality:
-                rare_abnormailty = self.pick_item_from_list(["tail", "colour", "horns"])
-                # If you have a mythic tail don't pick a rare one
-                if tail:
-                    rare_abnormailty = self.pick_item_from_list([ "colour", "horns"])
-                # If you have a mythic colour
-                if colour_mod:
-                    rare_abnormailty = self.pick_item_from_list(["tail", "horns"])
-
-                if rare_abnormailty == "tail":
-                    tail = self.pick_item_from_list(rare_tails) + " Tail"
-                elif rare_abnormailty == "horns":
-                    horns = self.pick_item_from_list(rare_horns)
-                elif rare_abnormailty == "colour":
-                    colour = self.pick_item_from_list(rare_colours)
-
-            # Fill the rest of the genes in if they're missing
-
-            coat_rng = randint(1,100)
-            if coat_rng <= 15:
-                coat = self.pick_item_from_list(rare_bases)
-            elif coat_rng <= 40:
-                coat = self.pick_item_from_list(uncommon_bases)
+    def roll_vesper(self, number):
+        traits = self.roll_traits()
+        if self.journal is not None:
+            self.journalled.append(traits)
+        result = {"name": "Roll {}".format(number)}
+        result["coat"] = traits.coat
+        result["sex"] = traits.sex
+        result["appearance"] = self.format_appearance(traits)
+        result["abnormalities"] = self.format_abnormalities(traits)
+        return result
+
+    def tally(self, accumulator: TraitAccumulator = None) -> TraitAccumulator:
+        """Rolls self.rolls vespers and counts their traits by code, without writing any of them out."""
+        if accumulator is None:
+            accumulator = new_vesper_accumulator()
+        add_coat = accumulator["Coat Type"].add
+        add_sex = accumulator["Sex"].add
+        add_colour = accumulator["Base colours"].add
+        add_horns = accumulator["Horns"].add
+        add_tail = accumulator["Tails"].add
+        add_modifier = accumulator["Modifier"].add
+        add_gene = accumulator["Genes"].add
+        for _ in range(self.rolls):
+            traits = self.roll_traits()
+            add_coat(base_codes.code(traits.coat))
+            add_sex(sex_codes.code(traits.sex))
+            add_colour(colour_codes.code(traits.colour))
+            add_horns(horn_codes.code(traits.horns or "None"))
+            add_tail(tail_codes.code(traits.tail or "Domestic"))
+            add_modifier(modifier_codes.code(traits.colour_mod or "None"))
+            for index, gene in enumerate(traits.genes):
+                code = gene_codes.code(gene)
+                # Gleam is the only gene modifier there is, and the only one gene codes can carry.
+                if index == traits.gene_mod_index and traits.gene_mod == "Gleam":
+                    code |= GLEAM_FLAG
+                add_gene(code)
+        accumulator.items += self.rolls
+        return accumulator
+
+    def get_exact_report(self):
+        """The exact chance of every outcome under self.ruleset, as comments like the breeding roller's exact test.
+        Nothing is rolled, so it's instant for any ruleset."""
+        from .vesper_distributions import VesperDistributions
+        return VesperDistributions(self.ruleset).report()
+
+    def columns(self):
+        """Rolls self.rolls vespers as vectorised_vespers.VesperColumns, which is far quicker for big batches. Needs
+        NumPy."""
+        from .vectorised_vespers import VectorisedVesperGenerator
+        return VectorisedVesperGenerator(self.ruleset, self.rng.getrandbits(64)).generate(self.rolls)
+
+    def roll_traits(self) -> VesperTraits:
+        genes = {"rare": 0, "mythic": 0, "common": 0, "uncommon": 0}
+
+        colour = None
+        coat = None
+        horns = None
+        tail = None
+        colour_mod = None
+        gene_mod = None
+        coat_genes = []
+
+        self.get_rare_and_mythic_genes(genes)
+
+        if genes["mythic"] == 1:
+            mythic_gene = self.pick_item_from_list(all_mythic_options)
+            if mythic_gene in tail_index:
+                tail = mythic_gene
+            elif mythic_gene in vesper_modifier_index:
+                colour_mod = mythic_gene
+            elif mythic_gene in gene_modifier_index:
+                gene_mod = mythic_gene
+
+        get_rare_gene = False
+        get_rare_abnormality = False
+        if genes["rare"] == 2:
+            get_rare_gene = True
+            get_rare_abnormality = True
+
+        if get_rare_gene:
+            coat_genes.append(self.pick_item_from_list(rare_genes))
+
+        if get_rare_abnormality:
+            rare_abnormailty = self.pick_item_from_list(["tail", "colour", "horns"])
+            # If you have a mythic tail don't pick a rare one
+            if tail:
+                rare_abnormailty = self.pick_item_from_list([ "colour", "horns"])
+            # If you have a mythic colour
+            if colour_mod:
+                rare_abnormailty = self.pick_item_from_list(["tail", "horns"])
+
+            if rare_abnormailty == "tail":
+                tail = self.pick_item_from_list(rare_tails)
+            elif rare_abnormailty == "horns":
+                horns = self.pick_item_from_list(rare_horns)
+            elif rare_abnormailty == "colour":
+                colour = self.pick_item_from_list(rare_colours)
+
+        # Fill the rest of the genes in if they're missing
+
+        ruleset = self.ruleset
+        coat_rng = self.rng.randint(1,100)
+        if coat_rng <= ruleset.rare_coat_chance:
+            coat = self.pick_item_from_list(rare_bases)
+        elif coat_rng <= ruleset.rare_coat_chance + ruleset.uncommon_coat_chance:
+            coat = self.pick_item_from_list(uncommon_bases)
+        else:
+            coat = self.pick_item_from_list(common_bases)
+
+        if not tail:
+            tail_rng = self.rng.randint(1,100)
+            if tail_rng <= ruleset.uncommon_tail_chance:
+                tail = self.pick_item_from_list(uncommon_tails)
             else:
-                coat = self.pick_item_from_list(common_bases)
-
-            if not tail:
-                tail_rng = randint(1,100)
-                if tail_rng <= 25:
-                    tail = self.pick_item_from_list(uncommon_tails) + " Tail"
-                else:
-                    tail_type = self.pick_item_from_list(common_tails)
-                    if tail_type != "Domestic":
-                        tail = tail_type + " Tail"
-
-            if not horns:
-                horns_rng = randint(1,100)
-                if horns_rng <= 25:
-                    horns = self.pick_item_from_list(uncommon_horns)
-
-            if not colour:
-                colour_rng = randint(1, 100)
-                if colour_rng <= 25:
-                    colour = self.pick_item_from_list(uncommon_colours)
-                else:
-                    colour = self.pick_item_from_list(common_colours)
-
-            abnormailities = None
-            if colour_mod or tail or horns:
-                if colour_mod and tail and horns:
-                    abnormailities = "{} with {} and {}.".format(colour_mod, horns, tail)
-                elif colour_mod and tail:
-                    abnormailities = "{} with {}.".format(colour_mod, tail)
-                elif colour_mod and horns:
-                    abnormailities = "{} with {}.".format(colour_mod, horns)
-                elif horns and tail:
-                    abnormailities = "{} with {}.".format(horns, tail)
-                elif colour_mod:
-                    abnormailities = "{}.".format(colour_mod)
-                elif tail:
-                    abnormailities = "{}.".format(tail)
-                elif horns:
-                    abnormailities = "{}.".format(horns)
-            if not abnormailities:
-                abnormailities = "None"
-
-            # Now sort out the genes
-            gene_count = randint(2,4)
-            while len(coat_genes) < gene_count:
-                gene_rng = randint(1, 100)
-                if gene_rng <= 25:
-                    gene = self.pick_item_from_list(uncommon_genes)
-                else:
-                    gene = self.pick_item_from_list(common_genes)
-                if gene not in coat_genes:
-                    coat_genes.append(gene)
-
-            if gene_mod:
-                mod_gene_num = randint(0,len(coat_genes)-1)
-                coat_genes[mod_gene_num] = "{} ({})".format(coat_genes[mod_gene_num], gene_mod)
-
-            last_genes = coat_genes.pop()
-            early_genes = ", ".join(coat_genes)
-            appearance = "{} and {} on {}".format(early_genes, last_genes, colour)
-
-            result["coat"] = coat
-            result["sex"] = self.get_sex()
-            result["appearance"] = appearance
-            result["abnormalities"] = abnormailities
-            self.results.append(result)
-        return self.results
+                tail_type = self.pick_item_from_list(common_tails)
+                if tail_type != "Domestic":
+                    tail = tail_type
+
+        if not horns:
+            horns_rng = self.rng.randint(1,100)
+            if horns_rng <= ruleset.uncommon_horns_chance:
+                horns = self.pick_item_from_list(uncommon_horns)
+
+        if not colour:
+            colour_rng = self.rng.randint(1, 100)
+            if colour_rng <= ruleset.uncommon_colour_chance:
+                colour = self.pick_item_from_list(uncommon_colours)
+            else:
+                colour = self.pick_item_from_list(common_colours)
+
+        # Now sort out the genes
+        gene_count = self.rng.randint(*ruleset.gene_count_range)
+        while len(coat_genes) < gene_count:
+            gene_rng = self.rng.randint(1, 100)
+            if gene_rng <= ruleset.uncommon_gene_chance:
+                gene = self.pick_item_from_list(uncommon_genes)
+            else:
+                gene = self.pick_item_from_list(common_genes)
+            if gene not in coat_genes:
+                coat_genes.append(gene)
+
+        mod_gene_num = None
+        if gene_mod:
+            mod_gene_num = self.rng.randint(0,len(coat_genes)-1)
+
+        return VesperTraits(coat, self.get_sex(), colour, horns, tail, colour_mod, coat_genes, gene_mod, mod_gene_num)
+
+    @staticmethod
+    def format_appearance(traits: VesperTraits) -> str:
+        coat_genes = list(traits.genes)
+        if traits.gene_mod:
+            coat_genes[traits.gene_mod_index] = "{} ({})".format(coat_genes[traits.gene_mod_index], traits.gene_mod)
+        last_genes = coat_genes.pop()
+        early_genes = ", ".join(coat_genes)
+        return "{} and {} on {}".format(early_genes, last_genes, traits.colour)
+
+    @staticmethod
+    def format_abnormalities(traits: VesperTraits) -> str:
+        colour_mod = traits.colour_mod
+        horns = traits.horns
+        tail = traits.tail + " Tail" if traits.tail else None
+        abnormailities = None
+        if colour_mod or tail or horns:
+            if colour_mod and tail and horns:
+                abnormailities = "{} with {} and {}.".format(colour_mod, horns, tail)
+            elif colour_mod and tail:
+                abnormailities = "{} with {}.".format(colour_mod, tail)
+            elif colour_mod and horns:
+                abnormailities = "{} with {}.".format(colour_mod, horns)
+            elif horns and tail:
+                abnormailities = "{} with {}.".format(horns, tail)
+            elif colour_mod:
+                abnormailities = "{}.".format(colour_mod)
+            elif tail:
+                abnormailities = "{}.".format(tail)
+            elif horns:
+                abnormailities = "{}.".format(horns)
+        if not abnormailities:
+            abnormailities = "None"
+        return abnormailities
 
     def get_rare_and_mythic_genes(self, genes):
-        rng = randint(1,100)
-        if rng <= 5:
-            genes["mythic"] += 1
-            genes["rare"] += 1
-        elif rng <= 10:
-            genes["mythic"] += 1
-        elif rng <= 20:
-            genes["rare"] += 2
-        elif rng <= 35:
-            genes["rare"] += 1
+        rng = self.rng.randint(1,100)
+        for highest_roll, mythic, rare in self.ruleset.rarity_ladder:
+            if rng <= highest_roll:
+                genes["mythic"] += mythic
+                genes["rare"] += rare
+                return
+
+
+def main(argv=None):
+    import argparse
+    import sys
+    from .ruleset import load_ruleset
+    parser = argparse.ArgumentParser(prog="python -m genos.random_vesper_rolling_logic",
+                                     description="Roll random vespers, writing each one out as it's rolled.")
+    parser.add_argument("rolls", type=int, help="how many vespers to roll")
+    parser.add_argument("--generator", choices=["Default", "Max Rarity Based"], default="Max Rarity Based")
+    parser.add_argument("--output", help="file to write to, defaults to stdout")
+    parser.add_argument("--output-format", choices=["jsonl", "csv"], default="jsonl")
+    parser.add_argument("--seed", type=int, help="roll the same vespers every time")
+    parser.add_argument("--ruleset", help="JSON or TOML ruleset to roll with instead of the standard rules")
+    parser.add_argument("--journal", help="append the rolls to this roll journal, see genos.roll_journal")
+    args = parser.parse_args(argv)
+
+    journal = None
+    if args.journal:
+        from .roll_journal import RollJournal
+        journal = RollJournal(args.journal)
+    roller = vesper_roller_factory(args.generator, args.rolls, RollRandom(args.seed),
+                                   load_ruleset(args.ruleset) if args.ruleset else None, journal)
+    try:
+        if args.output:
+            with open(args.output, "w", newline="") as output:
+                roller.write_results(output, args.output_format)
+        else:
+            roller.write_results(sys.stdout, args.output_format)
+    finally:
+        if journal is not None:
+            journal.close()
+
+
+if __name__ == "__main__":
+    main()
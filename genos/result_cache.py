@@ -0,0 +1,103 @@
+from collections import OrderedDict
+from threading import Lock
+from time import monotonic
+from typing import Dict, Hashable, Optional
+
+# Test results kept per process. Each is a couple of dozen comment lines, so this is a few megabytes at most.
+TEST_CACHE_SIZE = 1024
+# Long enough to cover someone pressing test again and again, short enough that stale results don't hang around.
+TEST_CACHE_SECONDS = 600.0
+
+# The BreedingVesper fields that feed into a litter. The name is just which parent it is.
+VESPER_FINGERPRINT_FIELDS = ["colour", "horns", "tail", "base", "modifier", "subspecies", "mutation",
+                             "chimera_status", "chimera_colour"]
+
+
+def pairing_fingerprint(sire, dam, modifiers: Dict) -> str:
+    """A hash of everything about the parents and modifiers that affects what they breed.
+
+    Gene order and modifier order don't change what a pairing breeds, so they don't change the fingerprint either.
+    Duplicate genes are kept, as they make a different (invalid) breeding.
+    """
+    import hashlib
+    import json
+    canonical = json.dumps([vesper_fingerprint_fields(sire), vesper_fingerprint_fields(dam), modifiers],
+                           sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(canonical.encode()).hexdigest()
+
+
+def vesper_fingerprint_fields(vesper) -> Dict:
+    fields = {field: getattr(vesper, field) for field in VESPER_FINGERPRINT_FIELDS}
+    fields["genes"] = sorted(vesper.genes)
+    return fields
+
+
+class ResultCache:
+    """A bounded LRU cache whose entries expire ttl seconds after they were stored. Safe to share between threads."""
+
+    def __init__(self, max_size: int, ttl: float):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._lock = Lock()
+        self.hits = 0
+        self.misses = 0
+        self.expired = 0
+        self.evictions = 0
+
+    def get(self, key: Hashable):
+        """The cached value, or None if there isn't one or it has expired."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                expires, value = entry
+                if monotonic() < expires:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._entries[key]
+                self.expired += 1
+            self.misses += 1
+            return None
+
+    def put(self, key: Hashable, value):
+        with self._lock:
+            self._entries[key] = (monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    @property
+    def hit_rate(self) -> float:
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def as_dict(self) -> Dict:
+        return {
+            "size": len(self._entries),
+            "max_size": self.max_size,
+            "ttl_seconds": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "expired": self.expired,
+            "evictions": self.evictions,
+            "hit_rate": self.hit_rate,
+        }
+
+
+# Test and exact test comments, shared by every BreedingRoller in the process.
+test_cache = ResultCache(TEST_CACHE_SIZE, TEST_CACHE_SECONDS)
+
+
+def test_cache_key(roller, iterations: Optional[int]) -> tuple:
+    """Everything a test's results depend on, bar the seed - a repeat test is answered by whichever roll came first.
+
+    The litter's gender booster decides the sex of every test pup too, so whether it activated is part of the key.
+    """
+    return (pairing_fingerprint(roller.sire, roller.dam, roller.modifiers), roller.genetic_discovery,
+            roller.exact_test, iterations, roller.all_male, roller.all_female, roller.ruleset.fingerprint)
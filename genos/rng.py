@@ -0,0 +1,52 @@
+import random
+from typing import Dict, List, MutableSequence, Optional, Sequence
+
+# How many rolls are drawn at once for each range the rollers ask for. Blocks start small and double up to
+# BLOCK_SIZE, so a single litter doesn't pay for thousands of rolls it never uses.
+FIRST_BLOCK_SIZE = 32
+BLOCK_SIZE = 4096
+
+
+class RollRandom:
+    """Seedable random number source for a single breeding or vesper roll.
+
+    Each request should get its own RollRandom rather than sharing the module level random state. Rolls over a
+    fixed range, e.g. randint(1, 100), are drawn a block at a time and handed out from a buffer. Given the same seed
+    the same sequence of rolls comes out every time.
+    """
+
+    def __init__(self, seed: Optional[int] = None, block_size: int = BLOCK_SIZE):
+        if seed is None:
+            seed = random.SystemRandom().getrandbits(64)
+        self.seed = seed
+        self.block_size = block_size
+        self.generator = random.Random(seed)
+        self.buffers: Dict[tuple, List[int]] = {}
+        self.next_block_sizes: Dict[tuple, int] = {}
+
+    def randint(self, low: int, high: int) -> int:
+        buffer = self.buffers.get((low, high))
+        if not buffer:
+            block_size = self.next_block_sizes.get((low, high), min(FIRST_BLOCK_SIZE, self.block_size))
+            self.next_block_sizes[(low, high)] = min(2 * block_size, self.block_size)
+            # Refill backwards so each roll is a pop off the end of the list.
+            buffer = self.generator.choices(range(low, high + 1), k=block_size)
+            buffer.reverse()
+            self.buffers[(low, high)] = buffer
+        return buffer.pop()
+
+    def random(self) -> float:
+        return self.generator.random()
+
+    def choice(self, items: Sequence):
+        return items[self.randint(0, len(items) - 1)]
+
+    def shuffle(self, items: MutableSequence):
+        self.generator.shuffle(items)
+
+    def spawn(self, index: int) -> "RollRandom":
+        """Independent stream for worker number index, reproducible from this stream's seed."""
+        return RollRandom(random.Random("{}:{}".format(self.seed, index)).getrandbits(64), self.block_size)
+
+    def getrandbits(self, bits: int) -> int:
+        return self.generator.getrandbits(bits)
@@ -0,0 +1,459 @@
+"""An append-only binary journal of breeding and random vesper rolls, to settle disputes about how a roll came out.
+
+Pass a RollJournal to BreedingRoller or VesperRoller and every litter or batch they roll is appended as one record:
+its seed, a fingerprint of its inputs and its outcomes as the integer codes from genes.py. The inputs themselves are
+written once per fingerprint, so any record can be rolled again from its seed and checked with JournalReader.replay.
+JournalReader reads through a memory map and only unpacks the fields a query asks about.
+
+python -m genos.roll_journal journal.bin --last 100000 --where genes=Stardust compares the share of the last 100k
+pups with Stardust against what their pairings should have given.
+"""
+import argparse
+import json
+import os
+import struct
+import sys
+import time
+from threading import Lock
+from typing import Dict, Iterator, List, NamedTuple, Optional, Tuple
+
+from .breeding_logic import (
+    BASE, CHIMERA_COLOUR, CHIMERA_STATUS, COLOUR, HEALTH, HORNS, MINOR_MUTATION, MODIFIER, PUPPY_TRAIT_CODES, SEX,
+    SUBSPECIES, TAIL, BreedingRoller, BreedingVesper, Puppy,
+)
+from .genes import (
+    GLEAM_FLAG, base_codes, chimera_codes, colour_codes, gene_codes, health_codes, horn_codes, minor_mutation_codes,
+    modifier_codes, mutation_codes, sex_codes, subspecies_codes, tail_codes,
+)
+from .rng import RollRandom
+
+MAGIC = b"GENOSJ1\n"
+# kind, payload bytes, time, seed, inputs fingerprint, pups or vespers in the record
+RECORD_HEADER = struct.Struct("<BIdQ16sI")
+INPUTS, CODES, LITTER, VESPERS = 1, 2, 3, 4
+# A pup's single valued traits in Puppy.traits order, then how many major mutations, genes and chimera genes follow.
+PUP_HEADER = struct.Struct(f"<{len(PUPPY_TRAIT_CODES)}H3B")
+# coat, sex, colour, horns, tail and colour modifier, then how many genes follow. Gleam is flagged on its gene.
+VESPER_HEADER = struct.Struct("<6HB")
+
+# The code tables written to the journal, so it can be read by a process whose tables have grown differently.
+# Health is a bit per condition, so its codes never change.
+JOURNAL_TABLES = {
+    "sex": sex_codes, "colour": colour_codes, "horns": horn_codes, "tail": tail_codes, "base": base_codes,
+    "modifier": modifier_codes, "subspecies": subspecies_codes, "minor_mutation": minor_mutation_codes,
+    "chimera": chimera_codes, "mutation": mutation_codes, "gene": gene_codes,
+}
+# The table each of Puppy.traits is coded by, None for health.
+TRAIT_TABLES = ["health", "sex", "colour", "colour", "horns", "tail", "base", "modifier", "subspecies",
+                "minor_mutation", "chimera"]
+VESPER_TABLES = ["base", "sex", "colour", "horns", "tail", "modifier"]
+# The Puppy field each query can ask about, and where it is: an index into Puppy.traits, or which code list.
+PUPPY_FIELDS = {
+    "health": HEALTH, "sex": SEX, "colour": COLOUR, "chimera_colour": CHIMERA_COLOUR, "horns": HORNS, "tail": TAIL,
+    "base": BASE, "modifier": MODIFIER, "subspecies": SUBSPECIES, "minor_mutation": MINOR_MUTATION,
+    "chimera_status": CHIMERA_STATUS,
+    "major_mutations": "mutation", "genes": "gene", "chimera_genes": "chimera_gene",
+}
+
+
+class JournalRecord(NamedTuple):
+    kind: int
+    # Where the payload starts in the file, and how long it is
+    offset: int
+    size: int
+    time: float
+    seed: int
+    fingerprint: bytes
+    count: int
+    # Which CODES record the payload's codes are from
+    session: int
+
+
+class Comparison(NamedTuple):
+    pups: int
+    litters: int
+    observed: int
+    expected: float
+    # How many standard deviations observed is from expected
+    z: float
+
+
+def inputs_fingerprint(inputs: Dict) -> bytes:
+    """Inputs name their ruleset by its fingerprint, so the full rules are only read when they're written out."""
+    import hashlib
+    return hashlib.sha256(json.dumps(inputs, sort_keys=True, separators=(",", ":")).encode()).digest()[:16]
+
+
+def breeding_inputs(roller: BreedingRoller) -> Dict:
+    return {"kind": "breeding", "sire": vars(roller.sire), "dam": vars(roller.dam), "modifiers": roller.modifiers,
+            "password_valid": roller.genetic_discovery, "compiled_tables": roller.compiled_tables,
+            "ruleset": roller.ruleset.fingerprint}
+
+
+def vesper_inputs(roller) -> Dict:
+    return {"kind": "vespers", "generator": roller.generator, "rolls": roller.rolls,
+            "ruleset": roller.ruleset.fingerprint}
+
+
+def encode_litter(pups: List[Puppy]) -> bytes:
+    parts = []
+    for pup in pups:
+        codes = pup.major_mutation_codes + pup.gene_codes + pup.chimera_gene_codes
+        parts.append(PUP_HEADER.pack(*pup.traits, len(pup.major_mutation_codes), len(pup.gene_codes),
+                                     len(pup.chimera_gene_codes)))
+        parts.append(struct.pack(f"<{len(codes)}H", *codes))
+    return b"".join(parts)
+
+
+def encode_vespers(vespers) -> bytes:
+    parts = []
+    for traits in vespers:
+        genes = [gene_codes.code(gene) for gene in traits.genes]
+        if traits.gene_mod == "Gleam":
+            genes[traits.gene_mod_index] |= GLEAM_FLAG
+        parts.append(VESPER_HEADER.pack(base_codes.code(traits.coat), sex_codes.code(traits.sex),
+                                        colour_codes.code(traits.colour), horn_codes.code(traits.horns or "None"),
+                                        tail_codes.code(traits.tail or "Domestic"),
+                                        modifier_codes.code(traits.colour_mod or "None"), len(genes)))
+        parts.append(struct.pack(f"<{len(genes)}H", *genes))
+    return b"".join(parts)
+
+
+class RollJournal:
+    """Appends roll records to a journal file. One process writes to a file at a time, threads can share it.
+
+    The seed recorded is the one the litter or batch was rolled from, which the rollers spawn from their RollRandom
+    for each one they journal.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._file = None
+        self._lock = Lock()
+        self._fingerprints = set()
+        # How much of each code table this journal has written since it was opened
+        self._written_codes: Dict[str, int] = {}
+
+    def record_litter(self, roller: BreedingRoller, pups: List[Puppy], seed: int):
+        self.append(LITTER, seed, breeding_inputs(roller), roller.ruleset, len(pups), encode_litter(pups))
+
+    def record_vespers(self, roller, vespers, seed: int):
+        """vespers are the VesperTraits rolled, which can be fewer than roller.rolls if it was stopped early, and
+        empty for a generator that doesn't roll any."""
+        self.append(VESPERS, seed, vesper_inputs(roller), roller.ruleset, len(vespers),
+                    encode_vespers(vespers))
+
+    def append(self, kind: int, seed: int, inputs: Dict, ruleset, count: int, payload: bytes):
+        fingerprint = inputs_fingerprint(inputs)
+        with self._lock:
+            if self._file is None:
+                self.open()
+            records = []
+            if fingerprint not in self._fingerprints:
+                written = dict(inputs, rules=json.loads(ruleset.rules))
+                records.append(pack_record(INPUTS, 0, fingerprint, 0, json.dumps(written).encode()))
+                self._fingerprints.add(fingerprint)
+            grown = {name: [self._written_codes.get(name, 0), table.names[self._written_codes.get(name, 0):]]
+                     for name, table in JOURNAL_TABLES.items() if len(table) > self._written_codes.get(name, 0)}
+            if grown:
+                records.append(pack_record(CODES, 0, bytes(16), 0, json.dumps(grown).encode()))
+                self._written_codes.update((name, len(JOURNAL_TABLES[name])) for name in grown)
+            records.append(pack_record(kind, seed, fingerprint, count, payload))
+            # One write, so a crash leaves at most a cut off last record, which readers skip.
+            self._file.write(b"".join(records))
+            self._file.flush()
+
+    def open(self):
+        if os.path.exists(self.path) and os.path.getsize(self.path):
+            with JournalReader(self.path) as reader:
+                self._fingerprints = set(reader.inputs)
+        self._file = open(self.path, "ab")
+        if self._file.tell() == 0:
+            self._file.write(MAGIC)
+        # Every time a journal is opened its code tables are written out again in full, starting a new session.
+        self._written_codes = {}
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def pack_record(kind: int, seed: int, fingerprint: bytes, count: int, payload: bytes) -> bytes:
+    return RECORD_HEADER.pack(kind, len(payload), time.time(), seed, fingerprint, count) + payload
+
+
+class JournalReader:
+    """Reads a journal through a memory map. Opening it only reads the record headers, inputs and code tables."""
+
+    def __init__(self, path: str):
+        import mmap
+        self.path = path
+        self._file = open(path, "rb")
+        size = os.fstat(self._file.fileno()).st_size
+        self.data = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ) if size else b""
+        if self.data[:len(MAGIC)] != MAGIC:
+            self.close()
+            raise ValueError(f"{path} isn't a roll journal")
+        # Litters and vesper batches, in the order they were rolled
+        self.records: List[JournalRecord] = []
+        self.inputs: Dict[bytes, Dict] = {}
+        # The names behind every code in each session, by table
+        self.sessions: List[Dict[str, List[str]]] = []
+        self._translations: Dict[Tuple[int, str], List[int]] = {}
+        self._queries = {}
+        self._scan()
+
+    def _scan(self):
+        data = self.data
+        offset = len(MAGIC)
+        while offset + RECORD_HEADER.size <= len(data):
+            kind, size, written, seed, fingerprint, count = RECORD_HEADER.unpack_from(data, offset)
+            start = offset + RECORD_HEADER.size
+            if start + size > len(data):
+                break
+            offset = start + size
+            if kind == INPUTS:
+                self.inputs[fingerprint] = json.loads(bytes(data[start:offset]))
+            elif kind == CODES:
+                grown = json.loads(bytes(data[start:offset]))
+                # Starting from 0 is a fresh session, anything else adds to the one before.
+                if any(code_start == 0 for code_start, _ in grown.values()) or not self.sessions:
+                    names = {}
+                else:
+                    names = dict(self.sessions[-1])
+                for table, (code_start, new_names) in grown.items():
+                    names[table] = names.get(table, [])[:code_start] + new_names
+                self.sessions.append(names)
+            else:
+                self.records.append(JournalRecord(kind, start, size, written, seed, fingerprint, count,
+                                                  len(self.sessions) - 1))
+
+    def close(self):
+        if not isinstance(self.data, bytes):
+            self.data.close()
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    @property
+    def litters(self) -> List[JournalRecord]:
+        return [record for record in self.records if record.kind == LITTER]
+
+    def last_litters(self, pups: Optional[int] = None) -> List[JournalRecord]:
+        """The most recent litters holding at least pups pups between them, or every litter if pups is None."""
+        litters = self.litters
+        if pups is None:
+            return litters
+        counted = 0
+        for start in range(len(litters) - 1, -1, -1):
+            counted += litters[start].count
+            if counted >= pups:
+                return litters[start:]
+        return litters
+
+    def translation(self, session: int, table: str) -> List[int]:
+        """Journal code to this process's code, for one table in one session."""
+        key = (session, table)
+        translation = self._translations.get(key)
+        if translation is None:
+            codes = JOURNAL_TABLES[table]
+            translation = self._translations[key] = [codes.code(name) for name in self.sessions[session][table]]
+        return translation
+
+    def _pups(self, record: JournalRecord) -> Iterator[Tuple[tuple, tuple, tuple, tuple]]:
+        """(traits, major mutations, genes, chimera genes) for each pup, still in the journal's codes."""
+        data = self.data
+        offset = record.offset
+        for _ in range(record.count):
+            header = PUP_HEADER.unpack_from(data, offset)
+            mutations, genes, chimera_genes = header[-3:]
+            offset += PUP_HEADER.size
+            codes = struct.unpack_from(f"<{mutations + genes + chimera_genes}H", data, offset)
+            offset += 2 * len(codes)
+            yield (header[:-3], codes[:mutations], codes[mutations:mutations + genes],
+                   codes[mutations + genes:])
+
+    def puppies(self, record: JournalRecord) -> List[Puppy]:
+        tables = [None if table == "health" else self.translation(record.session, table) for table in TRAIT_TABLES]
+        mutations = self.translation(record.session, "mutation")
+        genes = self.translation(record.session, "gene")
+
+        def gene(code):
+            return genes[code & ~GLEAM_FLAG] | (code & GLEAM_FLAG)
+        pups = []
+        for number, (traits, mutation_codes_, gene_codes_, chimera_gene_codes) in enumerate(self._pups(record)):
+            pup = Puppy(f"Pup {number + 1}")
+            for index, (code, table) in enumerate(zip(traits, tables)):
+                pup.traits[index] = code if table is None else table[code]
+            pup.major_mutation_codes = tuple(mutations[code] for code in mutation_codes_)
+            pup.gene_codes = tuple(gene(code) for code in gene_codes_)
+            pup.chimera_gene_codes = tuple(gene(code) for code in chimera_gene_codes)
+            pups.append(pup)
+        return pups
+
+    def vespers(self, record: JournalRecord) -> list:
+        from .random_vesper_rolling_logic import VesperTraits
+        data = self.data
+        offset = record.offset
+        end = record.offset + record.size
+        names = self.sessions[record.session]
+        vespers = []
+        while offset < end:
+            *codes, gene_count = VESPER_HEADER.unpack_from(data, offset)
+            offset += VESPER_HEADER.size
+            genes = struct.unpack_from(f"<{gene_count}H", data, offset)
+            offset += 2 * gene_count
+            coat, sex, colour, horns, tail, colour_mod = (names[table][code]
+                                                          for table, code in zip(VESPER_TABLES, codes))
+            gleamed = [index for index, code in enumerate(genes) if code & GLEAM_FLAG]
+            vespers.append(VesperTraits(coat, sex, colour, None if horns == "None" else horns,
+                                        None if tail == "Domestic" else tail,
+                                        None if colour_mod == "None" else colour_mod,
+                                        [names["gene"][code & ~GLEAM_FLAG] for code in genes],
+                                        "Gleam" if gleamed else None, gleamed[0] if gleamed else None))
+        return vespers
+
+    def replay(self, record: JournalRecord) -> bool:
+        """Rolls the record again from its seed and inputs, and says whether it came out exactly the same."""
+        from .ruleset import compile_ruleset
+        inputs = self.inputs[record.fingerprint]
+        ruleset = compile_ruleset(inputs["rules"])
+        if record.kind == LITTER:
+            roller = BreedingRoller([BreedingVesper(**inputs["sire"]), BreedingVesper(**inputs["dam"])],
+                                    inputs["modifiers"], password_valid=inputs["password_valid"],
+                                    rng=RollRandom(record.seed), compiled_tables=inputs["compiled_tables"],
+                                    ruleset=ruleset)
+            return [pup_key(pup) for pup in roller.roll_litter()] == [pup_key(pup) for pup in self.puppies(record)]
+
+        from .random_vesper_rolling_logic import vesper_roller_factory
+        roller = vesper_roller_factory(inputs["generator"], record.count, RollRandom(record.seed), ruleset)
+        if not hasattr(roller, "roll_traits"):
+            # Nothing was rolled that could have come out differently.
+            return True
+        return [roller.roll_traits() for _ in range(record.count)] == self.vespers(record)
+
+    def count(self, conditions: Dict, litters: List[JournalRecord]) -> int:
+        """How many pups in litters match every condition, as in TraitQuery.probability."""
+        from .trait_query import matcher
+        for field in conditions:
+            if field not in PUPPY_FIELDS:
+                raise ValueError(f"Can't count {field}, pick from {', '.join(PUPPY_FIELDS)}")
+        # Codes every gene in the journal, as reading its pups would, so the conditions can name discoveries from
+        # rulesets this process hasn't used.
+        for names in self.sessions:
+            for gene in names["gene"]:
+                gene_codes.code(gene)
+        matchers = {field: matcher(field, condition) for field, condition in conditions.items()}
+
+        matched = 0
+        session = None
+        for record in litters:
+            if record.session != session:
+                session = record.session
+                checks = self._code_checks(matchers, session)
+            for pup in self._pups(record):
+                traits, mutations, genes, chimera_genes = pup
+                lists = {"mutation": mutations, "gene": genes, "chimera_gene": chimera_genes}
+                if all(any(code in codes for code in lists[where]) if isinstance(where, str)
+                       else traits[where] in codes for where, codes in checks):
+                    matched += 1
+        return matched
+
+    def _code_checks(self, matchers: Dict, session: int) -> List[Tuple[object, frozenset]]:
+        """For each condition, where to look in a pup and the journal codes that match it in this session."""
+        names = self.sessions[session]
+        checks = []
+        for field, match in matchers.items():
+            where = PUPPY_FIELDS[field]
+            if field == "health":
+                codes = frozenset(code for code in range(len(health_codes)) if match(health_codes.name(code)))
+            elif isinstance(where, str):
+                table = "gene" if where == "chimera_gene" else where
+                suffix = JOURNAL_TABLES[table].suffix
+                values = [(code, name + suffix) for code, name in enumerate(names[table])]
+                if table == "gene":
+                    values += [(code | GLEAM_FLAG, f"{name} (Gleam)") for code, name in enumerate(names[table])]
+                codes = frozenset(code for code, value in values if match([value]))
+            else:
+                table = TRAIT_TABLES[where]
+                suffix = JOURNAL_TABLES[table].suffix
+                codes = frozenset(code for code, name in enumerate(names[table]) if match(name + suffix))
+            checks.append((where, codes))
+        return checks
+
+    def expected(self, conditions: Dict, litters: List[JournalRecord]) -> Tuple[float, float]:
+        """The number of pups in litters expected to match the conditions, and its variance."""
+        from .ruleset import compile_ruleset
+        from .trait_query import TraitQuery
+        expected = variance = 0.0
+        for record in litters:
+            probability = self._queries.get((record.fingerprint, repr(conditions)))
+            if probability is None:
+                inputs = self.inputs[record.fingerprint]
+                query = TraitQuery(BreedingVesper(**inputs["sire"]), BreedingVesper(**inputs["dam"]),
+                                   inputs["modifiers"], inputs["password_valid"], compile_ruleset(inputs["rules"]))
+                probability = self._queries[(record.fingerprint, repr(conditions))] = \
+                    query.probability(conditions, rng=RollRandom(0)).probability
+            expected += record.count * probability
+            variance += record.count * probability * (1 - probability)
+        return expected, variance
+
+    def compare(self, conditions: Dict, pups: Optional[int] = None) -> Comparison:
+        """Observed against expected matches for the conditions over the last pups pups (or all of them)."""
+        litters = self.last_litters(pups)
+        observed = self.count(conditions, litters)
+        expected, variance = self.expected(conditions, litters)
+        z = (observed - expected) / variance ** 0.5 if variance else 0.0
+        return Comparison(sum(record.count for record in litters), len(litters), observed, expected, z)
+
+
+def pup_key(pup: Puppy) -> tuple:
+    return (tuple(pup.traits), pup.major_mutation_codes, pup.gene_codes, pup.chimera_gene_codes)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m genos.roll_journal", description=__doc__.splitlines()[0])
+    parser.add_argument("journal", help="journal file written by RollJournal")
+    parser.add_argument("--replay", type=int, action="append", default=[],
+                        help="roll record number N again and check it matches, can be given more than once")
+    parser.add_argument("--last", type=int, help="only look at the most recent litters holding this many pups")
+    parser.add_argument("--where", action="append", default=[],
+                        help="compare how many pups have field=value against how many should, e.g. genes=Stardust")
+    args = parser.parse_args(argv)
+
+    with JournalReader(args.journal) as reader:
+        summary = {"records": len(reader.records), "litters": len(reader.litters),
+                   "pups": sum(record.count for record in reader.litters), "pairings": len(reader.inputs)}
+        sys.stdout.write(json.dumps(summary) + "\n")
+        for number in args.replay:
+            record = reader.records[number]
+            result = {"record": number, "seed": record.seed, "matches": reader.replay(record)}
+            sys.stdout.write(json.dumps(result) + "\n")
+        if args.where:
+            conditions = {}
+            for condition in args.where:
+                field, separator, value = condition.partition("=")
+                if not separator:
+                    parser.error(f"Conditions look like field=value, not {condition}")
+                conditions.setdefault(field.strip(), []).append(value.strip())
+            try:
+                comparison = reader.compare(conditions, args.last)
+            except ValueError as error:
+                parser.error(str(error))
+            sys.stdout.write(json.dumps(comparison._asdict()) + "\n")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,352 @@
+import os
+import time
+from functools import cached_property
+from threading import Lock
+from types import MappingProxyType
+from typing import Dict, Mapping, NamedTuple, Optional, Tuple
+
+from .genes import (
+    COMMON_PASS_RATE, MANED_PASS_RATE, MYTHIC_PASS_RATE, RARE_PASS_RATE, UNCOMMON_PASS_RATE, Rarity, TailDetails,
+    build_tail_index, common_genes, gene_rarity_index, genetic_discovery_genes, health_conditions, tail_families,
+    uncommon_genes,
+)
+
+# Compiled rulesets kept by content, so switching between a handful of event rulesets never recompiles.
+COMPILED_CACHE_SIZE = 64
+# How often a RulesetFile looks at its file's modification time.
+RELOAD_CHECK_SECONDS = 5.0
+
+RARITY_NAMES = {rarity.name.lower(): rarity for rarity in Rarity if rarity != Rarity.DEFAULT}
+
+# The rules as they've always been. A ruleset file only needs the values it changes.
+DEFAULT_RULES = {
+    "pass_rates": {
+        "common": COMMON_PASS_RATE,
+        "uncommon": UNCOMMON_PASS_RATE,
+        "maned": MANED_PASS_RATE,
+        "rare": RARE_PASS_RATE,
+        "mythic": MYTHIC_PASS_RATE,
+        # Added to every pass rate for a bonded pair
+        "bonded_boost": 5,
+    },
+    "tail_families": {family: list(tails) for family, tails in tail_families.items()},
+    "genetic_discovery": [
+        {"parents": list(parents), "gene": gene, "rarity": rarity.name.lower()}
+        for parents, (gene, rarity) in genetic_discovery_genes.items()
+    ],
+    # [highest d100 roll, pups], checked in order
+    "litter_sizes": {
+        "normal": [[10, 4], [20, 3], [60, 2], [100, 1]],
+        "somnis": [[10, 6], [20, 5], [30, 4], [70, 3], [100, 2]],
+        "spring": [3, 6],
+        "extra_pup_chance": {"Alpha": 10, "Bonded": 10},
+    },
+    "health": {
+        "virus_chance": 50,
+        "bonded_virus_reduction": 20,
+        # Chance of each condition for one shared ancestor
+        "inbred_chances": {"Stillborn": 80, "Sterile": 80, "Blind": 80, "Deaf": 80, "Dystonia": 60,
+                           "Hemophilia": 60},
+        "inbred_chance_per_ancestor": 5,
+    },
+    "random_vespers": {
+        # [highest d100 roll, mythic genes, rare genes], checked in order
+        "rarity_ladder": [[5, 1, 1], [10, 1, 0], [20, 0, 2], [35, 0, 1]],
+        "rare_coat_chance": 15,
+        "uncommon_coat_chance": 25,
+        "uncommon_tail_chance": 25,
+        "uncommon_horns_chance": 25,
+        "uncommon_colour_chance": 25,
+        "uncommon_gene_chance": 25,
+        "gene_count": [2, 4],
+    },
+}
+
+
+class Ruleset(NamedTuple):
+    """A validated, compiled set of breeding and random vesper rules. Read-only, and safe to share between threads."""
+    common_pass_rate: int
+    uncommon_pass_rate: int
+    maned_pass_rate: int
+    rare_pass_rate: int
+    mythic_pass_rate: int
+    bonded_gene_boost: int
+    tail_families: Mapping[str, Tuple[str, ...]]
+    tail_index: Mapping[str, TailDetails]
+    genetic_discovery_genes: Mapping[Tuple[str, str], Tuple[str, Rarity]]
+    litter_ladder: Tuple[Tuple[int, int], ...]
+    somnis_litter_ladder: Tuple[Tuple[int, int], ...]
+    spring_litter_range: Tuple[int, int]
+    extra_pup_chances: Mapping[str, int]
+    virus_chance: int
+    bonded_virus_reduction: int
+    # In health_conditions order
+    inbred_chances: Tuple[int, ...]
+    inbred_chance_per_ancestor: int
+    rarity_ladder: Tuple[Tuple[int, int, int], ...]
+    rare_coat_chance: int
+    uncommon_coat_chance: int
+    uncommon_tail_chance: int
+    uncommon_horns_chance: int
+    uncommon_colour_chance: int
+    uncommon_gene_chance: int
+    gene_count_range: Tuple[int, int]
+    # The full rules this was compiled from, as canonical JSON, and a hash of them for cache keys ("default" for
+    # DEFAULT_RULESET)
+    rules: str
+    fingerprint: str
+
+    def __reduce__(self):
+        # Pickled as its rules, so worker processes recompile it (once each, through the cache) rather than
+        # copying every table.
+        import json
+        return compile_ruleset, (json.loads(self.rules),)
+
+    def litter_size(self, cub_rng: int, somnis: bool) -> int:
+        for highest_roll, num_cubs in (self.somnis_litter_ladder if somnis else self.litter_ladder):
+            if cub_rng <= highest_roll:
+                return num_cubs
+        return 0
+
+
+_compiled_rulesets: Dict[str, Ruleset] = {}
+_compiled_lock = Lock()
+
+
+def compile_ruleset(rules: Optional[Dict] = None) -> Ruleset:
+    """Validates rules (merged over DEFAULT_RULES section by section) and compiles them, or returns the cached copy."""
+    if not rules:
+        return DEFAULT_RULESET
+    # Only needed once rules are loaded, see DefaultRuleset.
+    import hashlib
+    import json
+    merged = merge_rules(rules)
+    canonical = json.dumps(merged, sort_keys=True)
+    if canonical == DEFAULT_RULESET.rules:
+        return DEFAULT_RULESET
+    fingerprint = hashlib.sha256(canonical.encode()).hexdigest()
+    with _compiled_lock:
+        ruleset = _compiled_rulesets.get(fingerprint)
+    if ruleset is not None:
+        return ruleset
+
+    ruleset = _compile(merged, canonical, fingerprint)
+    with _compiled_lock:
+        if len(_compiled_rulesets) >= COMPILED_CACHE_SIZE:
+            _compiled_rulesets.pop(next(iter(_compiled_rulesets)))
+        _compiled_rulesets[fingerprint] = ruleset
+    return ruleset
+
+
+def merge_rules(rules: Dict) -> Dict:
+    import copy
+    merged = copy.deepcopy(DEFAULT_RULES)
+    for section, values in rules.items():
+        if section not in merged:
+            raise ValueError(f"Unknown ruleset section {section}")
+        if isinstance(merged[section], dict) and section != "tail_families":
+            if not isinstance(values, dict):
+                raise ValueError(f"Ruleset section {section} should be a table of values")
+            for key, value in values.items():
+                if key not in merged[section]:
+                    raise ValueError(f"Unknown rule {section}.{key}")
+                merged[section][key] = value
+        else:
+            merged[section] = copy.deepcopy(values)
+    return merged
+
+
+def _compile(rules: Dict, canonical: str, fingerprint: str) -> Ruleset:
+    pass_rates = rules["pass_rates"]
+    for name, rate in pass_rates.items():
+        _check_chance(f"pass_rates.{name}", rate)
+
+    tail_families = {family: tuple(tails) for family, tails in rules["tail_families"].items()}
+    for family_name, family in tail_families.items():
+        if len(family) != 4:
+            raise ValueError(f"The {family_name} tail family should have a mythic, rare, uncommon and common tail")
+    tail_index = build_tail_index(tail_families)
+
+    discovery = {}
+    for entry in rules["genetic_discovery"]:
+        one, two = entry["parents"]
+        gene = entry["gene"]
+        for parent in (one, two):
+            if parent not in gene_rarity_index:
+                raise ValueError(f"Genetic discovery parent {parent} isn't a known gene")
+        if entry["rarity"] not in RARITY_NAMES:
+            raise ValueError(f"Genetic discovery gene {gene} has unknown rarity {entry['rarity']}")
+        if (one, two) in discovery or (two, one) in discovery:
+            raise ValueError(f"Genetic discovery pair {one} and {two} is listed twice")
+        discovery[(one, two)] = (gene, RARITY_NAMES[entry["rarity"]])
+
+    litters = rules["litter_sizes"]
+    litter_ladder = _ladder("litter_sizes.normal", litters["normal"])
+    somnis_litter_ladder = _ladder("litter_sizes.somnis", litters["somnis"])
+    spring_low, spring_high = litters["spring"]
+    if not 0 < spring_low <= spring_high:
+        raise ValueError("litter_sizes.spring should be [fewest, most] pups")
+    for modifier, extra_chance in litters["extra_pup_chance"].items():
+        if modifier not in ["Alpha", "Bonded"]:
+            raise ValueError(f"Only Alpha and Bonded can add an extra pup, not {modifier}")
+        _check_chance(f"litter_sizes.extra_pup_chance.{modifier}", extra_chance)
+
+    health = rules["health"]
+    for name in ["virus_chance", "bonded_virus_reduction", "inbred_chance_per_ancestor"]:
+        _check_chance(f"health.{name}", health[name])
+    if set(health["inbred_chances"]) != set(health_conditions):
+        raise ValueError(f"health.inbred_chances needs a chance for each of {', '.join(health_conditions)}")
+    for condition, condition_chance in health["inbred_chances"].items():
+        _check_chance(f"health.inbred_chances.{condition}", condition_chance)
+
+    vespers = rules["random_vespers"]
+    rarity_ladder = tuple(tuple(step) for step in vespers["rarity_ladder"])
+    _check_ascending("random_vespers.rarity_ladder", [step[0] for step in rarity_ladder])
+    for highest_roll, mythic, rare in rarity_ladder:
+        # MaxRarityVesper has room for one mythic trait, and a rare gene plus a rare abnormality
+        if mythic not in [0, 1] or rare not in [0, 1, 2]:
+            raise ValueError("random_vespers.rarity_ladder steps give at most 1 mythic and 2 rare traits")
+    for name in ["rare_coat_chance", "uncommon_coat_chance", "uncommon_tail_chance", "uncommon_horns_chance",
+                 "uncommon_colour_chance", "uncommon_gene_chance"]:
+        _check_chance(f"random_vespers.{name}", vespers[name])
+    if vespers["rare_coat_chance"] + vespers["uncommon_coat_chance"] > 100:
+        raise ValueError("random_vespers rare and uncommon coat chances add up to more than 100")
+    fewest_genes, most_genes = vespers["gene_count"]
+    if not 1 <= fewest_genes <= most_genes:
+        raise ValueError("random_vespers.gene_count should be [fewest, most] genes, at least 1")
+    # A vesper's genes are all different, so there have to be enough that can be drawn. A chance of 100 or 0 leaves
+    # only the uncommon or only the common genes.
+    drawable_genes = ((len(uncommon_genes) if vespers["uncommon_gene_chance"] > 0 else 0) +
+                      (len(common_genes) if vespers["uncommon_gene_chance"] < 100 else 0))
+    if most_genes > drawable_genes:
+        raise ValueError(f"random_vespers.gene_count can be at most {drawable_genes} genes with an "
+                         f"uncommon_gene_chance of {vespers['uncommon_gene_chance']}")
+
+    return Ruleset(
+        common_pass_rate=pass_rates["common"],
+        uncommon_pass_rate=pass_rates["uncommon"],
+        maned_pass_rate=pass_rates["maned"],
+        rare_pass_rate=pass_rates["rare"],
+        mythic_pass_rate=pass_rates["mythic"],
+        bonded_gene_boost=pass_rates["bonded_boost"],
+        tail_families=MappingProxyType(tail_families),
+        tail_index=tail_index,
+        genetic_discovery_genes=MappingProxyType(discovery),
+        litter_ladder=litter_ladder,
+        somnis_litter_ladder=somnis_litter_ladder,
+        spring_litter_range=(spring_low, spring_high),
+        extra_pup_chances=MappingProxyType(dict(litters["extra_pup_chance"])),
+        virus_chance=health["virus_chance"],
+        bonded_virus_reduction=health["bonded_virus_reduction"],
+        inbred_chances=tuple(health["inbred_chances"][condition] for condition in health_conditions),
+        inbred_chance_per_ancestor=health["inbred_chance_per_ancestor"],
+        rarity_ladder=rarity_ladder,
+        rare_coat_chance=vespers["rare_coat_chance"],
+        uncommon_coat_chance=vespers["uncommon_coat_chance"],
+        uncommon_tail_chance=vespers["uncommon_tail_chance"],
+        uncommon_horns_chance=vespers["uncommon_horns_chance"],
+        uncommon_colour_chance=vespers["uncommon_colour_chance"],
+        uncommon_gene_chance=vespers["uncommon_gene_chance"],
+        gene_count_range=(fewest_genes, most_genes),
+        rules=canonical,
+        fingerprint=fingerprint,
+    )
+
+
+def _check_chance(name: str, value):
+    if not isinstance(value, int) or isinstance(value, bool) or not 0 <= value <= 100:
+        raise ValueError(f"{name} should be a whole number percentage, not {value!r}")
+
+
+def _check_ascending(name: str, rolls):
+    if any(later <= earlier for earlier, later in zip(rolls, rolls[1:])) or not all(0 < roll <= 100 for roll in rolls):
+        raise ValueError(f"{name} rolls should go up from 1 to at most 100")
+
+
+def _ladder(name: str, steps) -> Tuple[Tuple[int, int], ...]:
+    ladder = tuple((highest_roll, num_cubs) for highest_roll, num_cubs in steps)
+    _check_ascending(name, [highest_roll for highest_roll, _ in ladder])
+    if not ladder or ladder[-1][0] != 100:
+        raise ValueError(f"{name} should end at a roll of 100, so every roll gives a litter")
+    return ladder
+
+
+def load_ruleset(path: str) -> Ruleset:
+    """Reads and compiles a JSON or TOML ruleset file."""
+    if path.endswith(".toml"):
+        try:
+            import tomllib
+        except ImportError:
+            raise ValueError("TOML rulesets need Python 3.11 or later, use JSON instead")
+        with open(path, "rb") as ruleset_file:
+            rules = tomllib.load(ruleset_file)
+    else:
+        import json
+        with open(path) as ruleset_file:
+            rules = json.load(ruleset_file)
+    return compile_ruleset(rules)
+
+
+class RulesetFile:
+    """A ruleset file that's reloaded when it changes, without restarting anything.
+
+    The new rules are compiled before being swapped in with a single assignment, so readers always see one whole
+    ruleset. A file that doesn't validate leaves the previous rules in place, with the error in last_error.
+    """
+
+    def __init__(self, path: str, check_seconds: float = RELOAD_CHECK_SECONDS):
+        self.path = path
+        self.check_seconds = check_seconds
+        self.last_error: Optional[Exception] = None
+        self._modified = os.stat(path).st_mtime_ns
+        self._checked = time.monotonic()
+        self._ruleset = load_ruleset(path)
+        self._lock = Lock()
+
+    @property
+    def ruleset(self) -> Ruleset:
+        if time.monotonic() - self._checked >= self.check_seconds:
+            self.reload()
+        return self._ruleset
+
+    def reload(self, force=False) -> Ruleset:
+        with self._lock:
+            self._checked = time.monotonic()
+            try:
+                modified = os.stat(self.path).st_mtime_ns
+                if force or modified != self._modified:
+                    self._ruleset = load_ruleset(self.path)
+                    self._modified = modified
+                    self.last_error = None
+            except (OSError, ValueError, KeyError, TypeError) as error:
+                self.last_error = error
+        return self._ruleset
+
+
+class DefaultRuleset(Ruleset):
+    """DEFAULT_RULES compiled, with the canonical JSON only written out when something asks for it. Its fingerprint
+    is "default" rather than a hash, as compile_ruleset gives back this one for any rules that come to the defaults,
+    so importing this module and rolling with the defaults needs neither json nor hashlib."""
+
+    @cached_property
+    def rules(self) -> str:
+        import json
+        return json.dumps(DEFAULT_RULES, sort_keys=True)
+
+
+DEFAULT_RULESET = DefaultRuleset(*_compile(DEFAULT_RULES, "", "default"))
+_active_source: Optional[RulesetFile] = None
+
+
+def use_ruleset_file(path: Optional[str], check_seconds: float = RELOAD_CHECK_SECONDS):
+    """Makes rollers that aren't given a ruleset use this file, reloading it when it changes. None goes back to the
+    defaults."""
+    global _active_source
+    _active_source = RulesetFile(path, check_seconds) if path else None
+
+
+def get_active_ruleset() -> Ruleset:
+    source = _active_source
+    if source is None:
+        return DEFAULT_RULESET
+    return source.ruleset
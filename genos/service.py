@@ -0,0 +1,248 @@
+"""An asyncio JSON service for the breeding and random vesper rollers.
+
+Run with python -m genos.service --port 8080, then POST a roster record (see batch.Pairing.factory) to /breeding,
+or {"generator": "Max Rarity Based", "rolls": 10} to /random-vesper. Both take an optional "seed", and a random vesper
+request with "exact_report": true also gets the exact chance of every outcome.
+
+Plain litters take well under a millisecond, so they're rolled straight away on the event loop. Test mode and big
+random vesper batches go to a process pool, so the loop keeps serving everyone else while they run. Identical test
+requests that arrive while one is already running wait for its result rather than rolling it again. A client has
+read_timeout seconds to send each request, or its connection is closed.
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import traceback
+from typing import Awaitable, Callable, Dict, Optional, Tuple
+
+from .batch import Pairing, roll_pairing
+from .result_cache import pairing_fingerprint
+from .rng import RollRandom
+from .ruleset import get_active_ruleset, use_ruleset_file
+
+MAX_BODY_BYTES = 1 << 20
+# Seconds a client has to send a whole request, including waiting for it on a kept-alive connection.
+READ_TIMEOUT = 30
+# Random vesper batches up to this size are rolled on the event loop, bigger ones in the pool.
+INLINE_VESPER_ROLLS = 100
+MAX_VESPER_ROLLS = 10000
+MAX_TEST_ITERATIONS = 10000000
+
+STATUS_TEXT = {200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed", 413: "Payload Too Large",
+               500: "Internal Server Error"}
+
+
+class RollService:
+    """Rolls breeding and random vesper requests, sending the heavy ones to a process pool."""
+
+    def __init__(self, workers: Optional[int] = None, discovery_password: Optional[str] = None,
+                 read_timeout: float = READ_TIMEOUT):
+        # Process count for test mode, None for every core. The pool only starts with the first test request.
+        self.workers = workers
+        self.discovery_password = discovery_password
+        self.read_timeout = read_timeout
+        self._pool = None
+        self._in_flight: Dict[tuple, asyncio.Future] = {}
+        self.stats = {"requests": 0, "pooled": 0, "coalesced": 0, "errors": 0}
+
+    @property
+    def pool(self):
+        if self._pool is None:
+            import multiprocessing
+            from concurrent.futures import ProcessPoolExecutor
+            # Forked workers would inherit every open client socket and hold those connections open, so spawn them.
+            self._pool = ProcessPoolExecutor(max_workers=self.workers, mp_context=multiprocessing.get_context("spawn"))
+        return self._pool
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.shutdown(cancel_futures=True)
+            self._pool = None
+
+    async def roll_breeding(self, request: Dict) -> Dict:
+        password_valid = bool(self.discovery_password) and request.get("password") == self.discovery_password
+        ruleset = get_active_ruleset()
+        # Checked against the known traits before anything is rolled, so a made up name is a 400 and never gets a
+        # trait code of its own.
+        pairing = Pairing.factory(request, 1, password_valid, ruleset)
+        exact_test = bool(request.get("exact_test"))
+        is_test = exact_test or bool(request.get("test"))
+        test_iterations = request.get("test_iterations")
+        if test_iterations is not None:
+            test_iterations = int(test_iterations)
+            if not 0 < test_iterations <= MAX_TEST_ITERATIONS:
+                raise ValueError(f"test_iterations should be between 1 and {MAX_TEST_ITERATIONS}")
+        seed = request.get("seed")
+
+        if not is_test:
+            return roll_pairing((pairing, new_seed(seed), False, False, None, ruleset, False))
+
+        # An unseeded test is the same question however many people ask it, so they can share one answer, and the
+        # workers' test caches can answer it again later. A seeded one is rolled as asked so it repeats exactly.
+        key = ("breeding", pairing_fingerprint(pairing.sire, pairing.dam, pairing.modifiers), pairing.name,
+               password_valid, exact_test, test_iterations, seed, ruleset.fingerprint)
+        return await self.coalesce(key, lambda: self.run_in_pool(
+            roll_pairing, (pairing, new_seed(seed), True, exact_test, test_iterations, ruleset, seed is None)))
+
+    async def roll_random_vespers(self, request: Dict) -> Dict:
+        generator = request.get("generator", "Max Rarity Based")
+        rolls = int(request.get("rolls", 1))
+        if not 0 < rolls <= MAX_VESPER_ROLLS:
+            raise ValueError(f"rolls should be between 1 and {MAX_VESPER_ROLLS}")
+        job = (generator, rolls, new_seed(request.get("seed")), get_active_ruleset(), bool(request.get("exact_report")))
+        if rolls <= INLINE_VESPER_ROLLS:
+            return roll_random_vespers(job)
+        return await self.run_in_pool(roll_random_vespers, job)
+
+    async def run_in_pool(self, function: Callable, job) -> Dict:
+        self.stats["pooled"] += 1
+        return await asyncio.get_running_loop().run_in_executor(self.pool, function, job)
+
+    async def coalesce(self, key: tuple, start: Callable[[], Awaitable[Dict]]) -> Dict:
+        """Runs start() unless a request with the same key is already running, in which case waits for that one."""
+        future = self._in_flight.get(key)
+        if future is not None:
+            self.stats["coalesced"] += 1
+        else:
+            future = asyncio.ensure_future(start())
+            self._in_flight[key] = future
+            future.add_done_callback(lambda _: self._in_flight.pop(key, None))
+        # Shielded, so one client hanging up doesn't cancel the roll for everyone else waiting on it.
+        return await asyncio.shield(future)
+
+    async def dispatch(self, method: str, path: str, body: bytes) -> Tuple[int, Dict]:
+        self.stats["requests"] += 1
+        path = path.split("?")[0].rstrip("/") or "/"
+        if path == "/health":
+            return 200, {"status": "ok", **self.stats}
+        handler = {"/breeding": self.roll_breeding, "/random-vesper": self.roll_random_vespers}.get(path)
+        if handler is None:
+            return 404, {"error": f"No such endpoint {path}"}
+        if method != "POST":
+            return 405, {"error": f"{path} only takes POST"}
+
+        try:
+            request = json.loads(body or b"{}")
+            if not isinstance(request, dict):
+                raise ValueError("The request should be a JSON object")
+            return 200, await handler(request)
+        except (ValueError, KeyError, TypeError) as error:
+            self.stats["errors"] += 1
+            return 400, {"error": f"{type(error).__name__}: {error}"}
+        except Exception:
+            self.stats["errors"] += 1
+            traceback.print_exc()
+            return 500, {"error": "Something went wrong rolling that"}
+
+    async def handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        """Serves HTTP/1.1 requests on one connection until the client closes it, asks not to keep it alive or takes
+        longer than read_timeout to send a request."""
+        loop = asyncio.get_running_loop()
+        try:
+            while True:
+                # One deadline for the whole request, so a client can't keep the connection by trickling it in either.
+                deadline = loop.time() + self.read_timeout
+                request_line = await read_by(reader.readline(), deadline)
+                if not request_line.strip():
+                    break
+                try:
+                    method, path, version = request_line.decode("latin-1").split()
+                except ValueError:
+                    writer.write(encode_response(400, {"error": "Malformed request line"}, False))
+                    break
+
+                headers = {}
+                while True:
+                    line = await read_by(reader.readline(), deadline)
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+
+                length = int(headers.get("content-length") or 0)
+                if length > MAX_BODY_BYTES:
+                    writer.write(encode_response(413, {"error": "Request too large"}, False))
+                    break
+                body = await read_by(reader.readexactly(length), deadline) if length else b""
+
+                status, response = await self.dispatch(method, path, body)
+                connection = headers.get("connection", "").lower()
+                keep_alive = connection == "keep-alive" or (version == "HTTP/1.1" and connection != "close")
+                writer.write(encode_response(status, response, keep_alive))
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError, asyncio.TimeoutError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+
+async def read_by(reading: Awaitable[bytes], deadline: float) -> bytes:
+    """Awaits a StreamReader read, raising asyncio.TimeoutError if it hasn't finished by the loop time deadline."""
+    return await asyncio.wait_for(reading, max(deadline - asyncio.get_running_loop().time(), 0))
+
+
+def new_seed(seed) -> int:
+    # Every response carries its seed, so any roll can be repeated.
+    if seed is None:
+        return RollRandom().seed
+    return int(seed)
+
+
+def roll_random_vespers(job) -> Dict:
+    from .random_vesper_rolling_logic import vesper_roller_factory
+    generator, rolls, seed, ruleset, exact_report = job
+    roller = vesper_roller_factory(generator, rolls, RollRandom(seed), ruleset)
+    if roller is None:
+        raise ValueError(f"Unknown generator {generator}")
+    response = {"generator": generator, "seed": seed, "results": roller.get_results()}
+    if exact_report:
+        if not hasattr(roller, "get_exact_report"):
+            raise ValueError(f"{generator} has no exact report")
+        response["report"] = roller.get_exact_report()
+    return response
+
+
+def encode_response(status: int, response: Dict, keep_alive: bool) -> bytes:
+    body = json.dumps(response).encode()
+    head = (f"HTTP/1.1 {status} {STATUS_TEXT[status]}\r\n"
+            f"Content-Type: application/json\r\n"
+            f"Content-Length: {len(body)}\r\n"
+            f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n")
+    return head.encode("latin-1") + body
+
+
+async def serve(host: str, port: int, service: RollService):
+    server = await asyncio.start_server(service.handle_connection, host, port)
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        service.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m genos.service", description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--workers", type=int, help="processes for test mode, defaults to every core")
+    parser.add_argument("--ruleset", help="JSON or TOML ruleset to roll with, reloaded whenever it changes")
+    parser.add_argument("--read-timeout", type=float, default=READ_TIMEOUT,
+                        help="seconds a client has to send each request before its connection is closed")
+    args = parser.parse_args(argv)
+
+    if args.ruleset:
+        use_ruleset_file(args.ruleset)
+    # Read from the environment so it never shows up in the process list.
+    service = RollService(args.workers, os.environ.get("GENOS_DISCOVERY_PASSWORD"), args.read_timeout)
+    try:
+        asyncio.run(serve(args.host, args.port, service))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
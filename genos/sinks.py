@@ -0,0 +1,32 @@
+import csv
+import json
+from typing import Dict, Iterable, List, TextIO
+
+# Rows are flushed in batches once the first one is out, so a long run shows up straight away without a flush per row.
+FLUSH_EVERY = 1000
+
+
+def write_jsonl(rows: Iterable[Dict], output: TextIO, flush_every: int = FLUSH_EVERY) -> int:
+    """Writes one JSON object per line as the rows come in. Returns how many were written."""
+    written = 0
+    for row in rows:
+        output.write(json.dumps(row) + "\n")
+        written += 1
+        if written == 1 or written % flush_every == 0:
+            output.flush()
+    output.flush()
+    return written
+
+
+def write_csv(rows: Iterable[Dict], output: TextIO, fieldnames: List[str], flush_every: int = FLUSH_EVERY) -> int:
+    """Writes a header then one row per dict as the rows come in. Returns how many were written."""
+    writer = csv.DictWriter(output, fieldnames=fieldnames)
+    writer.writeheader()
+    written = 0
+    for row in rows:
+        writer.writerow(row)
+        written += 1
+        if written == 1 or written % flush_every == 0:
+            output.flush()
+    output.flush()
+    return written
@@ -0,0 +1,289 @@
+"""The chance a pup from a pairing matches a set of conditions on its Puppy fields, all at once.
+
+e.g. TraitQuery(sire, dam, modifiers).probability({"health": "Healthy", "sex": "Female", "base": "Maned",
+"genes": "Stardust"}) is the chance of a healthy, female, maned pup carrying Stardust, Gleam or not.
+
+get_puppy rolls most traits independently, so their chances multiply, and each comes exactly from
+BreedingDistributions. The traits that depend on each other are worked out together: subspecies with base (the pygmy
+fix), and chimera status with the chimera colour and genes. Those are exact too, unless a genes condition is more
+than "has this gene", in which case that group alone is estimated by rolling it.
+"""
+from collections import defaultdict
+from itertools import product
+from math import sqrt
+from typing import Callable, Collection, Dict, NamedTuple, Optional, Union
+
+from .breeding_distributions import BreedingDistributions
+from .breeding_logic import BreedingRoller, BreedingVesper, TEST_ITERATIONS
+from .genes import (
+    BICOLOUR_CHIMERA, FULL_CHIMERA, all_mutations, base_codes, chimera_codes, colour_codes, gene_codes, health_codes,
+    horn_codes, minor_mutation_codes, modifier_codes, mutation_codes, sex_codes, subspecies_codes, tail_codes,
+)
+from .result_cache import ResultCache, pairing_fingerprint
+from .rng import RollRandom
+from .ruleset import Ruleset, get_active_ruleset
+
+# Rolls used to estimate a genes condition that can't be worked out exactly.
+QUERY_SAMPLES = TEST_ITERATIONS
+# Queries kept by get_trait_query, so a pairing's gene distributions are only worked out once.
+QUERY_CACHE_SIZE = 256
+QUERY_CACHE_SECONDS = 600.0
+
+# Puppy fields that hold a list, where a value condition means the pup has one of the values.
+LIST_FIELDS = ["major_mutations", "genes", "chimera_genes"]
+QUERY_FIELDS = ["health", "sex", "colour", "chimera_colour", "horns", "tail", "base", "modifier", "subspecies",
+                "minor_mutation", "chimera_status"] + LIST_FIELDS
+CHIMERA_FIELDS = ["chimera_status", "chimera_colour", "genes", "chimera_genes"]
+# The code table each field's values are from, which value conditions are checked against.
+FIELD_CODES = {
+    "health": health_codes, "sex": sex_codes, "colour": colour_codes, "chimera_colour": colour_codes,
+    "horns": horn_codes, "tail": tail_codes, "base": base_codes, "modifier": modifier_codes,
+    "subspecies": subspecies_codes, "minor_mutation": minor_mutation_codes, "chimera_status": chimera_codes,
+    "major_mutations": mutation_codes, "genes": gene_codes, "chimera_genes": gene_codes,
+}
+
+# A value, any of several values, or a function of the field's value that says whether it matches.
+Condition = Union[str, Collection[str], Callable[[object], bool]]
+
+
+class QueryResult(NamedTuple):
+    probability: float
+    # False if part of it was estimated, in which case standard_error says how far off it's likely to be.
+    exact: bool
+    samples: int = 0
+    standard_error: float = 0.0
+
+
+class TraitQuery:
+    """Answers probability queries about one pup from a pairing. Distributions are kept between queries.
+
+    The litter's gender booster is averaged over, but the spring blessing cub's health fix isn't, as that's one
+    particular pup rather than any pup.
+    """
+
+    def __init__(self, sire: BreedingVesper, dam: BreedingVesper, modifiers: Dict, password_valid=False,
+                 ruleset: Ruleset = None):
+        self.roller = BreedingRoller([sire, dam], modifiers, password_valid=password_valid, ruleset=ruleset)
+        self.roller.gene_boost = self.roller.get_gene_boost()
+        self.distributions = BreedingDistributions(self.roller)
+        self._field_distributions: Dict[str, Dict] = {}
+        self._gene_chances: Dict[tuple, float] = {}
+
+    def probability(self, conditions: Dict[str, Condition], samples: int = QUERY_SAMPLES,
+                    rng: RollRandom = None) -> QueryResult:
+        matchers = {}
+        discoveries = [gene for gene, _ in self.roller.ruleset.genetic_discovery_genes.values()]
+        for field, condition in conditions.items():
+            if field not in QUERY_FIELDS:
+                raise ValueError(f"Can't query {field}, pick from {', '.join(QUERY_FIELDS)}")
+            matchers[field] = matcher(field, condition, discoveries)
+
+        probability = 1.0
+        for field, match in matchers.items():
+            if field in CHIMERA_FIELDS or field in ["base", "subspecies"]:
+                continue
+            probability *= sum(chance for value, chance in self.field_distribution(field).items() if match(value))
+        if "base" in matchers or "subspecies" in matchers:
+            probability *= self.base_and_subspecies(matchers.get("base"), matchers.get("subspecies"))
+
+        chimera_matchers = {field: matchers[field] for field in CHIMERA_FIELDS if field in matchers}
+        if not chimera_matchers:
+            return QueryResult(probability, True)
+        exact_genes = all(exact_gene(conditions[field]) is not None
+                          for field in ["genes", "chimera_genes"] if field in conditions)
+        if exact_genes:
+            return QueryResult(probability * self.chimera_group(chimera_matchers, conditions), True)
+
+        estimate = self.sample_chimera_group(chimera_matchers, samples, rng)
+        return QueryResult(probability * estimate, False, samples,
+                           probability * sqrt(estimate * (1 - estimate) / samples))
+
+    def field_distribution(self, field: str) -> Dict:
+        distribution = self._field_distributions.get(field)
+        if distribution is None:
+            distribution = self._field_distributions[field] = self._work_out(field)
+        return distribution
+
+    def _work_out(self, field: str) -> Dict:
+        distributions = self.distributions
+        if field == "sex":
+            return distributions.sex_before_boosters()
+        if field == "tail":
+            return {tail_codes.name(tail_codes.code(tail)): chance for tail, chance in distributions.tail().items()}
+        if field == "major_mutations":
+            return self.major_mutations()
+        if field == "chimera_status":
+            return distributions.chimera()
+        return getattr(distributions, field)()
+
+    def major_mutations(self) -> Dict[tuple, float]:
+        """Every list of major mutations a pup can have, in get_major_mutations order, and its chance."""
+        parent_outcomes = []
+        for mutation in [self.roller.sire.mutation, self.roller.dam.mutation]:
+            if mutation == "None":
+                parent_outcomes.append([((), 1.0)])
+            else:
+                parent_outcomes.append([((mutation,), 0.03), ((), 0.97)])
+        random_outcomes = [((mutation,), 0.01 / len(all_mutations)) for mutation in all_mutations] + [((), 0.99)]
+
+        distribution = defaultdict(float)
+        for (sire, p_sire), (dam, p_dam), (spontaneous, p_spontaneous) in product(*parent_outcomes, random_outcomes):
+            mutations = tuple(mutation_codes.name(mutation_codes.code(mutation))
+                              for mutation in dict.fromkeys(sire + dam + spontaneous))
+            distribution[mutations] += p_sire * p_dam * p_spontaneous
+        return dict(distribution)
+
+    def base_and_subspecies(self, base_match, subspecies_match) -> float:
+        probability = 0.0
+        for subspecies, p_subspecies in self.distributions.subspecies().items():
+            if subspecies_match is not None and not subspecies_match(subspecies):
+                continue
+            if base_match is None:
+                probability += p_subspecies
+                continue
+            bases = self._field_distributions.get(("base", subspecies))
+            if bases is None:
+                bases = self._field_distributions[("base", subspecies)] = \
+                    self.distributions.base_given_subspecies(subspecies)
+            probability += p_subspecies * sum(chance for base, chance in bases.items() if base_match(base))
+        return probability
+
+    def chimera_group(self, matchers: Dict[str, Callable], conditions: Dict[str, Condition]) -> float:
+        """The exact chance of the chimera status, chimera colour and "has this gene" conditions together."""
+        status_match = matchers.get("chimera_status")
+        colour_match = matchers.get("chimera_colour")
+        probability = 0.0
+        for status, p_status in self.field_distribution("chimera_status").items():
+            if status_match is not None and not status_match(status):
+                continue
+            chimera = status in [BICOLOUR_CHIMERA, FULL_CHIMERA]
+            if colour_match is not None:
+                if chimera:
+                    p_status *= sum(chance for colour, chance in self.field_distribution("colour").items()
+                                    if colour_match(colour))
+                # Only chimeras roll a second colour, the rest keep the default.
+                elif not colour_match(colour_codes.name(0)):
+                    continue
+
+            max_genes = 5 if status == FULL_CHIMERA else 10
+            if "genes" in conditions:
+                p_status *= self.gene_chance(max_genes, exact_gene(conditions["genes"]))
+            if "chimera_genes" in conditions:
+                if status == FULL_CHIMERA:
+                    # A full chimera's second set is a separate get_genes(5) call.
+                    p_status *= self.gene_chance(5, exact_gene(conditions["chimera_genes"]))
+                elif not matchers["chimera_genes"](()):
+                    continue
+            probability += p_status
+        return probability
+
+    def gene_chance(self, max_genes: int, gene: str) -> float:
+        """The chance a get_genes(max_genes) call shows gene, which counts with or without Gleam unless it says."""
+        key = (max_genes, gene)
+        probability = self._gene_chances.get(key)
+        if probability is None:
+            plain = gene[:-len(" (Gleam)")] if gene.endswith(" (Gleam)") else gene
+            expected = self.distributions.genes(max_genes, only=[plain]).expected
+            if gene == plain:
+                probability = expected.get(gene, 0) + expected.get(f"{gene} (Gleam)", 0)
+            else:
+                probability = expected.get(gene, 0)
+            self._gene_chances[key] = probability
+        return probability
+
+    def sample_chimera_group(self, matchers: Dict[str, Callable], samples: int, rng: RollRandom = None) -> float:
+        """Estimates the chimera group by rolling just the steps in it, samples times."""
+        roller = self.roller
+        roller.rng = rng if rng is not None else RollRandom()
+        status_match = matchers.get("chimera_status", lambda status: True)
+        colour_match = matchers.get("chimera_colour")
+        genes_match = matchers.get("genes")
+        chimera_genes_match = matchers.get("chimera_genes")
+        default_colour = colour_codes.name(0)
+
+        matched = 0
+        for _ in range(samples):
+            status = roller.get_chimera()
+            if not status_match(status):
+                continue
+            if colour_match is not None:
+                colour = roller.get_colour() if status in [BICOLOUR_CHIMERA, FULL_CHIMERA] else default_colour
+                if not colour_match(colour):
+                    continue
+            if status == FULL_CHIMERA:
+                genes = roller.get_genes(max=5)
+                chimera_genes = roller.get_genes(max=5)
+            else:
+                genes = roller.get_genes()
+                chimera_genes = ()
+            if genes_match is not None and not genes_match([gene_codes.name(gene) for gene in genes]):
+                continue
+            if chimera_genes_match is not None and \
+                    not chimera_genes_match([gene_codes.name(gene) for gene in chimera_genes]):
+                continue
+            matched += 1
+        return matched / samples
+
+
+def matcher(field: str, condition: Condition, known_genes: Collection[str] = ()) -> Callable[[object], bool]:
+    """Whether a value of field matches the condition. Raises ValueError for a value field never has, as that would
+    never match anything. known_genes are genes to accept that may not have codes yet, like a ruleset's discoveries."""
+    if callable(condition):
+        return condition
+    values = frozenset([condition] if isinstance(condition, str) else condition)
+    for value in values:
+        check_value(field, value, known_genes)
+    if field not in LIST_FIELDS:
+        return lambda value: value in values
+
+    def has_one(items) -> bool:
+        # Genes count whether Gleam attached to them or not, unless the condition names the Gleam one.
+        return any(item in values or (item.endswith(" (Gleam)") and item[:-len(" (Gleam)")] in values)
+                   for item in items)
+    return has_one
+
+
+def check_value(field: str, value: str, known_genes: Collection[str] = ()):
+    """Raises ValueError unless value is one field can have, written the way it is on a pup."""
+    codes = FIELD_CODES[field]
+    if codes is health_codes:
+        try:
+            # Conditions are in health_conditions order, as a pup's health is written.
+            known = health_codes.name(health_codes.code(value)) == value
+        except ValueError:
+            known = False
+    elif codes is gene_codes:
+        gene = value[:-len(" (Gleam)")] if value.endswith(" (Gleam)") else value
+        known = gene in gene_codes.codes or gene in known_genes
+    else:
+        suffix = codes.suffix
+        known = value.endswith(suffix) and value[:len(value) - len(suffix)] in codes.codes
+        if not known and value in codes.codes:
+            raise ValueError(f"{value} is written {value}{suffix} as a {field.replace('_', ' ')} value")
+    if not known:
+        raise ValueError(f"{value} isn't a {field.replace('_', ' ')} value")
+
+
+def exact_gene(condition: Condition) -> Optional[str]:
+    """The gene a genes condition asks for, if it's a single "has this gene" that can be worked out exactly."""
+    if isinstance(condition, str):
+        return condition
+    if callable(condition):
+        return None
+    values = list(condition)
+    return values[0] if len(values) == 1 else None
+
+
+_query_cache = ResultCache(QUERY_CACHE_SIZE, QUERY_CACHE_SECONDS)
+
+
+def get_trait_query(sire: BreedingVesper, dam: BreedingVesper, modifiers: Dict, password_valid=False,
+                    ruleset: Ruleset = None) -> TraitQuery:
+    """A TraitQuery for the pairing, shared with anyone who asked about the same parents recently."""
+    ruleset = ruleset if ruleset is not None else get_active_ruleset()
+    key = (pairing_fingerprint(sire, dam, modifiers), password_valid, ruleset.fingerprint)
+    query = _query_cache.get(key)
+    if query is None:
+        query = TraitQuery(sire, dam, modifiers, password_valid, ruleset)
+        _query_cache.put(key, query)
+    return query
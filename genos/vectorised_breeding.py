@@ -0,0 +1,448 @@
+import numpy as np
+from typing import Dict, List, Optional, Tuple
+
+from .genes import (
+    BICOLOUR_CHIMERA, FULL_CHIMERA, GLEAM_FLAG, Rarity, all_bases, all_chimeras, all_horns, all_modifiers,
+    all_mutations, all_tails, base_codes, chimera_codes, colour_codes, colour_index, colour_modifier_base_index,
+    freecolour_genes, gene_codes, health_codes, horn_codes, minor_mutation_codes, minor_mutations, modifier_codes,
+    mutation_codes, sex_codes, subspecies_codes, tail_codes,
+)
+from .histogram import TraitAccumulator
+
+# Pups are rolled in chunks so a few million of them don't need a few million rows of gene flags at once.
+CHUNK_SIZE = 1 << 18
+
+CHIMERA_VALUES = ["None", BICOLOUR_CHIMERA, FULL_CHIMERA]
+RARITY_ORDER = [Rarity.COMMON, Rarity.UNCOMMON, Rarity.RARE, Rarity.MYTHIC]
+
+
+# Summing booleans goes through int64 a row at a time, which is slow for roll_genes' flags. These don't.
+def genes_per_pup(flags: np.ndarray) -> np.ndarray:
+    """How many of the (genes, pups) flags are set for each pup."""
+    return flags.view(np.uint8).sum(axis=0, dtype=np.int16)
+
+
+def pups_per_gene(flags: np.ndarray) -> np.ndarray:
+    """How many of the (genes, pups) flags are set for each gene."""
+    return np.array([np.count_nonzero(gene_flags) for gene_flags in flags], dtype=np.int64)
+
+
+class VectorisedBreedingEngine:
+    """Rolls test pups for a BreedingRoller as NumPy arrays, one column per trait, instead of one pup at a time."""
+
+    def __init__(self, roller, seed=None):
+        self.roller = roller
+        self.sire = roller.sire
+        self.dam = roller.dam
+        self.modifiers = roller.modifiers
+        self.gene_boost = roller.gene_boost
+        self.rng = np.random.default_rng(seed)
+        self.health_names = self._health_names()
+
+        self._compile_colours()
+        self._compile_genes()
+        self._compile_tails()
+        self._compile_mutations()
+
+    def run(self, iterations: int, accumulator: TraitAccumulator = None) -> TraitAccumulator:
+        """Counts litter sizes and every trait perform_test reports on into accumulator, a chunk at a time."""
+        if accumulator is None:
+            from .breeding_logic import new_test_accumulator
+            accumulator = new_test_accumulator()
+        trait_codes = self.trait_codes()
+        remaining = iterations
+        while remaining > 0:
+            n = min(remaining, CHUNK_SIZE)
+            remaining -= n
+            accumulator["Number of pups"].add_counts(np.bincount(self.roll_number_cubs(n)).tolist())
+            for trait, chunk_counts in self.roll_traits(n).items():
+                accumulator[trait].add_counts(chunk_counts.tolist(), trait_codes[trait])
+            accumulator.items += n
+        return accumulator
+
+    def trait_codes(self) -> Dict[str, Optional[List[Optional[int]]]]:
+        """The code in genes' tables for each index roll_traits counts by, or None where the index is the value."""
+        return {
+            "Health": None,
+            "Sex": [sex_codes.code(sex) for sex in ["Male", "Female"]],
+            "Base colours": [colour_codes.code(colour) for colour in self.colour_names],
+            "Horns": [horn_codes.code(horns) for horns in self.horn_names],
+            "Tails": [tail_codes.code(tail) for tail in self.tail_names],
+            "Coat Type": [base_codes.code(base) for base in self.base_names],
+            "Modifier": [modifier_codes.code(modifier) for modifier in self.modifier_names],
+            "Subspecies": [subspecies_codes.code(subspecies) for subspecies in ["None", "Bat Eared Pygmy Vesper"]],
+            "Major Mutations": [mutation_codes.code(mutation) for mutation in self._mutations] + [None],
+            "Minor Mutations": [minor_mutation_codes.code(mutation) for mutation in minor_mutations + ["None"]],
+            "Chimera": [chimera_codes.code(chimera) for chimera in CHIMERA_VALUES],
+            "Genes": [gene_codes.code(gene) for gene in self.gene_names] +
+                     [gene_codes.code(gene) | GLEAM_FLAG for gene in self.gene_names],
+            "Total number of genes": None,
+        }
+
+    def roll_traits(self, n: int) -> Dict[str, np.ndarray]:
+        """Rolls n pups and returns the bincount of every trait, indexed by the codes used in this engine."""
+        chimera = self.roll_chimera(n)
+        full_chimera = chimera == 2
+
+        # Full chimeras get two sets of up to 5 genes, everyone else up to 10.
+        gene_counts = np.zeros(2 * len(self.gene_names), dtype=np.int64)
+        num_genes = np.zeros(n, dtype=np.int64)
+        normal_rows = np.flatnonzero(~full_chimera)
+        chimera_rows = np.flatnonzero(full_chimera)
+        for rows, max_genes, repeats in ((normal_rows, 10, 1), (chimera_rows, 5, 2)):
+            for _ in range(repeats):
+                if len(rows) == 0:
+                    continue
+                plain, gleamed = self.roll_genes(len(rows), max_genes)
+                gene_counts += np.concatenate([pups_per_gene(plain), pups_per_gene(gleamed)])
+                num_genes[rows] += genes_per_pup(plain) + genes_per_pup(gleamed)
+
+        subspecies = self.roll_subspecies(n)
+        base = self.roll_base(n)
+        # Fix base for pygmies - they can't be woolen
+        if self.woolen_code is not None:
+            base[(subspecies == 1) & (base == self.woolen_code)] = self.smooth_code
+
+        mutation_flags = self.roll_major_mutations(n)
+        mutation_counts = np.append(mutation_flags.sum(axis=0), np.count_nonzero(~mutation_flags.any(axis=1)))
+
+        return {
+            "Health": np.bincount(self.roll_health(n), minlength=len(self.health_names)),
+            "Sex": np.bincount(self.roll_sex(n), minlength=2),
+            "Base colours": np.bincount(self.roll_colour(n), minlength=len(self.colour_names)),
+            "Horns": np.bincount(self.roll_horns(n), minlength=len(self.horn_names)),
+            "Tails": np.bincount(self.roll_tail(n), minlength=len(self.tail_names)),
+            "Coat Type": np.bincount(base, minlength=len(self.base_names)),
+            "Modifier": np.bincount(self.roll_modifier(n), minlength=len(self.modifier_names)),
+            "Subspecies": np.bincount(subspecies, minlength=2),
+            "Major Mutations": mutation_counts,
+            "Minor Mutations": np.bincount(self.roll_minor_mutation(n), minlength=len(minor_mutations) + 1),
+            "Chimera": np.bincount(chimera, minlength=len(CHIMERA_VALUES)),
+            "Genes": gene_counts,
+            "Total number of genes": np.bincount(num_genes),
+        }
+
+    # Random draws
+
+    def _rolls(self, *shape) -> np.ndarray:
+        """The equivalent of randint(1,100) for every element of shape."""
+        return self.rng.integers(1, 101, size=shape, dtype=np.int16)
+
+    def _coin(self, n: int) -> np.ndarray:
+        """The equivalent of randint(1,2) == 1."""
+        return self.rng.integers(0, 2, size=n, dtype=np.int8) == 1
+
+    def _choose(self, n: int, length) -> np.ndarray:
+        """A uniform index in range(length) for each of n rows. length can be a scalar or an array."""
+        return (self.rng.random(n) * length).astype(np.int64)
+
+    # Litter size
+
+    def roll_number_cubs(self, n: int) -> np.ndarray:
+        ruleset = self.roller.ruleset
+        ladder = ruleset.somnis_litter_ladder if self.modifiers["SomnisBlessing"] else ruleset.litter_ladder
+        # The litter size for each roll, first match wins.
+        sizes = np.array([next((num_cubs for highest_roll, num_cubs in ladder if roll <= highest_roll), 0)
+                          for roll in range(101)])
+        num_cubs = sizes[self._rolls(n)]
+        if self.modifiers["SpringBlessing"]:
+            fewest, most = ruleset.spring_litter_range
+            num_cubs = self.rng.integers(fewest, most + 1, size=n)
+        for modifier in ["Alpha", "Bonded"]:
+            if self.modifiers[modifier]:
+                num_cubs = num_cubs + (self._rolls(n) <= ruleset.extra_pup_chances.get(modifier, 0))
+        return num_cubs
+
+    # Health and sex
+
+    @staticmethod
+    def _health_names() -> List[str]:
+        return [health_codes.name(code) for code in range(len(health_codes))]
+
+    def roll_health(self, n: int) -> np.ndarray:
+        """Health codes, see HealthCodes."""
+        ruleset = self.roller.ruleset
+        virus_reduction = self.modifiers["VirusReduction"]
+        if self.modifiers["Bonded"]:
+            virus_reduction += ruleset.bonded_virus_reduction
+        virus_chance = max(0, ruleset.virus_chance - virus_reduction)
+
+        inbred = self.modifiers["Inbred"]
+        if not inbred:
+            return (self._rolls(n) <= virus_chance).astype(np.int64)
+
+        codes = np.zeros(n, dtype=np.int64)
+        for bit, condition_chance in enumerate(ruleset.inbred_chances):
+            codes |= (self._rolls(n) <= condition_chance + ruleset.inbred_chance_per_ancestor * (inbred - 1)) << bit
+        codes |= self._rolls(n) <= virus_chance
+        return codes
+
+    def roll_sex(self, n: int) -> np.ndarray:
+        """0 for Male, 1 for Female."""
+        if self.roller.all_male:
+            return np.zeros(n, dtype=np.int64)
+        elif self.roller.all_female:
+            return np.ones(n, dtype=np.int64)
+        return (self._rolls(n) >= 51).astype(np.int64)
+
+    # Sire vs dam
+
+    def _pick_rarest(self, sire_value, sire_rarity, dam_value, dam_rarity) -> np.ndarray:
+        """The rarer of the two passed values, or a coin toss between them if they're as rare as each other."""
+        coin = self._coin(len(sire_rarity))
+        return np.where((sire_rarity > dam_rarity) | ((sire_rarity == dam_rarity) & coin), sire_value, dam_value)
+
+    def _pick_passed(self, sire_passed, sire_rarity, dam_passed, dam_rarity, sire_code, dam_code, default_code):
+        """Inherit whichever parent's trait passed, the rarer if both did, or the default if neither."""
+        coin = self._coin(len(sire_passed))
+        # The rarities are the same for every pup, so only a tie needs the coin.
+        if sire_rarity == dam_rarity:
+            sire_wins = sire_passed & (~dam_passed | coin)
+        elif sire_rarity > dam_rarity:
+            sire_wins = sire_passed
+        else:
+            sire_wins = sire_passed & ~dam_passed
+        return np.where(sire_wins, sire_code, np.where(dam_passed, dam_code, default_code)).astype(np.int64)
+
+    # Chimera
+
+    def roll_chimera(self, n: int) -> np.ndarray:
+        """Index into CHIMERA_VALUES."""
+        sire_rate, sire_rarity = self.roller.get_chimera_pass_rate(self.sire.chimera_status)
+        dam_rate, dam_rarity = self.roller.get_chimera_pass_rate(self.dam.chimera_status)
+        # A status that isn't a chimera never passes.
+        codes = [CHIMERA_VALUES.index(chimera) if chimera in CHIMERA_VALUES else 0
+                 for chimera in [self.sire.chimera_status, self.dam.chimera_status]]
+        return self._pick_passed(self._rolls(n) <= sire_rate, sire_rarity.value,
+                                 self._rolls(n) <= dam_rate, dam_rarity.value, *codes, 0)
+
+    # Colour
+
+    def _compile_colours(self):
+        possible_colours = [self.sire.colour]
+        if self.sire.chimera_status in all_chimeras:
+            possible_colours.append(self.sire.chimera_colour)
+        possible_colours.append(self.dam.colour)
+        if self.dam.chimera_status in all_chimeras:
+            possible_colours.append(self.dam.chimera_colour)
+
+        self.colour_names = list(colour_index)
+        colour_numbers = {colour: code for code, colour in enumerate(self.colour_names)}
+
+        mods = [colour_index[colour][0] for colour in possible_colours]
+        bases = [colour_index[colour][1] for colour in possible_colours]
+        pass_rates = []
+        for colour in possible_colours:
+            mod, _, rarity = colour_index[colour]
+            pass_rates.append(self.roller.get_mod_pass_rate(rarity) if mod is not None else 0)
+        self.colour_pass_rates = pass_rates
+
+        # Which modifiers could be inherited for every combination of passes, as bit i is colour i's modifier passing:
+        # the rarest that passed, or the "no modifier" row if nothing did.
+        rarities = [colour_index[colour][2].value for colour in possible_colours]
+        mod_options = []
+        for passes in range(1 << len(possible_colours)):
+            passed = [i for i in range(len(possible_colours)) if passes >> i & 1]
+            rarest = max((rarities[i] for i in passed), default=None)
+            mod_options.append([i for i in passed if rarities[i] == rarest] or [len(possible_colours)])
+        self.colour_mod_lengths = np.array([len(options) for options in mod_options])
+        self.colour_mods = np.zeros((len(mod_options), self.colour_mod_lengths.max()), dtype=np.int64)
+        for passes, options in enumerate(mod_options):
+            self.colour_mods[passes, :len(options)] = options
+
+        # Every (modifier from colour i or no modifier, base from colour j) gives a list of possible colours.
+        num_colours = len(possible_colours)
+        candidates = []
+        for mod in mods + [None]:
+            for base in bases:
+                key = (mod, base)
+                if key in colour_modifier_base_index:
+                    candidates.append([colour_numbers[colour] for colour in colour_modifier_base_index[key]])
+                else:
+                    candidates.append([colour_numbers[base]])
+        self.colour_candidate_lengths = np.array([len(options) for options in candidates])
+        self.colour_candidates = np.zeros((len(candidates), self.colour_candidate_lengths.max()), dtype=np.int64)
+        for row, options in enumerate(candidates):
+            self.colour_candidates[row, :len(options)] = options
+        self.num_possible_colours = num_colours
+
+    def roll_colour(self, n: int) -> np.ndarray:
+        """Index into colour_names."""
+        num_colours = self.num_possible_colours
+        base = self.rng.integers(0, num_colours, size=n)
+
+        passes = np.zeros(n, dtype=np.int64)
+        for i, pass_rate in enumerate(self.colour_pass_rates):
+            passes |= (self._rolls(n) <= pass_rate).astype(np.int64) << i
+        # Pick one of the rarest passed modifiers at random.
+        mod = self.colour_mods[passes, self._choose(n, self.colour_mod_lengths[passes])]
+
+        combo = mod * num_colours + base
+        lengths = self.colour_candidate_lengths[combo]
+        return self.colour_candidates[combo, self._choose(n, lengths)]
+
+    # Genes
+
+    def _compile_genes(self):
+        roller = self.roller
+        siregenes = self.sire.genes
+        damgenes = self.dam.genes
+
+        # Each entry is a (gene, pass rate) pair which gets its own roll. A gene in both parents gets two rolls.
+        sources = [(gene, roller.get_gene_pass_rate(roller.get_gene_rarity(gene))) for gene in list(siregenes) + list(damgenes)]
+        if self.modifiers["Stardust"]:
+            sources.append(("Stardust", self.modifiers["Stardust"]))
+        if roller.genetic_discovery:
+            for code, rarity in roller.parent_genes.discoveries(roller.ruleset):
+                sources.append((gene_codes.names[code], roller.get_gene_pass_rate(rarity)))
+
+        self.gene_names = list(dict.fromkeys(gene for gene, _ in sources))
+        gene_numbers = {gene: code for code, gene in enumerate(self.gene_names)}
+        self.gene_source_codes = np.array([gene_numbers[gene] for gene, _ in sources], dtype=np.int64)
+        self.gene_source_rates = np.array([rate for _, rate in sources])
+
+        # Trimming removes commons first, then uncommons and so on. Genes with no rarity are never trimmed.
+        rank = []
+        for gene in self.gene_names:
+            rarity = roller.get_gene_rarity(gene)
+            rank.append(RARITY_ORDER.index(rarity) if rarity in RARITY_ORDER else len(RARITY_ORDER))
+        self.gene_trim_levels = [[code for code, gene_rank in enumerate(rank) if gene_rank == level]
+                                 for level in range(len(RARITY_ORDER))]
+        self.gleam_code = gene_numbers.get("Gleam")
+        self.gene_gleamable = np.array([gene not in freecolour_genes and gene != "Gleam" for gene in self.gene_names])
+
+    def roll_genes(self, n: int, max_genes: int) -> Tuple[np.ndarray, np.ndarray]:
+        """Returns (plain, gleamed) boolean arrays of shape (genes, n) - gleamed genes are the ones shown as "Gene (Gleam)"."""
+        num_genes = len(self.gene_names)
+        passed = np.zeros((num_genes, n), dtype=bool)
+        if num_genes == 0:
+            return passed, passed.copy()
+        source_passed = self._rolls(len(self.gene_source_rates), n) <= self.gene_source_rates[:, None]
+        for source, code in enumerate(self.gene_source_codes):
+            passed[code] |= source_passed[source]
+
+        # Get rid of any genes above threshold - commons first, then uncommons and so on.
+        excess = genes_per_pup(passed) - max_genes
+        rows = np.flatnonzero(excess > 0)
+        if len(rows):
+            sub = passed[:, rows]
+            to_remove = excess[rows].astype(np.float32)
+            for level_codes in self.gene_trim_levels:
+                # Selection sampling, so each pup loses a uniformly random subset of the genes at this rarity.
+                left = sub[level_codes].sum(axis=0, dtype=np.float32)
+                for code in level_codes:
+                    was_passed = sub[code].copy()
+                    dropped = was_passed & (self.rng.random(len(rows), dtype=np.float32) * left < to_remove)
+                    sub[code] = was_passed & ~dropped
+                    to_remove -= dropped
+                    left -= was_passed
+            passed[:, rows] = sub
+
+        gleamed = np.zeros_like(passed)
+        if self.gleam_code is not None:
+            rows = np.flatnonzero(passed[self.gleam_code])
+            eligible = passed[:, rows] & self.gene_gleamable[:, None]
+            attach = eligible.any(axis=0)
+            rows = rows[attach]
+            if len(rows):
+                target = np.argmax(eligible[:, attach] * self.rng.random((num_genes, len(rows)), dtype=np.float32),
+                                   axis=0)
+                passed[self.gleam_code, rows] = False
+                passed[target, rows] = False
+                gleamed[target, rows] = True
+        return passed, gleamed
+
+    # Horns, tail, modifier and base
+
+    def _compile_tails(self):
+        self.tail_names = list(dict.fromkeys(["Domestic"] + all_tails + [self.sire.tail, self.dam.tail]))
+        self.horn_names = list(dict.fromkeys(["None"] + all_horns + [self.sire.horns, self.dam.horns]))
+        self.base_names = list(dict.fromkeys(["Smooth"] + all_bases + [self.sire.base, self.dam.base]))
+        self.modifier_names = list(dict.fromkeys(["None"] + all_modifiers + [self.sire.modifier, self.dam.modifier]))
+        self.smooth_code = self.base_names.index("Smooth")
+        self.woolen_code = self.base_names.index("Woolen") if "Woolen" in self.base_names else None
+        self.tail_ladders = {tail: self._compile_tail_ladder(tail) for tail in [self.sire.tail, self.dam.tail]}
+
+    def _compile_tail_ladder(self, tail):
+        """The ladder as tables: the step each roll from 0 to 100 lands on, and each step's tails, how many there are
+        and their rarity. The last step is the Domestic tail a roll no step takes gets."""
+        tail_numbers = {name: code for code, name in enumerate(self.tail_names)}
+        ladder = [(threshold, [tail_numbers[option] for option in options], rarity.value)
+                  for threshold, options, rarity in self.roller.get_tail_ladder(tail)]
+        ladder.append((100, [tail_numbers["Domestic"]], Rarity.DEFAULT.value))
+
+        # First match wins, as in get_puppy.
+        steps = np.array([next(step for step, (threshold, _, _) in enumerate(ladder) if roll <= threshold)
+                          for roll in range(101)])
+        lengths = np.array([len(options) for _, options, _ in ladder])
+        options = np.zeros((len(ladder), lengths.max()), dtype=np.int64)
+        for step, (_, step_options, _) in enumerate(ladder):
+            options[step, :len(step_options)] = step_options
+        return steps, options, lengths, np.array([rarity for _, _, rarity in ladder])
+
+    def _passed_tail(self, tail, n):
+        steps, options, lengths, rarities = self.tail_ladders[tail]
+        step = steps[self._rolls(n)]
+        if lengths.max() == 1:
+            return options[step, 0], rarities[step]
+        return options[step, self._choose(n, lengths[step])], rarities[step]
+
+    def roll_tail(self, n: int) -> np.ndarray:
+        """Index into tail_names."""
+        sire_value, sire_rarity = self._passed_tail(self.sire.tail, n)
+        dam_value, dam_rarity = self._passed_tail(self.dam.tail, n)
+        return self._pick_rarest(sire_value, sire_rarity, dam_value, dam_rarity).astype(np.int64)
+
+    def _roll_passed_trait(self, n, sire_trait, dam_trait, names, get_pass, default):
+        sire_rate, sire_rarity = get_pass(sire_trait)
+        dam_rate, dam_rarity = get_pass(dam_trait)
+        return self._pick_passed(self._rolls(n) <= sire_rate, sire_rarity.value,
+                                 self._rolls(n) <= dam_rate, dam_rarity.value,
+                                 names.index(sire_trait), names.index(dam_trait), names.index(default))
+
+    def roll_horns(self, n: int) -> np.ndarray:
+        return self._roll_passed_trait(n, self.sire.horns, self.dam.horns, self.horn_names,
+                                       self.roller.get_horns_pass_rate, "None")
+
+    def roll_base(self, n: int) -> np.ndarray:
+        return self._roll_passed_trait(n, self.sire.base, self.dam.base, self.base_names,
+                                       self.roller.get_base_pass_rate, "Smooth")
+
+    def roll_modifier(self, n: int) -> np.ndarray:
+        return self._roll_passed_trait(n, self.sire.modifier, self.dam.modifier, self.modifier_names,
+                                       self.roller.get_modifier_pass_rate, "None")
+
+    # Subspecies and mutations
+
+    def roll_subspecies(self, n: int) -> np.ndarray:
+        """0 for None, 1 for Bat Eared Pygmy Vesper."""
+        sirespecies = self.sire.subspecies
+        damspecies = self.dam.subspecies
+        if (sirespecies == "None") and (damspecies == "None"):
+            return np.zeros(n, dtype=np.int64)
+        elif sirespecies == "Bat Eared Pygmy Vesper" and damspecies == "Bat Eared Pygmy Vesper":
+            return np.ones(n, dtype=np.int64)
+        return (self._rolls(n) <= 25).astype(np.int64)
+
+    def _compile_mutations(self):
+        mutations = list(all_mutations)
+        for mutation in [self.sire.mutation, self.dam.mutation]:
+            if mutation != "None" and mutation not in mutations:
+                mutations.append(mutation)
+        self._mutations = mutations
+
+    def roll_major_mutations(self, n: int) -> np.ndarray:
+        """Boolean array of shape (n, mutations) - a pup can have several, or none."""
+        flags = np.zeros((n, len(self._mutations)), dtype=bool)
+        for mutation in [self.sire.mutation, self.dam.mutation]:
+            if mutation != "None":
+                flags[:, self._mutations.index(mutation)] |= self._rolls(n) <= 3
+        # random major mutation
+        spontaneous = np.flatnonzero(self._rolls(n) <= 1)
+        flags[spontaneous, self._choose(len(spontaneous), len(all_mutations))] = True
+        return flags
+
+    def roll_minor_mutation(self, n: int) -> np.ndarray:
+        """Index into minor_mutations, or len(minor_mutations) for None."""
+        mutated = self._rolls(n) <= 1
+        return np.where(mutated, self._choose(n, len(minor_mutations)), len(minor_mutations))
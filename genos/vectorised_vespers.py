@@ -0,0 +1,230 @@
+"""MaxRarityVesper rolls in bulk, as NumPy arrays with one column per trait.
+
+Every trait is a code from genes' tables, so a million vespers take a few tens of MB, and names and roll text are only
+made for the rows someone asks to see. The rolls follow MaxRarityVesper.roll_traits, draw for draw in distribution
+but not in sequence, so a seed gives different vespers here than it does there.
+"""
+from typing import Dict, Iterator, List, Optional
+
+import numpy as np
+
+from .genes import (
+    GLEAM_FLAG, all_mythic_options, base_codes, colour_codes, common_bases, common_colours, common_genes,
+    common_tails, gene_codes, gene_modifier_index, horn_codes, modifier_codes, rare_bases, rare_colours, rare_genes,
+    rare_horns, rare_tails, sex_codes, tail_codes, tail_index, uncommon_bases, uncommon_colours, uncommon_genes,
+    uncommon_horns, uncommon_tails, vesper_modifier_index,
+)
+from .histogram import TraitAccumulator
+from .random_vesper_rolling_logic import MaxRarityVesper, VesperTraits, new_vesper_accumulator
+from .ruleset import Ruleset, get_active_ruleset
+
+# Vespers are rolled in chunks, as picking genes needs a key per row for every common and uncommon gene.
+CHUNK_SIZE = 1 << 16
+
+# The rare abnormality roll's options, for no mythic, a mythic tail and a mythic colour modifier.
+ABNORMALITY_OPTIONS = [["tail", "colour", "horns"], ["colour", "horns"], ["tail", "horns"]]
+ABNORMALITIES = ["tail", "colour", "horns"]
+NO_GENE = -1
+
+
+def _codes(codes, names: List[str]) -> np.ndarray:
+    return np.array([codes.code(name) for name in names], dtype=np.int16)
+
+
+class VesperColumns:
+    """n rolled vespers, a row each. Traits are codes from genes' tables, with 0 for no horns, no tail modifier (a
+    Domestic tail) or no colour modifier. genes holds each row's gene codes in the order they were rolled, with
+    NO_GENE past gene_count, and gene_mod_index is the gene Gleam attached to, or -1.
+    """
+
+    def __init__(self, columns: Dict[str, np.ndarray]):
+        self.coat = columns["coat"]
+        self.sex = columns["sex"]
+        self.colour = columns["colour"]
+        self.horns = columns["horns"]
+        self.tail = columns["tail"]
+        self.colour_mod = columns["colour_mod"]
+        self.genes = columns["genes"]
+        self.gene_count = columns["gene_count"]
+        self.gene_mod_index = columns["gene_mod_index"]
+
+    def __len__(self) -> int:
+        return len(self.coat)
+
+    def columns(self) -> Dict[str, np.ndarray]:
+        return {"coat": self.coat, "sex": self.sex, "colour": self.colour, "horns": self.horns, "tail": self.tail,
+                "colour_mod": self.colour_mod, "genes": self.genes, "gene_count": self.gene_count,
+                "gene_mod_index": self.gene_mod_index}
+
+    def traits(self, row: int) -> VesperTraits:
+        horns = int(self.horns[row])
+        tail = int(self.tail[row])
+        colour_mod = int(self.colour_mod[row])
+        gene_mod_index = int(self.gene_mod_index[row])
+        return VesperTraits(
+            base_codes.name(int(self.coat[row])), sex_codes.name(int(self.sex[row])),
+            colour_codes.name(int(self.colour[row])), horn_codes.name(horns) if horns else None,
+            tail_codes.names[tail] if tail else None, modifier_codes.name(colour_mod) if colour_mod else None,
+            [gene_codes.name(int(code)) for code in self.genes[row, :self.gene_count[row]]],
+            "Gleam" if gene_mod_index >= 0 else None, gene_mod_index if gene_mod_index >= 0 else None)
+
+    def result(self, row: int) -> Dict[str, str]:
+        """The row as MaxRarityVesper.get_results writes it out."""
+        traits = self.traits(row)
+        return {"name": "Roll {}".format(row + 1), "coat": traits.coat, "sex": traits.sex,
+                "appearance": MaxRarityVesper.format_appearance(traits),
+                "abnormalities": MaxRarityVesper.format_abnormalities(traits)}
+
+    def iter_results(self, start: int = 0, stop: Optional[int] = None) -> Iterator[Dict[str, str]]:
+        for row in range(start, len(self) if stop is None else min(stop, len(self))):
+            yield self.result(row)
+
+    def tally(self, accumulator: TraitAccumulator = None) -> TraitAccumulator:
+        """Counts every row's traits, as MaxRarityVesper.tally does, without making any names."""
+        if accumulator is None:
+            accumulator = new_vesper_accumulator()
+        for trait, column in [("Coat Type", self.coat), ("Sex", self.sex), ("Base colours", self.colour),
+                              ("Horns", self.horns), ("Tails", self.tail), ("Modifier", self.colour_mod)]:
+            accumulator[trait].add_counts(np.bincount(column).tolist())
+
+        genes = self.genes.astype(np.int64)
+        gleamed = np.flatnonzero(self.gene_mod_index >= 0)
+        genes[gleamed, self.gene_mod_index[gleamed]] |= GLEAM_FLAG
+        codes, counts = np.unique(genes[genes != NO_GENE], return_counts=True)
+        accumulator["Genes"].add_counts(counts.tolist(), codes.tolist())
+        accumulator.items += len(self)
+        return accumulator
+
+
+class VectorisedVesperGenerator:
+    """Rolls MaxRarityVesper vespers as VesperColumns, a chunk of rows at a time."""
+
+    def __init__(self, ruleset: Ruleset = None, seed=None):
+        self.ruleset = ruleset if ruleset is not None else get_active_ruleset()
+        self.rng = np.random.default_rng(seed)
+
+        self.mythic_options = list(all_mythic_options)
+        self.mythic_tail = np.array([option in tail_index for option in self.mythic_options])
+        self.mythic_colour_mod = np.array([option in vesper_modifier_index for option in self.mythic_options])
+        self.mythic_gene_mod = np.array([option in gene_modifier_index for option in self.mythic_options])
+        # Codes in each option's own table, only read where the matching flag above is set.
+        self.mythic_codes = np.array([
+            tail_codes.code(option) if option in tail_index else
+            modifier_codes.code(option) if option in vesper_modifier_index else 0
+            for option in self.mythic_options], dtype=np.int16)
+
+        self.rare_genes = _codes(gene_codes, rare_genes)
+        self.rare_tails = _codes(tail_codes, rare_tails)
+        self.rare_horns = _codes(horn_codes, rare_horns)
+        self.rare_colours = _codes(colour_codes, rare_colours)
+        self.bases = [_codes(base_codes, bases) for bases in [rare_bases, uncommon_bases, common_bases]]
+        self.uncommon_tails = _codes(tail_codes, uncommon_tails)
+        # A Domestic tail is no tail at all, which is code 0 anyway.
+        self.common_tails = _codes(tail_codes, common_tails)
+        self.uncommon_horns = _codes(horn_codes, uncommon_horns)
+        self.uncommon_colours = _codes(colour_codes, uncommon_colours)
+        self.common_colours = _codes(colour_codes, common_colours)
+        self.abnormality_options = np.array([[ABNORMALITIES.index(option) for option in options] +
+                                             [0] * (len(ABNORMALITIES) - len(options))
+                                             for options in ABNORMALITY_OPTIONS])
+        self.abnormality_counts = np.array([len(options) for options in ABNORMALITY_OPTIONS])
+
+        # roll_traits draws each gene from the uncommon list some of the time and the common list otherwise, and
+        # draws again on a duplicate. That's sampling without replacement weighted by each gene's chance per draw,
+        # which is the order of exponential keys divided by those chances.
+        uncommon_share = self.ruleset.uncommon_gene_chance / 100
+        weights = {}
+        for genes, share in [(uncommon_genes, uncommon_share), (common_genes, 1 - uncommon_share)]:
+            for gene in genes:
+                weights[gene] = weights.get(gene, 0.0) + share / len(genes)
+        self.gene_pool = _codes(gene_codes, list(weights))
+        with np.errstate(divide="ignore"):
+            self.gene_key_scales = (1 / np.array(list(weights.values()))).astype(np.float32)
+        self.most_genes = max(self.ruleset.gene_count_range[1], 1)
+
+    def generate(self, n: int) -> VesperColumns:
+        chunks = [self.roll_chunk(min(CHUNK_SIZE, n - start)) for start in range(0, n, CHUNK_SIZE)]
+        if not chunks:
+            chunks = [self.roll_chunk(0)]
+        return VesperColumns({name: np.concatenate([chunk[name] for chunk in chunks]) for name in chunks[0]})
+
+    # Random draws
+
+    def _rolls(self, n: int) -> np.ndarray:
+        """The equivalent of randint(1,100) for each of n rows."""
+        return self.rng.integers(1, 101, size=n, dtype=np.int16)
+
+    def _choose(self, n: int, length) -> np.ndarray:
+        """A uniform index in range(length) for each of n rows. length can be a scalar or an array."""
+        return (self.rng.random(n) * length).astype(np.int64)
+
+    def _pick(self, options: np.ndarray, n: int) -> np.ndarray:
+        return options[self._choose(n, len(options))]
+
+    def roll_chunk(self, n: int) -> Dict[str, np.ndarray]:
+        ruleset = self.ruleset
+        tier = self._rolls(n)
+        ladder = ruleset.rarity_ladder
+        mythic = np.select([tier <= highest_roll for highest_roll, _, _ in ladder],
+                           [mythic for _, mythic, _ in ladder], 0) == 1
+        rare = np.select([tier <= highest_roll for highest_roll, _, _ in ladder],
+                         [rare for _, _, rare in ladder], 0) == 2
+
+        option = self._choose(n, len(self.mythic_options))
+        mythic_tail = mythic & self.mythic_tail[option]
+        mythic_colour_mod = mythic & self.mythic_colour_mod[option]
+        gleam = mythic & self.mythic_gene_mod[option]
+        tail = np.where(mythic_tail, self.mythic_codes[option], 0).astype(np.int16)
+        colour_mod = np.where(mythic_colour_mod, self.mythic_codes[option], 0).astype(np.int16)
+
+        state = np.where(mythic_tail, 1, np.where(mythic_colour_mod, 2, 0))
+        abnormality = np.where(rare, self.abnormality_options[state, self._choose(n, self.abnormality_counts[state])],
+                               -1)
+        rare_tail = abnormality == ABNORMALITIES.index("tail")
+        rare_colour = abnormality == ABNORMALITIES.index("colour")
+        rare_horns = abnormality == ABNORMALITIES.index("horns")
+        tail = np.where(rare_tail, self._pick(self.rare_tails, n), tail)
+        horns = np.where(rare_horns, self._pick(self.rare_horns, n), 0).astype(np.int16)
+
+        coat_roll = self._rolls(n)
+        coat = np.select([coat_roll <= ruleset.rare_coat_chance,
+                          coat_roll <= ruleset.rare_coat_chance + ruleset.uncommon_coat_chance],
+                         [self._pick(self.bases[0], n), self._pick(self.bases[1], n)],
+                         self._pick(self.bases[2], n)).astype(np.int8)
+
+        tail = np.where(tail == 0,
+                        np.where(self._rolls(n) <= ruleset.uncommon_tail_chance,
+                                 self._pick(self.uncommon_tails, n), self._pick(self.common_tails, n)),
+                        tail).astype(np.int8)
+        horns = np.where(~rare_horns & (self._rolls(n) <= ruleset.uncommon_horns_chance),
+                         self._pick(self.uncommon_horns, n), horns).astype(np.int8)
+        colour = np.where(rare_colour, self._pick(self.rare_colours, n),
+                          np.where(self._rolls(n) <= ruleset.uncommon_colour_chance,
+                                   self._pick(self.uncommon_colours, n), self._pick(self.common_colours, n)))
+
+        genes, gene_count = self.roll_genes(n, rare)
+        gene_mod_index = np.where(gleam, self._choose(n, gene_count), -1).astype(np.int8)
+
+        return {"coat": coat, "sex": self.rng.integers(0, 2, size=n, dtype=np.int8), "colour": colour,
+                "horns": horns, "tail": tail, "colour_mod": colour_mod.astype(np.int8), "genes": genes,
+                "gene_count": gene_count, "gene_mod_index": gene_mod_index}
+
+    def roll_genes(self, n: int, rare: np.ndarray):
+        """(genes, gene_count) - a rare gene first where rare is set, then common and uncommon genes to make up a
+        count from gene_count_range, with no gene twice."""
+        fewest, most = self.ruleset.gene_count_range
+        gene_count = self.rng.integers(fewest, most + 1, size=n).astype(np.int8)
+        gene_count = np.maximum(gene_count, rare).astype(np.int8)
+        genes = np.full((n, self.most_genes), NO_GENE, dtype=np.int16)
+        genes[:, 0] = np.where(rare, self._pick(self.rare_genes, n), NO_GENE)
+
+        to_draw = min(most, len(self.gene_pool))
+        if n and to_draw:
+            keys = self.rng.standard_exponential((n, len(self.gene_pool)), dtype=np.float32) * self.gene_key_scales
+            drawn = self.gene_pool[np.argsort(keys, axis=1)[:, :to_draw]]
+            # Rows with a rare gene fill in after it.
+            for column in range(self.most_genes):
+                source = column - rare
+                fill = (source >= 0) & (source < to_draw) & (column < gene_count)
+                genes[fill, column] = drawn[fill, source[fill]]
+        return genes, gene_count
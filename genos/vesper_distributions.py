@@ -0,0 +1,269 @@
+"""Exact chances of every MaxRarityVesper outcome, worked out from the ruleset's thresholds rather than rolled.
+
+roll_traits first rolls a tier off the rarity ladder, which decides whether there's a mythic trait and a rare gene and
+abnormality, and everything after that depends only on the tier. So each tier's outcomes are worked out separately
+and added up, weighted by its chance, which takes a few milliseconds for any ruleset.
+"""
+from collections import defaultdict
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+from .breeding_distributions import chance
+from .genes import (
+    all_mythic_options, common_bases, common_colours, common_genes, common_tails, gene_modifier_index, rare_bases,
+    rare_colours, rare_genes, rare_horns, rare_tails, tail_index, uncommon_bases, uncommon_colours, uncommon_genes,
+    uncommon_horns, uncommon_tails, vesper_modifier_index,
+)
+from .ruleset import Ruleset, get_active_ruleset
+
+# The rare abnormality roll's options, given the mythic trait's kind.
+ABNORMALITY_OPTIONS = {"tail": ["colour", "horns"], "colour_mod": ["tail", "horns"], None: ["tail", "colour", "horns"]}
+
+
+class Scenario(NamedTuple):
+    """One way the tier, mythic and rare abnormality rolls can come out, and its chance."""
+    chance: float
+    mythic: Optional[str]
+    # "tail", "colour_mod", "gene_mod" or None, for where the mythic trait went
+    mythic_kind: Optional[str]
+    abnormality: Optional[str]
+    rare_gene: bool
+
+
+def mythic_kind(option: str) -> Optional[str]:
+    # The same order roll_traits checks them in
+    if option in tail_index:
+        return "tail"
+    elif option in vesper_modifier_index:
+        return "colour_mod"
+    elif option in gene_modifier_index:
+        return "gene_mod"
+    return None
+
+
+def _uniform(distribution, items: List[str], probability: float, label="{}"):
+    for item in items:
+        distribution[label.format(item)] += probability / len(items)
+
+
+class VesperDistributions:
+    """Exact per-trait outcome probabilities for MaxRarityVesper under a ruleset."""
+
+    def __init__(self, ruleset: Ruleset = None):
+        self.ruleset = ruleset if ruleset is not None else get_active_ruleset()
+
+    def all_distributions(self) -> Dict[str, Dict]:
+        """Every table report shows. Genes are the chance a vesper shows each one, so they add up to more than 1."""
+        return {
+            "Tier": self.tiers(),
+            "Mythic trait": self.mythic(),
+            "Rare abnormality": self.rare_abnormality(),
+            "Coat Type": self.coat(),
+            "Sex": {"Male": 0.5, "Female": 0.5},
+            "Base colours": self.colour(),
+            "Horns": self.horns(),
+            "Tails": self.tail(),
+            "Modifier": self.modifier(),
+            "Total number of genes": self.gene_counts(),
+            "Genes": self.genes(),
+        }
+
+    def report(self) -> List[str]:
+        """The distributions written out the way BreedingRoller's exact test writes its own."""
+        comments = ["Exact chances for each vesper are as follows."]
+        for distribution_name, distribution in self.all_distributions().items():
+            values = sorted(distribution.items(), key=lambda x: x[1], reverse=True)
+            comments.append(f"{distribution_name} occurrence is " +
+                            "".join(f"{value}: {100*probability:.2f}% " for value, probability in values))
+        return comments
+
+    # Tier, mythic trait and rare abnormality
+
+    def ladder(self) -> List[Tuple[float, int, int]]:
+        """(chance, mythic, rare) for each step of the rarity ladder, and for rolling past the top of it."""
+        steps = []
+        previous = 0
+        for highest_roll, mythic, rare in self.ruleset.rarity_ladder:
+            steps.append((chance(highest_roll) - chance(previous), mythic, rare))
+            previous = highest_roll
+        steps.append((1 - chance(previous), 0, 0))
+        return steps
+
+    def scenarios(self) -> List[Scenario]:
+        scenarios = []
+        for p_tier, mythic, rare in self.ladder():
+            if not p_tier:
+                continue
+            options = [(1 / len(all_mythic_options), option) for option in all_mythic_options] if mythic == 1 else \
+                [(1.0, None)]
+            for p_option, option in options:
+                kind = mythic_kind(option) if option is not None else None
+                if rare == 2:
+                    abnormalities = ABNORMALITY_OPTIONS.get(kind, ABNORMALITY_OPTIONS[None])
+                    for abnormality in abnormalities:
+                        scenarios.append(Scenario(p_tier * p_option / len(abnormalities), option, kind, abnormality,
+                                                  True))
+                else:
+                    scenarios.append(Scenario(p_tier * p_option, option, kind, None, False))
+        return scenarios
+
+    def tiers(self) -> Dict[str, float]:
+        distribution = defaultdict(float)
+        for p_tier, mythic, rare in self.ladder():
+            distribution[f"{mythic} mythic and {rare} rare"] += p_tier
+        return dict(distribution)
+
+    def mythic(self) -> Dict[str, float]:
+        distribution = defaultdict(float)
+        for scenario in self.scenarios():
+            distribution[scenario.mythic or "None"] += scenario.chance
+        return dict(distribution)
+
+    def rare_abnormality(self) -> Dict[str, float]:
+        distribution = defaultdict(float)
+        for scenario in self.scenarios():
+            distribution[scenario.abnormality.capitalize() if scenario.abnormality else "None"] += scenario.chance
+        return dict(distribution)
+
+    # Coat, colour, horns, tail and modifier
+
+    def coat(self) -> Dict[str, float]:
+        ruleset = self.ruleset
+        distribution = defaultdict(float)
+        p_rare = chance(ruleset.rare_coat_chance)
+        p_uncommon = chance(ruleset.rare_coat_chance + ruleset.uncommon_coat_chance) - p_rare
+        _uniform(distribution, rare_bases, p_rare)
+        _uniform(distribution, uncommon_bases, p_uncommon)
+        _uniform(distribution, common_bases, 1 - p_rare - p_uncommon)
+        return dict(distribution)
+
+    def colour(self) -> Dict[str, float]:
+        p_uncommon = chance(self.ruleset.uncommon_colour_chance)
+        distribution = defaultdict(float)
+        for scenario in self.scenarios():
+            if scenario.abnormality == "colour":
+                _uniform(distribution, rare_colours, scenario.chance)
+            else:
+                _uniform(distribution, uncommon_colours, scenario.chance * p_uncommon)
+                _uniform(distribution, common_colours, scenario.chance * (1 - p_uncommon))
+        return dict(distribution)
+
+    def horns(self) -> Dict[str, float]:
+        p_uncommon = chance(self.ruleset.uncommon_horns_chance)
+        distribution = defaultdict(float)
+        for scenario in self.scenarios():
+            if scenario.abnormality == "horns":
+                _uniform(distribution, rare_horns, scenario.chance)
+            else:
+                _uniform(distribution, uncommon_horns, scenario.chance * p_uncommon)
+                distribution["None"] += scenario.chance * (1 - p_uncommon)
+        return dict(distribution)
+
+    def tail(self) -> Dict[str, float]:
+        p_uncommon = chance(self.ruleset.uncommon_tail_chance)
+        distribution = defaultdict(float)
+        for scenario in self.scenarios():
+            if scenario.mythic_kind == "tail":
+                distribution[f"{scenario.mythic} Tail"] += scenario.chance
+            elif scenario.abnormality == "tail":
+                _uniform(distribution, rare_tails, scenario.chance, "{} Tail")
+            else:
+                _uniform(distribution, uncommon_tails, scenario.chance * p_uncommon, "{} Tail")
+                _uniform(distribution, common_tails, scenario.chance * (1 - p_uncommon), "{} Tail")
+        return dict(distribution)
+
+    def modifier(self) -> Dict[str, float]:
+        distribution = defaultdict(float)
+        for scenario in self.scenarios():
+            distribution[scenario.mythic if scenario.mythic_kind == "colour_mod" else "None"] += scenario.chance
+        return dict(distribution)
+
+    # Genes
+
+    def _gene_outcomes(self, rare_gene: bool) -> Dict[int, Dict[str, float]]:
+        """For each number of genes, the chance of having that many and each gene being one of them."""
+        fewest, most = self.ruleset.gene_count_range
+        drawn = drawn_chances(self.ruleset.uncommon_gene_chance, most)
+        outcomes = defaultdict(lambda: defaultdict(float))
+        p_count = 1 / (most - fewest + 1)
+        for gene_count in range(fewest, most + 1):
+            # A rare gene counts towards the total, but is always kept.
+            draws = max(gene_count - 1, 0) if rare_gene else gene_count
+            outcome = outcomes[draws + rare_gene]
+            outcome[None] += p_count
+            for gene, p_gene in drawn[draws].items():
+                outcome[gene] += p_count * p_gene
+            if rare_gene:
+                for gene in rare_genes:
+                    outcome[gene] += p_count / len(rare_genes)
+        return outcomes
+
+    def gene_counts(self) -> Dict[int, float]:
+        distribution = defaultdict(float)
+        for scenario in self.scenarios():
+            for gene_count, outcome in self._gene_outcomes(scenario.rare_gene).items():
+                distribution[gene_count] += scenario.chance * outcome[None]
+        return dict(distribution)
+
+    def genes(self) -> Dict[str, float]:
+        """The chance a vesper shows each gene. A gene modifier attaches to one of the genes at random, which then
+        shows as e.g. "Mask (Gleam)" instead."""
+        distribution = defaultdict(float)
+        outcomes = {rare_gene: self._gene_outcomes(rare_gene) for rare_gene in [False, True]}
+        for scenario in self.scenarios():
+            modifier = scenario.mythic if scenario.mythic_kind == "gene_mod" else None
+            for gene_count, outcome in outcomes[scenario.rare_gene].items():
+                for gene, p_gene in outcome.items():
+                    if gene is None:
+                        continue
+                    p_gene *= scenario.chance
+                    if modifier is None:
+                        distribution[gene] += p_gene
+                    else:
+                        distribution[f"{gene} ({modifier})"] += p_gene / gene_count
+                        distribution[gene] += p_gene * (1 - 1 / gene_count)
+        return dict(distribution)
+
+
+def drawn_chances(uncommon_gene_chance: int, most: int) -> List[Dict[str, float]]:
+    """The chance each common and uncommon gene is among the first n drawn, for n from 0 to most.
+
+    Each draw is an uncommon gene uncommon_gene_chance% of the time and a common one otherwise, drawing again on a
+    duplicate. Genes in the same list are drawn alike, so all that matters is how many have come from each list so
+    far, and each gene's chance is its list's expected count shared out between the genes in it.
+    """
+    p_uncommon = chance(uncommon_gene_chance)
+    # Per-draw weight of each gene. A gene on both lists would be drawn from either.
+    weights = defaultdict(float)
+    for genes, share in [(uncommon_genes, p_uncommon), (common_genes, 1 - p_uncommon)]:
+        for gene in genes:
+            weights[gene] += share / len(genes)
+    groups = defaultdict(list)
+    for gene, weight in weights.items():
+        groups[weight].append(gene)
+    group_weights = list(groups)
+    group_sizes = [len(groups[weight]) for weight in group_weights]
+
+    chances = []
+    states = {(0,) * len(group_weights): 1.0}
+    for draws in range(most + 1):
+        expected = [0.0] * len(group_weights)
+        for state, p_state in states.items():
+            for group, drawn in enumerate(state):
+                expected[group] += p_state * drawn
+        chances.append({gene: expected[group] / group_sizes[group]
+                        for group, weight in enumerate(group_weights) for gene in groups[weight]})
+
+        next_states = defaultdict(float)
+        for state, p_state in states.items():
+            remaining = [weight * (size - drawn)
+                         for weight, size, drawn in zip(group_weights, group_sizes, state)]
+            total = sum(remaining)
+            if not total:
+                # Nothing left that can be drawn, which the ruleset's gene_count check rules out.
+                continue
+            for group, group_remaining in enumerate(remaining):
+                if group_remaining:
+                    next_state = state[:group] + (state[group] + 1,) + state[group + 1:]
+                    next_states[next_state] += p_state * group_remaining / total
+        states = next_states
+    return chances
@@ -0,0 +1,10 @@
+import importlib.util
+import sys
+import types
+
+# random_vesper_rolling_logic imports item_text_prettification, which lives with the bot and isn't in this repo.
+# Nothing the tests roll uses it, so give them an empty stand-in when it's missing.
+if importlib.util.find_spec("genos.item_text_prettification") is None:
+    prettification = types.ModuleType("genos.item_text_prettification")
+    prettification.inventory_update_text = prettification.items_to_user_string = None
+    sys.modules["genos.item_text_prettification"] = prettification
@@ -0,0 +1,42 @@
+"""Parents, rollers and roster records shared by the tests."""
+from genos.breeding_logic import BreedingRoller, BreedingVesper
+from genos.rng import RollRandom
+
+# Every modifier off. Tests pass the ones they need to roller() or dict(MODIFIERS, ...).
+MODIFIERS = {"MaleBoost": False, "FemaleBoost": False, "Alpha": False, "SpringBlessing": False, "Bonded": False,
+             "VirusReduction": 0, "Inbred": 0, "SomnisBlessing": False, "Stardust": 0}
+
+# The traits a parent has unless a test says otherwise.
+PLAIN = {"colour": "Sand", "horns": "None", "tail": "Domestic", "base": "Smooth", "modifier": "None",
+         "subspecies": "None", "mutation": "None", "chimera_status": "None", "chimera_colour": "Sand"}
+# A horned, finned parent with a docked tail, for tests that want those rolled.
+HORNED = dict(PLAIN, horns="Ram Horns", tail="Docked", base="Maned", mutation="Fins")
+
+
+def parent(name, genes=(), traits=PLAIN, **changes) -> BreedingVesper:
+    return BreedingVesper(name=name, genes=list(genes), **dict(traits, **changes))
+
+
+def roller(sire, dam, modifiers=None, seed=None, **options) -> BreedingRoller:
+    """A roller for the two parents, with modifiers changed from MODIFIERS and seeded if seed isn't None."""
+    return BreedingRoller([sire, dam], dict(MODIFIERS, **(modifiers or {})),
+                          rng=None if seed is None else RollRandom(seed), **options)
+
+
+def sampled_share(sire, dam, matches, litters=3000, seed=11) -> float:
+    """The share of pups in litters rolled from the two parents, with every modifier off, that matches(pup)."""
+    rng = RollRandom(seed)
+    hits = pups = 0
+    for _ in range(litters):
+        for pup in BreedingRoller([sire, dam], MODIFIERS, rng=rng).roll_litter():
+            hits += matches(pup)
+            pups += 1
+    return hits / pups
+
+
+def record(name, **modifiers):
+    """A roster record with the breeding form's field names, as batch.Pairing.factory reads them."""
+    data = {}
+    parent("sire", ["Mask", "Gleam", "Comet"], HORNED).populate_data(data)
+    parent("dam", ["Sable"], tail="Cloud").populate_data(data)
+    return dict({key[:-len("_value")]: value for key, value in data.items()}, name=name, **modifiers)
@@ -0,0 +1,94 @@
+import csv
+import json
+import os
+
+import pytest
+
+from genos.__main__ import main
+from genos.batch import Pairing, load_roster, roll_roster
+from genos.ruleset import compile_ruleset
+from helpers import HORNED, parent, record
+
+
+def test_factory_reads_the_form_fields():
+    pairing = Pairing.factory(record("Ash and Birch", Bonded="yes", Stardust="10"), 1)
+    assert pairing.name == "Ash and Birch"
+    assert pairing.sire == parent("sire", ["Mask", "Gleam", "Comet"], HORNED)
+    assert pairing.dam == parent("dam", ["Sable"], tail="Cloud")
+    assert (pairing.modifiers["Bonded"], pairing.modifiers["Stardust"], pairing.modifiers["Alpha"]) == (True, 10, False)
+    unnamed = record(None)
+    del unnamed["name"]
+    assert Pairing.factory(unnamed, 3).name == "Pairing 3"
+
+
+@pytest.mark.parametrize("missing", ["sirecoatcolour", "damtail", "sirechimeracolour"])
+@pytest.mark.parametrize("blank", [False, True])
+def test_missing_vesper_fields_are_rejected(missing, blank):
+    data = record("Ash and Birch")
+    if blank:
+        data[missing] = ""
+    else:
+        del data[missing]
+    with pytest.raises(ValueError, match=f"Ash and Birch has no {missing}"):
+        Pairing.factory(data, 1)
+
+
+@pytest.mark.parametrize("field, value", [("sirecoatcolour", "Purpleish"), ("damtail", "Skeletal Tail"),
+                                          ("sirehorns", "Antlers"), ("dammut", "Wings"), ("siregene2", "Sparkle"),
+                                          ("Stardust", "lots"), ("Bonded", "maybe"), ("VirusReduction", 2.5)])
+def test_values_that_arent_traits_are_rejected(field, value):
+    with pytest.raises(ValueError, match=f"Ash and Birch's {field} can't be {value}"):
+        Pairing.factory(dict(record("Ash and Birch"), **{field: value}), 1)
+
+
+def test_chimeras_need_a_chimera_colour():
+    assert Pairing.factory(dict(record("Ash and Birch"), sirechimeracolour="None"), 1).sire.chimera_colour == "None"
+    with pytest.raises(ValueError, match="damchimeracolour can't be None for a chimera"):
+        Pairing.factory(dict(record("Ash and Birch"), damchimera="Bicolor", damchimeracolour="None"), 1)
+
+
+def test_discovery_genes_come_from_the_ruleset():
+    assert "Snowstorm" in Pairing.factory(dict(record("Ash and Birch"), siregene4="Snowstorm"), 1).sire.genes
+    data = dict(record("Ash and Birch"), damgene2="Aurora")
+    with pytest.raises(ValueError, match="damgene2 can't be Aurora"):
+        Pairing.factory(data, 1)
+    ruleset = compile_ruleset({"genetic_discovery": [{"parents": ["Mask", "Sable"], "gene": "Aurora",
+                                                      "rarity": "common"}]})
+    assert Pairing.factory(data, 1, ruleset=ruleset).dam.genes == ["Sable", "Aurora"]
+
+
+def test_seeded_rosters_roll_the_same_litters_on_any_worker_count():
+    pairings = [Pairing.factory(record(f"Pairing {number}"), number) for number in range(6)]
+    one = list(roll_roster(pairings, seed=9))
+    assert [litter["pairing"] for litter in one] == [f"Pairing {number}" for number in range(6)]
+    assert list(roll_roster(pairings, seed=9, workers=2)) == one
+    assert list(roll_roster(pairings, seed=10)) != one
+
+
+def test_command_line_rolls_a_csv_roster(tmp_path):
+    roster = os.path.join(tmp_path, "roster.csv")
+    records = [record("Ash and Birch"), record("Cedar and Dusk", Alpha="true")]
+    with open(roster, "w", newline="") as roster_file:
+        writer = csv.DictWriter(roster_file, fieldnames=list(records[0]) + ["Alpha"])
+        writer.writeheader()
+        writer.writerows(records)
+    output = os.path.join(tmp_path, "litters.jsonl")
+    main([roster, "--seed", "4", "--output", output])
+    with open(output) as litters_file:
+        litters = [json.loads(line) for line in litters_file]
+    with open(roster, newline="") as roster_file:
+        assert litters == list(roll_roster(load_roster(roster_file, "csv"), seed=4))
+    assert [litter["pairing"] for litter in litters] == ["Ash and Birch", "Cedar and Dusk"]
+    assert all(litter["puppies"] for litter in litters)
+
+
+def test_command_line_rejects_a_bad_roster_before_rolling_anything(tmp_path, capsys):
+    roster = os.path.join(tmp_path, "roster.json")
+    with open(roster, "w") as roster_file:
+        json.dump([record("Ash and Birch"), record("Cedar and Dusk", Stardust="lots")], roster_file)
+    output = os.path.join(tmp_path, "litters.jsonl")
+    with pytest.raises(SystemExit) as exit_info:
+        main([roster, "--output", output])
+    assert exit_info.value.code == 2
+    assert "Cedar and Dusk's Stardust can't be lots" in capsys.readouterr().err
+    assert not os.path.exists(output)
@@ -0,0 +1,54 @@
+import json
+import os
+
+import pytest
+
+from genos import benchmarks
+
+
+def result(name, seconds):
+    return {"name": name, "best_seconds": seconds, "median_seconds": seconds, "pups": 100,
+            "pups_per_second": 100 / seconds, "peak_memory_bytes": 1024}
+
+
+def run(monkeypatch, seconds, *argv):
+    """Runs python -m genos.benchmarks with made up timings rather than rolling anything."""
+    monkeypatch.setattr(benchmarks, "cold_start_benchmarks", lambda: [])
+    monkeypatch.setattr(benchmarks, "breeding_benchmarks",
+                        lambda: [result(name, time) for name, time in seconds.items()])
+    benchmarks.main(["--skip-random-vespers", *argv])
+
+
+def test_compare_flags_regressions(tmp_path, monkeypatch, capsys):
+    before = os.path.join(tmp_path, "before.json")
+    run(monkeypatch, {"roll_breeding": 0.010, "perform_test": 0.200, "get_genes": 0.001}, "--output", before)
+    with open(before) as before_file:
+        report = json.load(before_file)
+    assert set(report) == {"commit", "python", "platform", "time", "results"}
+    assert [saved["name"] for saved in report["results"]] == ["roll_breeding", "perform_test", "get_genes"]
+    capsys.readouterr()
+
+    # A little slower is noise, more than REGRESSION_THRESHOLD is flagged, and new benchmarks have nothing to go on.
+    after = {"roll_breeding": 0.0105, "perform_test": 0.300, "get_genes": 0.0005, "new": 1.0}
+    run(monkeypatch, after, "--compare", before)
+    lines = capsys.readouterr().out.splitlines()
+    assert "roll_breeding: +5.0% time" in lines
+    assert "perform_test: +50.0% time - REGRESSION" in lines
+    assert "get_genes: -50.0% time" in lines
+    assert not any(line.startswith("new: ") and "time" in line for line in lines)
+
+    with pytest.raises(SystemExit, match="perform_test"):
+        run(monkeypatch, after, "--compare", before, "--fail-on-regression")
+    run(monkeypatch, {"roll_breeding": 0.009}, "--compare", before, "--fail-on-regression")
+
+
+def test_check_budget_holds_vectorised_tests_to_their_budget(monkeypatch):
+    monkeypatch.setattr(benchmarks, "cold_start_benchmarks",
+                        lambda: [dict(result("Cold start import and first litter", 0.01), lazy_modules_loaded=[])])
+    monkeypatch.setattr(benchmarks, "breeding_benchmarks",
+                        lambda: [result(benchmarks.VECTORISED_TEST_BENCHMARK, seconds)])
+    seconds = benchmarks.VECTORISED_TEST_BUDGET_SECONDS * 0.9
+    benchmarks.main(["--skip-random-vespers", "--check-budget"])
+    seconds = benchmarks.VECTORISED_TEST_BUDGET_SECONDS * 1.25
+    with pytest.raises(SystemExit, match="over the"):
+        benchmarks.main(["--skip-random-vespers", "--check-budget"])
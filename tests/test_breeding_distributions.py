@@ -0,0 +1,47 @@
+import math
+
+import pytest
+
+from genos.breeding_distributions import BreedingDistributions
+from genos.breeding_logic import get_vectorised_engine
+from helpers import HORNED, parent, roller as make_roller
+
+BOOSTS = {"Alpha": True, "Bonded": True, "VirusReduction": 5, "Inbred": 1, "Stardust": 10}
+BICOLOR = dict(HORNED, chimera_status="Bicolor", chimera_colour="Lush Mint")
+PUPS = 20000
+
+
+def roller():
+    pairing = make_roller(parent("sire", ["Mask", "Gleam", "Comet", "Sable"], BICOLOR, tail="Skeletal"),
+                          parent("dam", ["Comet", "Stardust", "Points"], BICOLOR, colour="Harvest Cocoa",
+                                 tail="Cloud", mutation="Gills"),
+                          BOOSTS, seed=11, is_test=True)
+    pairing.gene_boost = pairing.get_gene_boost()
+    return pairing
+
+
+def scalar(pairing):
+    return pairing.get_test_accumulator(PUPS)
+
+
+def vectorised(pairing):
+    engine = get_vectorised_engine()
+    if engine is None:
+        pytest.skip("needs NumPy")
+    return engine(pairing, 11).run(PUPS)
+
+
+@pytest.mark.parametrize("sample", [scalar, vectorised])
+def test_sampled_shares_match_the_exact_distributions(sample):
+    pairing = roller()
+    exact = BreedingDistributions(pairing)
+    expected = dict(exact.all_distributions(), **{"Number of pups": exact.number_cubs()})
+    accumulator = sample(pairing)
+    for trait, probabilities in expected.items():
+        # A pup with no major mutations is counted under None, which the exact tables write out as "None".
+        shares = {"None" if share.value is None else share.value: share.share for share in accumulator.shares(trait)}
+        for value in set(probabilities) | set(shares):
+            probability = probabilities.get(value, 0)
+            # Five standard errors, and a little for rounding in the exact tables
+            allowed = 5 * math.sqrt(probability * (1 - probability) / PUPS) + 0.002
+            assert shares.get(value, 0) == pytest.approx(probability, abs=allowed), (trait, value)
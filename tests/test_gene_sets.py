@@ -0,0 +1,91 @@
+import itertools
+import random
+
+from genos.gene_sets import DiscoveryIndex, discovery_index, gene_mask, mask_codes, names_mask
+from genos.genes import Rarity, gene_codes, gene_rarity_index
+from genos.rng import RollRandom
+from genos.ruleset import DEFAULT_RULESET, compile_ruleset
+from helpers import parent, roller
+
+DISCOVERIES = [gene for gene, _ in DEFAULT_RULESET.genetic_discovery_genes.values()]
+GENES = list(dict.fromkeys(list(gene_rarity_index) + DISCOVERIES))
+PARENT_GENES = sorted({gene for pair in DEFAULT_RULESET.genetic_discovery_genes for gene in pair})
+
+
+def list_trim(rng, gene_list, max_genes):
+    """trim_genes as it was before gene sets, a list per rarity."""
+    for rarity in [Rarity.COMMON, Rarity.UNCOMMON, Rarity.RARE, Rarity.MYTHIC]:
+        rarity_genes = [gene for gene in gene_list if gene_rarity_index.get(gene_codes.names[gene]) == rarity]
+        rng.shuffle(rarity_genes)
+        for gene in rarity_genes:
+            if len(gene_list) <= max_genes:
+                return
+            gene_list.remove(gene)
+
+
+def list_discoveries(sire_genes, dam_genes, genetic_discovery_genes=DEFAULT_RULESET.genetic_discovery_genes):
+    """get_genes' genetic discovery check as it was before gene sets."""
+    found = []
+    for (one, two), (gene, rarity) in genetic_discovery_genes.items():
+        if (one in sire_genes and two in dam_genes) or (two in sire_genes and one in dam_genes):
+            found.append((gene_codes.code(gene), rarity))
+    return found
+
+
+def test_mask_round_trip():
+    codes = [gene_codes.code(gene) for gene in GENES]
+    assert mask_codes(gene_mask(codes)) == sorted(set(codes))
+    assert names_mask(GENES) == gene_mask(codes)
+
+
+def test_trim_matches_the_list_version():
+    picks = random.Random(1)
+    for seed in range(300):
+        genes = [gene_codes.code(gene) for gene in picks.sample(GENES, picks.randint(1, 16))]
+        max_genes = picks.randint(1, 10)
+        if len(genes) <= max_genes:
+            continue
+        trimmer = roller(parent("sire"), parent("dam"), seed=seed)
+        trimmed = list(genes)
+        mask = trimmer.trim_genes(trimmed, max_genes)
+        expected = list(genes)
+        rng = RollRandom(seed)
+        list_trim(rng, expected, max_genes)
+        assert trimmed == expected
+        assert mask == gene_mask(expected)
+        # The same number of shuffles, so whatever is rolled next comes out the same too.
+        assert trimmer.rng.getrandbits(64) == rng.getrandbits(64)
+
+
+def test_discoveries_match_the_list_version():
+    picks = random.Random(2)
+    for _ in range(300):
+        sire_genes = picks.sample(PARENT_GENES, picks.randint(0, 10))
+        dam_genes = picks.sample(PARENT_GENES, picks.randint(0, 10))
+        found = discovery_index(DEFAULT_RULESET).discoveries(names_mask(sire_genes), names_mask(dam_genes))
+        assert found == list_discoveries(sire_genes, dam_genes)
+
+
+def test_a_big_discovery_table_matches_the_list_version():
+    # Every pair of a few dozen genes is a rule, listed in shuffled order, which the results have to keep.
+    picks = random.Random(3)
+    pairs = list(itertools.combinations(GENES[:40], 2))
+    picks.shuffle(pairs)
+    rules = {pair: (picks.choice(GENES), picks.choice(list(Rarity))) for pair in pairs}
+    index = DiscoveryIndex(rules)
+    for _ in range(100):
+        sire_genes = picks.sample(GENES, picks.randint(0, 10))
+        dam_genes = picks.sample(GENES, picks.randint(0, 10))
+        found = index.discoveries(names_mask(sire_genes), names_mask(dam_genes))
+        assert found == list_discoveries(sire_genes, dam_genes, rules)
+
+
+def test_discovery_indexes_are_kept_per_ruleset():
+    assert discovery_index(DEFAULT_RULESET) is discovery_index(DEFAULT_RULESET)
+    ruleset = compile_ruleset({"genetic_discovery": [{"parents": ["Mask", "Sable"], "gene": "Ruffle",
+                                                      "rarity": "common"}]})
+    index = discovery_index(ruleset)
+    assert index is not discovery_index(DEFAULT_RULESET)
+    ruffle = (gene_codes.code("Ruffle"), Rarity.COMMON)
+    assert index.discoveries(names_mask(["Sable"]), names_mask(["Mask", "Comet"])) == [ruffle]
+    assert discovery_index(DEFAULT_RULESET).discoveries(names_mask(["Sable"]), names_mask(["Mask"])) == []
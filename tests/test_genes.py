@@ -0,0 +1,46 @@
+import pytest
+
+from genos import genes
+from genos.genes import Rarity, TailDetails
+
+
+def test_indexes_are_read_only():
+    for index in [genes.gene_rarity_index, genes.horn_rarity_index, genes.base_rarity_index, genes.tail_index,
+                  genes.colour_index, genes.colour_modifier_base_index, genes.tail_families]:
+        with pytest.raises(TypeError):
+            index["Mask"] = Rarity.COMMON
+    assert isinstance(genes.vesper_modifier_index, frozenset)
+
+
+def test_indexes_agree_with_the_lists():
+    for rarity, gene_list in [(Rarity.MYTHIC, genes.all_mythic_genes), (Rarity.RARE, genes.all_rare_genes),
+                              (Rarity.UNCOMMON, genes.all_uncommon_genes), (Rarity.COMMON, genes.all_common_genes)]:
+        assert all(genes.gene_rarity_index[gene] == rarity for gene in gene_list)
+    assert len(genes.gene_rarity_index) == len(genes.all_genes)
+    assert set(genes.horn_rarity_index) == set(genes.all_horns)
+    for (modifier, base), colours in genes.colour_modifier_base_index.items():
+        assert all(genes.colour_index[colour][:2] == (modifier, base) for colour in colours)
+    assert sum(len(colours) for colours in genes.colour_modifier_base_index.values()) == len(genes.colour_index)
+
+
+def test_tail_index():
+    assert genes.tail_index["Domestic"] == TailDetails(None, Rarity.DEFAULT, None)
+    assert genes.tail_index["Hook"] == TailDetails("Reptile", Rarity.MYTHIC, 0)
+    assert genes.tail_index["Docked"] == TailDetails("Bobbed", Rarity.COMMON, 3)
+    assert genes.tail_index["Tailless"] == TailDetails(None, Rarity.RARE, None)
+    for family_name, family in genes.tail_families.items():
+        for position, tail in enumerate(family):
+            if tail != "None":
+                assert genes.tail_index[tail].family == family_name
+                assert genes.tail_index[tail].position == position
+
+
+@pytest.mark.parametrize("families, error", [
+    ({"Silk": ("None", "Saluki", "Silk", "Strand"), "Reptile": ("Hook", "Gator", "Reptile", "Strand")},
+     "Strand tail is in both the Silk and Reptile families"),
+    ({"Silk": ("None", "Silk", "Saluki", "Strand")}, "Silk tail is in the wrong place"),
+    ({"Silk": ("None", "Saluki", "Silk", "Velvet")}, "Velvet tail is in the Silk family but has no rarity"),
+])
+def test_bad_tail_families_are_rejected(families, error):
+    with pytest.raises(ValueError, match=error):
+        genes.build_tail_index(families)
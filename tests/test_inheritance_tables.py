@@ -0,0 +1,49 @@
+from collections import Counter
+
+import pytest
+
+from genos.breeding_distributions import BreedingDistributions
+from genos.inheritance_tables import AliasTable
+from helpers import parent, roller
+
+COLUMNS = 100000
+
+
+class EvenRandom:
+    """random() walks evenly across [0, 1), so a table's draws come out in exactly its proportions."""
+
+    def __init__(self):
+        self.draws = 0
+
+    def random(self):
+        self.draws += 1
+        return ((self.draws - 1) % COLUMNS + 0.5) / COLUMNS
+
+
+@pytest.mark.parametrize("distribution", [{"a": 0.5, "b": 0.25, "c": 0.25},
+                                          {"a": 0.01, "b": 0.2, "c": 0.0, "d": 0.79},
+                                          {"a": 3, "b": 1},
+                                          {"only": 0.4}])
+def test_draws_come_out_in_the_tables_proportions(distribution):
+    table = AliasTable(distribution)
+    rng = EvenRandom()
+    drawn = Counter(table.draw(rng) for _ in range(COLUMNS))
+    total = sum(distribution.values())
+    assert set(drawn) == {value for value, probability in distribution.items() if probability > 0}
+    for value, count in drawn.items():
+        assert count / COLUMNS == pytest.approx(distribution[value] / total, abs=2 / COLUMNS)
+
+
+def test_tables_are_compiled_from_the_exact_distributions_and_shared():
+    first = roller(parent("sire", ["Mask"], tail="Skeletal"), parent("dam", ["Sable"], tail="Cloud"))
+    second = roller(parent("sire", ["Comet"], tail="Skeletal"), parent("dam", ["Points"], tail="Cloud"))
+    tails = first.inheritance_tables.tail
+    assert second.inheritance_tables.tail is tails
+    exact = BreedingDistributions(first).tail()
+    assert sorted(tails.values) == sorted(value for value, probability in exact.items() if probability > 0)
+
+    # A different gene_boost is a different table, built when the roller next asks for one.
+    first.gene_boost = 10
+    boosted = first.inheritance_tables.tail
+    assert boosted is not tails and boosted is first.inheritance_tables.tail
+    assert first.inheritance_tables.gene_boost == 10
@@ -0,0 +1,50 @@
+from genos.instrumentation import INSTRUMENTED_STEPS, RollStats
+from genos.rng import RollRandom
+from helpers import HORNED, parent, roller
+
+MODIFIERS = {"Bonded": True, "Inbred": 1, "Stardust": 10}
+
+
+def pairing(seed, **options):
+    return roller(parent("sire", ["Mask", "Gleam", "Comet"], HORNED), parent("dam", ["Sable", "Comet"], HORNED),
+                  MODIFIERS, seed=seed, **options)
+
+
+def test_instrumented_rolls_count_and_time_every_step():
+    stats = RollStats()
+    hooked = []
+    instrumented = pairing(6, stats=stats, stats_hook=lambda step, seconds: hooked.append((step, seconds)))
+    for _ in range(10):
+        instrumented.roll_breeding()
+    pups = len(instrumented.puppies_class_format)
+    assert stats.pups == stats.step_calls["get_puppy"] == pups
+    assert stats.step_calls["get_number_cubs"] == 10
+    assert stats.step_calls["get_genes"] == stats.step_calls["get_health"] == pups
+    assert set(stats.step_calls) <= set(INSTRUMENTED_STEPS)
+    assert all(seconds > 0 for seconds in stats.step_seconds.values())
+    assert stats.rng_draws > pups and stats.draws_per_pup == stats.rng_draws / pups
+    # The hook hears about every timed call, with the same seconds the stats add up.
+    assert len(hooked) == sum(stats.step_calls.values())
+    assert sum(seconds for step, seconds in hooked if step == "get_tail") == stats.step_seconds["get_tail"]
+    assert stats.as_dict()["steps"]["get_puppy"]["calls"] == pups
+
+
+def test_instrumenting_a_roller_leaves_its_rolls_alone():
+    plain = pairing(6)
+    instrumented = pairing(6, stats=RollStats())
+    for _ in range(10):
+        plain.roll_breeding()
+        instrumented.roll_breeding()
+    assert [pup.dictionary_form for pup in instrumented.puppies_class_format] == \
+        [pup.dictionary_form for pup in plain.puppies_class_format]
+
+
+def test_uninstrumented_rollers_run_the_plain_methods():
+    plain = pairing(6)
+    assert type(plain.rng) is RollRandom
+    assert not set(vars(plain)) & set(INSTRUMENTED_STEPS)
+    # Two rollers can share one RollStats.
+    stats = RollStats()
+    for seed in range(2):
+        pairing(seed, stats=stats).roll_breeding()
+    assert stats.step_calls["get_number_cubs"] == 2
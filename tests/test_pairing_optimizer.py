@@ -0,0 +1,132 @@
+import pytest
+
+from genos.breeding_distributions import BreedingDistributions
+from genos.breeding_logic import MALE, SEX, BreedingRoller
+from genos.pairing_optimizer import PairingOptimizer, TraitTarget, gene_shown
+from genos.rng import RollRandom
+from helpers import HORNED, MODIFIERS, parent, sampled_share
+
+# Twelve genes between them, so some get trimmed, and a chimera sire so both gene calls are made.
+SIRE = parent("sire", ["Banded", "Barring", "Blanket", "Blaze", "Cloak", "Stardust"], chimera_status="Chimera",
+              chimera_colour="Coal", base="Woolen")
+DAM = parent("dam", ["Collared", "Comet", "Dawn", "Acid", "Brindle", "Crawler"], HORNED,
+             subspecies="Bat Eared Pygmy Vesper")
+
+
+def sampled_male_share(modifiers, litters=2000):
+    rng = RollRandom(7)
+    males = pups = 0
+    for _ in range(litters):
+        roller = BreedingRoller([parent("sire", ["Mask"]), parent("dam", ["Mask"])], modifiers, rng=rng)
+        for pup in roller.roll_litter():
+            males += pup.traits[SEX] == MALE
+            pups += 1
+    return males / pups
+
+
+def test_sex_target_matches_sampled_litters():
+    options = [dict(MODIFIERS), dict(MODIFIERS, MaleBoost=True), dict(MODIFIERS, FemaleBoost=True),
+               dict(MODIFIERS, MaleBoost=True, FemaleBoost=True)]
+    optimizer = PairingOptimizer(TraitTarget({"Sex": ["Male"]}))
+    scores = optimizer.best_pairings([parent("sire", ["Mask"])], [parent("dam", ["Mask"])], options,
+                                     top=len(options))
+    assert len(scores) == len(options)
+    for score in scores:
+        assert abs(score.probability - sampled_male_share(score.modifiers)) < 0.03
+    # A lone booster works 80% of the time and both cancel out.
+    expected = {(False, False): 0.5, (True, False): 0.9, (False, True): 0.1, (True, True): 0.5}
+    assert {(score.modifiers["MaleBoost"], score.modifiers["FemaleBoost"]): score.probability
+            for score in scores} == pytest.approx(expected)
+
+
+def score(target):
+    optimizer = PairingOptimizer(TraitTarget(target))
+    return optimizer.score_without_genes(optimizer.get_roller(SIRE, DAM, MODIFIERS))[0]
+
+
+@pytest.mark.parametrize("gene", ["Banded", "Stardust"])
+def test_gene_target_matches_sampled_litters(gene):
+    optimizer = PairingOptimizer(TraitTarget({"Genes": [gene]}))
+    probability, bound = optimizer.score_without_genes(optimizer.get_roller(SIRE, DAM, MODIFIERS))
+    exact = optimizer.get_gene_chance(optimizer.get_roller(SIRE, DAM, MODIFIERS))
+    assert probability == 1.0
+    assert exact <= bound + 1e-12
+    assert optimizer._gene_cache
+    sampled = sampled_share(SIRE, DAM, lambda pup: any(gene_shown(gene, shown)
+                                                        for shown in pup.genes + pup.chimera_genes))
+    assert abs(exact - sampled) < 0.03
+
+
+def test_coat_type_target_matches_the_distributions():
+    distribution = BreedingDistributions(BreedingRoller([SIRE, DAM], MODIFIERS)).all_distributions()["Coat Type"]
+    for base in ["Smooth", "Woolen", "Maned"]:
+        assert score({"Coat Type": [base]}) == pytest.approx(distribution.get(base, 0))
+
+
+def test_coat_type_and_subspecies_are_joint():
+    # Pygmies can't be woolen, so they're smooth more often than other pups.
+    pygmy = ["Bat Eared Pygmy Vesper"]
+    assert score({"Coat Type": ["Woolen"], "Subspecies": pygmy}) == 0
+    smooth_pygmy = score({"Coat Type": ["Smooth"], "Subspecies": pygmy})
+    assert smooth_pygmy > score({"Coat Type": ["Smooth"]}) * score({"Subspecies": pygmy})
+    sampled = sampled_share(SIRE, DAM, lambda pup: pup.base == "Smooth" and pup.subspecies == pygmy[0])
+    assert abs(smooth_pygmy - sampled) < 0.03
+
+
+def test_pruned_top_pairings_match_a_full_ranking():
+    sires = [SIRE, parent("sire 2", ["Banded", "Barring"], tail="Skeletal"),
+             parent("sire 3", ["Banded", "Acid", "Dun", "Etched", "Jacket", "Dapple"], HORNED)]
+    dams = [DAM, parent("dam 2", ["Banded"]), parent("dam 3", ["Sable", "Comet"], tail="Skeletal")]
+    options = [dict(MODIFIERS), dict(MODIFIERS, Bonded=True)]
+    target = TraitTarget({"Genes": ["Banded"], "Tails": ["Domestic Tail", "Skeletal Tail"]})
+
+    full = PairingOptimizer(target)
+    ranking = []
+    for sire in sires:
+        for dam in dams:
+            for modifiers in options:
+                roller = full.get_roller(sire, dam, modifiers)
+                probability, bound = full.score_without_genes(roller)
+                gene_chance = full.get_gene_chance(roller)
+                assert gene_chance <= bound + 1e-12
+                ranking.append((probability * gene_chance, sire.name, dam.name, modifiers["Bonded"]))
+    ranking.sort(reverse=True)
+
+    optimizer = PairingOptimizer(target)
+    worked_out = []
+    get_gene_chance = optimizer.get_gene_chance
+    optimizer.get_gene_chance = lambda roller: worked_out.append(roller) or get_gene_chance(roller)
+    scores = optimizer.best_pairings(sires, dams, options, top=3)
+    assert [(score.sire.name, score.dam.name, score.modifiers["Bonded"]) for score in scores] == \
+        [pairing[1:] for pairing in ranking[:3]]
+    assert [score.probability for score in scores] == pytest.approx([pairing[0] for pairing in ranking[:3]])
+    # The top three were settled before every pairing's genes had to be worked out.
+    assert len(worked_out) < len(ranking)
+
+
+def test_pairings_sharing_traits_share_results():
+    sires = [parent(f"sire {number}", genes) for number, genes in enumerate([["Mask"], ["Sable"], ["Comet"]])]
+    dams = [parent(f"dam {number}", genes) for number, genes in enumerate([["Mask"], ["Cloak"]])]
+    optimizer = PairingOptimizer(TraitTarget({"Tails": ["Domestic Tail"]}))
+    worked_out = []
+    trait_chance = optimizer._trait_chance
+    optimizer._trait_chance = lambda roller, trait: worked_out.append(trait) or trait_chance(roller, trait)
+    scores = optimizer.best_pairings(sires, dams, [MODIFIERS], top=len(sires) * len(dams))
+    assert len(scores) == len(sires) * len(dams)
+    assert worked_out == ["Tails"]
+
+    # The same twelve genes under different tails only go through the gene distribution once.
+    optimizer = PairingOptimizer(TraitTarget({"Genes": ["Banded"]}))
+    optimizer.best_pairings([SIRE, parent("sire 2", SIRE.genes, tail="Skeletal")], [DAM], [MODIFIERS], top=2)
+    assert len(optimizer._gene_cache) == 2
+
+
+def test_values_are_checked_against_the_trait():
+    with pytest.raises(ValueError, match="Skeletal Tail"):
+        TraitTarget({"Tails": ["Skeletal"]})
+    for conditions in [{"Genes": ["Not a gene"]}, {"Coat Type": ["Fluffy"]}, {"Major Mutations": ["Fins"]},
+                       {"Sex": ["Male", "Neither"]}]:
+        with pytest.raises(ValueError):
+            TraitTarget(conditions)
+    TraitTarget({"Tails": ["Skeletal Tail"], "Major Mutations": ["None"], "Genes": ["Mask (Gleam)"],
+                 "Health": ["Healthy"], "Chimera": ["None", "Bicolor"]})
@@ -0,0 +1,19 @@
+from genos.parallel import run_parallel_test, shutdown_pool
+from helpers import HORNED, parent, roller
+
+
+def totals(workers):
+    pairing = roller(parent("sire", ["Mask", "Gleam", "Comet"], HORNED), parent("dam", ["Sable", "Comet"], HORNED),
+                     {"Inbred": 1, "Stardust": 10}, seed=5, is_test=True)
+    pairing.gene_boost = pairing.get_gene_boost()
+    accumulator = run_parallel_test(pairing, 25000, workers)
+    return accumulator.items, {trait: sorted(histogram.items(), key=repr)
+                               for trait, histogram in accumulator.histograms.items()}
+
+
+def test_pool_run_matches_one_worker():
+    try:
+        assert totals(2) == totals(1)
+        assert totals(1)[0] == 25000
+    finally:
+        shutdown_pool()
@@ -0,0 +1,40 @@
+from genos.breeding_logic import Puppy
+from genos.pairing_optimizer import TraitTarget
+from genos.population import PopulationSimulator, TargetSelection, puppy_to_vesper
+from genos.rng import RollRandom
+from helpers import parent as founder
+
+
+def gleam_share(report):
+    return sum(share for gene, share in report.frequencies["Genes"].items() if "Gleam" in gene)
+
+
+def test_puppy_to_vesper_passes_on_attached_gleam():
+    pup = Puppy("pup")
+    pup.genes = ["Mask (Gleam)", "Sable"]
+    assert puppy_to_vesper(pup).genes == ["Mask", "Sable", "Gleam"]
+
+
+def test_full_chimera_parent_has_at_most_ten_genes():
+    pup = Puppy("pup")
+    pup.genes = ["Mask (Gleam)", "Sable", "Comet", "Collared", "Barring"]
+    pup.chimera_genes = ["Leopard", "Acid", "Brindle", "Cloak", "Dapple"]
+    genes = puppy_to_vesper(pup).genes
+    assert len(genes) == 10
+    assert genes[-1] == "Gleam"
+    assert "Mask" in genes
+
+
+def test_gleam_survives_a_line():
+    simulator = PopulationSimulator(TargetSelection(TraitTarget({"Genes": ["Gleam"]}), 0.05), size=2000)
+    reports = simulator.run([founder("sire", ["Mask", "Gleam"])], [founder("dam", ["Sable", "Gleam"])], 4,
+                            RollRandom(3))
+    assert len(reports) == 4
+    assert all(gleam_share(report) > 0 for report in reports)
+
+
+def test_selecting_for_a_tail_raises_its_share():
+    simulator = PopulationSimulator(TargetSelection(TraitTarget({"Tails": ["Docked Tail"]})), size=1000)
+    reports = simulator.run([founder("sire", ["Mask"], tail="Docked")], [founder("dam", ["Sable"])], 4, RollRandom(3))
+    shares = [report.frequencies["Tails"].get("Docked Tail", 0) for report in reports]
+    assert shares[-1] > shares[0]
@@ -0,0 +1,46 @@
+import pytest
+
+from genos.breeding_logic import PUPPY_TRAIT_CODES, TAIL, Puppy
+from genos.genes import GLEAM_FLAG, all_tails, gene_codes, health_codes, tail_codes
+
+TRAITS = ["health", "sex", "colour", "chimera_colour", "horns", "tail", "base", "modifier", "subspecies",
+          "minor_mutation", "chimera_status"]
+
+
+def test_a_new_pup_is_the_plain_option_of_everything():
+    pup = Puppy("Pup 1")
+    assert (pup.health, pup.sex, pup.colour, pup.horns, pup.tail, pup.base, pup.modifier, pup.chimera_status) == \
+        ("Healthy", "Male", "Sand", "None", "Domestic Tail", "Smooth", "None", "None")
+    assert (pup.genes, pup.chimera_genes, pup.major_mutations) == ([], [], [])
+
+
+@pytest.mark.parametrize("index, trait", list(enumerate(TRAITS)))
+def test_every_value_round_trips_through_its_code(index, trait):
+    codes = PUPPY_TRAIT_CODES[index]
+    pup = Puppy("Pup 1")
+    for code in range(len(codes)):
+        setattr(pup, trait, codes.name(code))
+        assert pup.traits[index] == code
+        assert getattr(pup, trait) == codes.name(code)
+
+
+def test_suffixes_health_and_gleam():
+    pup = Puppy("Pup 1")
+    for tail in all_tails:
+        # Set with or without the suffix, and always read with it.
+        pup.tail = tail
+        assert pup.tail == f"{tail} Tail"
+        pup.tail = f"{tail} Tail"
+        assert pup.traits[TAIL] == tail_codes.code(tail)
+    pup.health = "Stillborn, Sterile"
+    assert pup.traits[0] == health_codes.code("Sterile, Stillborn") == 3
+    pup.genes = ["Mask (Gleam)", "Sable"]
+    assert pup.gene_codes == (gene_codes.code("Mask") | GLEAM_FLAG, gene_codes.code("Sable"))
+    assert pup.genes == ["Mask (Gleam)", "Sable"]
+
+
+def test_pups_only_have_their_slots():
+    pup = Puppy("Pup 1")
+    assert not hasattr(pup, "__dict__")
+    with pytest.raises(AttributeError):
+        pup.colour_name = "Sand"
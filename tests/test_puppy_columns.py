@@ -0,0 +1,53 @@
+import io
+import json
+
+from genos.breeding_logic import BreedingRoller
+from genos.puppy_columns import ROW_FIELDS, PuppyColumns
+from genos.rng import RollRandom
+from helpers import HORNED, MODIFIERS, parent
+
+PARENT = dict(HORNED, colour="Derecho Wine", tail="Skeletal", modifier="Albinism", chimera_colour="Gem Ink")
+
+
+def columns():
+    litters = PuppyColumns()
+    rng = RollRandom(8)
+    for number in range(20):
+        roller = BreedingRoller([parent("sire", ["Mask", "Gleam", "Comet", "Leopard", "Acid"], PARENT,
+                                        chimera_status="Chimera"),
+                                 parent("dam", ["Sable", "Comet", "Cloak"], PARENT, chimera_status="Bicolor")],
+                                dict(MODIFIERS, Alpha=True, Bonded=True, Inbred=2, Stardust=15),
+                                rng=rng.spawn(number))
+        roller.roll_breeding()
+        litters.add_roller(f"Pairing {number}", roller)
+    return litters
+
+
+def test_binary_round_trip():
+    written = columns()
+    binary = io.BytesIO()
+    assert written.write_binary(binary) == len(written)
+    binary.seek(0)
+    read = PuppyColumns.read_binary(binary)
+    assert len(read) == len(written) > 20
+    assert list(read.rows()) == list(written.rows())
+    assert [pup.dictionary_form for pup in read.puppies()] == [pup.dictionary_form for pup in written.puppies()]
+
+
+def test_rows_match_the_puppies_and_json():
+    litters = columns()
+    rows = list(litters.rows())
+    for row, pup in zip(rows, litters.puppies()):
+        dictionary_form = pup.dictionary_form
+        assert row[ROW_FIELDS.index("Appearance")] == dictionary_form["Appearance"]
+        assert row[ROW_FIELDS.index("Abnormalities")] == dictionary_form["Abnormalities"]
+    lines = io.StringIO()
+    litters.write_jsonl(lines)
+    assert [json.loads(line) for line in lines.getvalue().splitlines()] == [dict(zip(ROW_FIELDS, row))
+                                                                            for row in rows]
+
+
+def test_extend_keeps_each_pups_pairing():
+    first, second = columns(), columns()
+    joined = PuppyColumns().extend(first).extend(second)
+    assert list(joined.rows()) == list(first.rows()) + list(second.rows())
@@ -0,0 +1,78 @@
+import csv
+import io
+import json
+import math
+import os
+
+import pytest
+
+from genos import random_vesper_rolling_logic as vespers
+from genos.roll_journal import JournalReader, RollJournal
+from genos.rng import RollRandom
+from genos.ruleset import compile_ruleset
+from genos.vesper_distributions import VesperDistributions
+
+ROLLS = 20000
+
+
+def rolled():
+    return vespers.MaxRarityVesper(ROLLS, RollRandom(3)).tally()
+
+
+def vectorised():
+    generator = pytest.importorskip("genos.vectorised_vespers").VectorisedVesperGenerator(seed=3)
+    return generator.generate(ROLLS).tally()
+
+
+def test_written_results_match_get_results():
+    expected = vespers.MaxRarityVesper(50, RollRandom(7)).get_results()
+    jsonl = io.StringIO()
+    assert vespers.MaxRarityVesper(50, RollRandom(7)).write_results(jsonl) == 50
+    assert [json.loads(line) for line in jsonl.getvalue().splitlines()] == expected
+    rows = io.StringIO()
+    vespers.MaxRarityVesper(50, RollRandom(7)).write_results(rows, "csv")
+    rows.seek(0)
+    assert list(csv.DictReader(rows)) == expected
+
+
+def test_a_journal_gets_the_rolls_made_when_iter_results_stops_early(tmp_path):
+    path = os.path.join(tmp_path, "journal.bin")
+    with RollJournal(path) as journal:
+        roller = vespers.MaxRarityVesper(50, RollRandom(7), journal=journal)
+        stopped = roller.iter_results()
+        first = [next(stopped) for _ in range(20)]
+        stopped.close()
+        roller.get_results()
+    with JournalReader(path) as reader:
+        batches = reader.records
+        assert [record.count for record in batches] == [20, 50]
+        assert [vesper.coat for vesper in reader.vespers(batches[0])] == [vesper["coat"] for vesper in first]
+        assert all(reader.replay(record) for record in batches)
+
+
+@pytest.mark.parametrize("sample", [rolled, vectorised])
+def test_rolled_shares_match_the_exact_distributions(sample):
+    expected = VesperDistributions().all_distributions()
+    accumulator = sample()
+    for trait in accumulator.histograms:
+        probabilities = expected[trait]
+        shares = {share.value: share.share for share in accumulator.shares(trait)}
+        for value in set(probabilities) | set(shares):
+            probability = probabilities.get(value, 0)
+            allowed = 5 * math.sqrt(probability * (1 - probability) / ROLLS) + 0.002
+            assert shares.get(value, 0) == pytest.approx(probability, abs=allowed), (trait, value)
+
+
+def test_exact_report_follows_the_roller_ruleset():
+    ruleset = compile_ruleset({"random_vespers": {"gene_count": [3, 3], "rare_coat_chance": 40}})
+    report = vespers.MaxRarityVesper(1, RollRandom(1), ruleset).get_exact_report()
+    distributions = VesperDistributions(ruleset).all_distributions()
+    assert report == VesperDistributions(ruleset).report()
+    assert len(report) == len(distributions) + 1
+    assert "Total number of genes occurrence is 3: 100.00% " in report
+    assert "Coat Type occurrence is Maned: 40.00% " in "".join(report)
+    # Every table but genes, which a vesper shows several of, covers all of the chance there is.
+    for trait, probabilities in distributions.items():
+        if trait != "Genes":
+            assert sum(probabilities.values()) == pytest.approx(1), trait
+    assert sum(distributions["Genes"].values()) == pytest.approx(3)
@@ -0,0 +1,35 @@
+from genos import result_cache
+from genos.result_cache import ResultCache, pairing_fingerprint
+from helpers import MODIFIERS, parent
+
+
+def test_least_recently_used_goes_first():
+    cache = ResultCache(2, 60)
+    cache.put("a", 1)
+    cache.put("b", 2)
+    assert cache.get("a") == 1
+    cache.put("c", 3)
+    assert (cache.get("a"), cache.get("b"), cache.get("c")) == (1, None, 3)
+    assert (cache.hits, cache.misses, cache.evictions) == (3, 1, 1)
+
+
+def test_entries_expire(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(result_cache, "monotonic", lambda: now[0])
+    cache = ResultCache(10, 5)
+    cache.put("a", 1)
+    now[0] = 104.9
+    assert cache.get("a") == 1
+    # Reading an entry doesn't extend it.
+    now[0] = 105.0
+    assert cache.get("a") is None
+    assert cache.expired == 1
+    assert cache.as_dict()["size"] == 0
+
+
+def test_fingerprint_ignores_gene_and_modifier_order():
+    fingerprint = pairing_fingerprint(parent("sire", ["Mask", "Comet"]), parent("dam", ["Sable"]), MODIFIERS)
+    reordered = dict(reversed(list(MODIFIERS.items())))
+    assert pairing_fingerprint(parent("Sire", ["Comet", "Mask"]), parent("Dam", ["Sable"]), reordered) == fingerprint
+    assert pairing_fingerprint(parent("sire", ["Mask"]), parent("dam", ["Sable"]), MODIFIERS) != fingerprint
+    assert pairing_fingerprint(parent("dam", ["Sable"]), parent("sire", ["Mask", "Comet"]), MODIFIERS) != fingerprint
@@ -0,0 +1,34 @@
+from genos.rng import RollRandom
+from helpers import HORNED, parent, roller
+
+
+def draws(rng):
+    items = list(range(20))
+    rng.shuffle(items)
+    return ([rng.randint(1, 100) for _ in range(100)], [rng.randint(0, 3) for _ in range(100)], rng.random(),
+            rng.choice("abcdef"), items, rng.getrandbits(64))
+
+
+def litters(seed):
+    pairing = roller(parent("sire", ["Mask", "Gleam", "Comet"], HORNED), parent("dam", ["Sable", "Comet"], HORNED),
+                     {"Inbred": 1, "Stardust": 10}, seed=seed)
+    for _ in range(20):
+        pairing.roll_breeding()
+    return [pup.dictionary_form for pup in pairing.puppies_class_format]
+
+
+def test_same_seed_same_rolls():
+    assert draws(RollRandom(42)) == draws(RollRandom(42))
+    assert draws(RollRandom(42)) != draws(RollRandom(43))
+    assert litters(42) == litters(42)
+    assert litters(42) != litters(43)
+
+
+def test_spawned_streams_are_reproducible_and_independent():
+    parent_rng = RollRandom(42)
+    spawned = [parent_rng.spawn(index) for index in range(4)]
+    assert [rng.seed for rng in spawned] == [RollRandom(42).spawn(index).seed for index in range(4)]
+    assert len({rng.seed for rng in spawned} | {42}) == 5
+    assert len({repr(draws(rng)) for rng in spawned}) == 4
+    # Spawning and drawing from the children leaves the parent's own stream as it was.
+    assert draws(parent_rng) == draws(RollRandom(42))
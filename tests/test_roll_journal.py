@@ -0,0 +1,75 @@
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+from genos.genes import gene_codes
+from genos.roll_journal import JournalReader, RollJournal
+from helpers import HORNED, parent, roller
+
+
+# A booster that activates for one litter mustn't carry over to the next, which replay rolls on a fresh roller.
+@pytest.mark.parametrize("modifiers", [{}, {"MaleBoost": True}, {"FemaleBoost": True}])
+@pytest.mark.parametrize("seed", range(4))
+def test_every_litter_of_a_reused_roller_replays(tmp_path, seed, modifiers):
+    path = os.path.join(tmp_path, "journal.bin")
+    with RollJournal(path) as journal:
+        reused = roller(parent("sire", ["Mask", "Gleam", "Comet"], HORNED), parent("dam", ["Sable", "Comet"], HORNED),
+                        dict(modifiers, Inbred=1, Stardust=10), seed=seed, journal=journal)
+        for _ in range(6):
+            reused.roll_breeding()
+    with JournalReader(path) as reader:
+        assert len(reader.litters) == 6
+        assert len({record.seed for record in reader.litters}) == 6
+        assert all(reader.replay(record) for record in reader.litters)
+
+
+# Rolls litters into a journal in a fresh process whose gene codes have grown differently, then prints them.
+WRITER = """
+import json, sys
+from genos.breeding_logic import BreedingRoller, BreedingVesper
+from genos.genes import gene_codes
+from genos.rng import RollRandom
+from genos.roll_journal import RollJournal
+from genos.ruleset import compile_ruleset
+
+path, seed, *grown = sys.argv[1:]
+for gene in grown:
+    gene_codes.code(gene)
+ruleset = compile_ruleset({"genetic_discovery": [{"parents": ["Mask", "Sable"], "gene": "Aurora", "rarity": "common"}]})
+sire, dam = (BreedingVesper(name=name, colour="Sand", horns="None", tail="Domestic", base="Smooth", modifier="None",
+                            subspecies="None", mutation="None", chimera_status="None", chimera_colour="Sand",
+                            genes=genes) for name, genes in [("sire", ["Mask", "Comet"]), ("dam", ["Sable"])])
+modifiers = {"MaleBoost": False, "FemaleBoost": False, "Alpha": False, "SpringBlessing": False, "Bonded": False,
+             "VirusReduction": 0, "Inbred": 0, "SomnisBlessing": False, "Stardust": 0}
+roller = BreedingRoller([sire, dam], modifiers, password_valid=True, rng=RollRandom(int(seed)), ruleset=ruleset,
+                        journal=RollJournal(path))
+for _ in range(10):
+    roller.roll_breeding()
+roller.journal.close()
+print(json.dumps([pup.dictionary_form for pup in roller.puppies_class_format]))
+"""
+
+
+def write_session(path, seed, *grown):
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    written = subprocess.run([sys.executable, "-c", WRITER, path, str(seed), *grown], cwd=root, check=True,
+                             capture_output=True, text=True)
+    return json.loads(written.stdout)
+
+
+def test_sessions_from_other_processes_read_back_in_this_ones_codes(tmp_path):
+    path = os.path.join(tmp_path, "journal.bin")
+    pups = write_session(path, 1, "Borealis") + write_session(path, 2, "Cirrus", "Nimbus")
+    gene_codes.code("Stratus")
+    with JournalReader(path) as reader:
+        assert len(reader.sessions) == 2
+        assert reader.sessions[0]["gene"].index("Aurora") != reader.sessions[1]["gene"].index("Aurora")
+        read = [pup.dictionary_form for record in reader.litters for pup in reader.puppies(record)]
+        assert read == pups
+        assert any("Aurora" in pup["Appearance"] for pup in read)
+        assert all(reader.replay(record) for record in reader.litters)
+        aurora = reader.count({"genes": "Aurora"}, reader.litters)
+        assert aurora == sum("Aurora" in pup["Appearance"] for pup in pups)
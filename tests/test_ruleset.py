@@ -0,0 +1,66 @@
+import json
+import os
+
+import pytest
+
+from genos.ruleset import DEFAULT_RULESET, RulesetFile, compile_ruleset
+
+
+@pytest.mark.parametrize("field, value", [("bonded_virus_reduction", -5), ("bonded_virus_reduction", 120),
+                                          ("inbred_chance_per_ancestor", 2.5),
+                                          ("inbred_chance_per_ancestor", True)])
+def test_health_chances_are_percentages(field, value):
+    with pytest.raises(ValueError, match=f"health.{field}"):
+        compile_ruleset({"health": {field: value}})
+
+
+@pytest.mark.parametrize("rules", [{"pass_rates": {"common": 101}}, {"pass_rates": {"sparkly": 10}}, {"litters": {}},
+                                   {"litter_sizes": {"normal": [[60, 2], [20, 3], [100, 1]]}},
+                                   {"litter_sizes": {"normal": [[10, 4], [90, 2]]}},
+                                   {"health": {"inbred_chances": {"Stillborn": 80}}}])
+def test_bad_rules_are_rejected(rules):
+    with pytest.raises(ValueError):
+        compile_ruleset(rules)
+
+
+@pytest.mark.parametrize("uncommon_gene_chance, most", [(100, 13), (0, 22), (50, 35)])
+def test_gene_count_fits_the_genes_that_can_be_drawn(uncommon_gene_chance, most):
+    rules = {"random_vespers": {"uncommon_gene_chance": uncommon_gene_chance, "gene_count": [1, most]}}
+    assert compile_ruleset(rules).gene_count_range == (1, most)
+    rules["random_vespers"]["gene_count"] = [1, most + 1]
+    with pytest.raises(ValueError, match=f"at most {most} genes"):
+        compile_ruleset(rules)
+
+
+def test_rules_that_come_to_the_defaults_are_the_default_ruleset():
+    assert compile_ruleset() is DEFAULT_RULESET
+    assert compile_ruleset({"pass_rates": {"bonded_boost": 5}}) is DEFAULT_RULESET
+    changed = compile_ruleset({"pass_rates": {"bonded_boost": 10}})
+    assert changed.bonded_gene_boost == 10
+    assert changed.fingerprint != DEFAULT_RULESET.fingerprint
+    assert compile_ruleset({"pass_rates": {"bonded_boost": 10}}) is changed
+
+
+def write_rules(path, rules, modified):
+    with open(path, "w") as rules_file:
+        json.dump(rules, rules_file)
+    os.utime(path, ns=(modified, modified))
+
+
+def test_reload_swaps_in_whole_rulesets_and_keeps_the_last_good_one(tmp_path):
+    path = os.path.join(tmp_path, "rules.json")
+    write_rules(path, {"pass_rates": {"bonded_boost": 10}}, 10**18)
+    rules_file = RulesetFile(path, check_seconds=0)
+    before = rules_file.ruleset
+    assert before.bonded_gene_boost == 10
+
+    write_rules(path, {"pass_rates": {"bonded_boost": 20, "common": 150}}, 2 * 10**18)
+    assert rules_file.ruleset is before
+    assert isinstance(rules_file.last_error, ValueError)
+
+    write_rules(path, {"pass_rates": {"bonded_boost": 20, "common": 50}}, 3 * 10**18)
+    after = rules_file.ruleset
+    assert (after.bonded_gene_boost, after.common_pass_rate) == (20, 50)
+    assert rules_file.last_error is None
+    # A ruleset already handed out is never changed by a reload.
+    assert before.bonded_gene_boost == 10
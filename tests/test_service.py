@@ -0,0 +1,131 @@
+import asyncio
+import json
+
+import pytest
+
+from genos.genes import colour_codes, gene_codes
+from genos.service import MAX_BODY_BYTES, RollService
+from helpers import record
+
+
+def dispatch(method, path, body):
+    return asyncio.run(RollService().dispatch(method, path, body))
+
+
+@pytest.mark.parametrize("method, path, body, status", [
+    ("GET", "/health", b"", 200),
+    ("POST", "/nowhere", b"{}", 404),
+    ("GET", "/breeding", b"", 405),
+    ("POST", "/breeding", b"not json", 400),
+    ("POST", "/breeding", b"[1, 2]", 400),
+    ("POST", "/random-vesper", b'{"rolls": 0}', 400),
+    ("POST", "/random-vesper", b'{"generator": "Nothing"}', 400),
+])
+def test_dispatch_statuses(method, path, body, status):
+    assert dispatch(method, path, body)[0] == status
+
+
+def test_breeding_requests_are_rolled_and_missing_fields_rejected():
+    status, response = dispatch("POST", "/breeding/", json.dumps(dict(record("Ash and Birch"), seed=3)).encode())
+    assert status == 200
+    assert (response["pairing"], response["seed"]) == ("Ash and Birch", 3)
+    assert response["puppies"]
+    incomplete = record("Ash and Birch")
+    del incomplete["damhorns"]
+    status, response = dispatch("POST", "/breeding", json.dumps(incomplete).encode())
+    assert status == 400
+    assert "damhorns" in response["error"]
+
+
+@pytest.mark.parametrize("field, value", [("siregene1", "Made Up Gene"), ("damcoatcolour", "Made Up Colour")])
+def test_unknown_names_are_rejected_without_new_codes(field, value):
+    genes, colours = len(gene_codes), len(colour_codes)
+    request = dict(record("Ash and Birch"), **{field: value})
+    status, response = dispatch("POST", "/breeding", json.dumps(request).encode())
+    assert status == 400
+    assert value in response["error"]
+    assert (len(gene_codes), len(colour_codes)) == (genes, colours)
+    assert value not in gene_codes.codes and value not in colour_codes.codes
+
+
+def test_identical_tests_in_flight_are_rolled_once(monkeypatch):
+    rolled = []
+
+    async def run_in_pool(self, function, job):
+        rolled.append(job)
+        await asyncio.sleep(0.05)
+        return {"seed": job[1]}
+
+    monkeypatch.setattr(RollService, "run_in_pool", run_in_pool)
+    service = RollService()
+    test = dict(record("Ash and Birch"), test=True)
+
+    async def requests():
+        return await asyncio.gather(service.roll_breeding(test), service.roll_breeding(dict(test)),
+                                    service.roll_breeding(dict(test, Stardust=10)),
+                                    service.roll_breeding(dict(test, seed=5)))
+
+    first, second, boosted, seeded = asyncio.run(requests())
+    assert first is second
+    assert boosted is not first and seeded == {"seed": 5}
+    assert len(rolled) == 3
+    assert service.stats["coalesced"] == 1
+    assert not service._in_flight
+
+
+async def exchange(service, request: bytes, wait=5.0) -> bytes:
+    """Sends request to the service over a real connection and reads until it closes the connection."""
+    server = await asyncio.start_server(service.handle_connection, "127.0.0.1", 0)
+    try:
+        reader, writer = await asyncio.open_connection(*server.sockets[0].getsockname()[:2])
+        writer.write(request)
+        await writer.drain()
+        response = await asyncio.wait_for(reader.read(), wait)
+        writer.close()
+        return response
+    finally:
+        server.close()
+        await server.wait_closed()
+
+
+def test_requests_over_a_connection():
+    response = asyncio.run(exchange(RollService(), b"GET /health HTTP/1.1\r\nConnection: close\r\n\r\n"))
+    assert response.startswith(b"HTTP/1.1 200 OK\r\n")
+    assert json.loads(response.split(b"\r\n\r\n", 1)[1])["status"] == "ok"
+    too_big = f"POST /breeding HTTP/1.1\r\nContent-Length: {MAX_BODY_BYTES + 1}\r\n\r\n".encode()
+    assert asyncio.run(exchange(RollService(), too_big)).startswith(b"HTTP/1.1 413 Payload Too Large\r\n")
+
+
+@pytest.mark.parametrize("request_bytes", [b"", b"POST /breeding HTTP/1.1\r\nContent-Le",
+                                           b"POST /breeding HTTP/1.1\r\nContent-Length: 100\r\n\r\n{}"])
+def test_slow_clients_are_dropped(request_bytes):
+    # Idle, stopped half way through the headers and short of the body it said it would send.
+    assert asyncio.run(exchange(RollService(read_timeout=0.1), request_bytes, wait=2)) == b""
+
+
+def test_the_deadline_covers_the_whole_request():
+    async def trickle():
+        server = await asyncio.start_server(RollService(read_timeout=0.3).handle_connection, "127.0.0.1", 0)
+        try:
+            reader, writer = await asyncio.open_connection(*server.sockets[0].getsockname()[:2])
+            writer.write(b"POST /breeding HTTP/1.1\r\n")
+            # Each header arrives well within the timeout, but all of them together don't.
+            sent = 0
+            try:
+                for sent in range(1, 11):
+                    await asyncio.sleep(0.1)
+                    writer.write(b"X-Slow: 1\r\n")
+                    await writer.drain()
+                response = await asyncio.wait_for(reader.read(), 2)
+            except ConnectionError:
+                # Closed while we were still sending.
+                response = b""
+            writer.close()
+            return response, sent
+        finally:
+            server.close()
+            await server.wait_closed()
+
+    response, sent = asyncio.run(trickle())
+    assert response == b""
+    assert sent < 10
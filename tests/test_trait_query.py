@@ -0,0 +1,72 @@
+import pytest
+
+from genos.pairing_optimizer import gene_shown
+from genos.rng import RollRandom
+from genos.ruleset import compile_ruleset
+from genos.trait_query import TraitQuery, get_trait_query
+from helpers import HORNED, MODIFIERS, parent, sampled_share
+
+# Twelve genes between them, so some get trimmed, and a chimera sire so the chimera group has something to do.
+SIRE = parent("sire", ["Banded", "Barring", "Blanket", "Blaze", "Cloak", "Stardust"], HORNED, chimera_status="Chimera",
+              chimera_colour="Coal")
+DAM = parent("dam", ["Collared", "Comet", "Dawn", "Acid", "Brindle", "Crawler"])
+
+
+@pytest.fixture
+def query():
+    return TraitQuery(parent("sire", ["Mask"], tail="Skeletal"), parent("dam", ["Mask"], tail="Skeletal"), MODIFIERS)
+
+
+def test_values_are_checked_against_the_field(query):
+    assert query.probability({"tail": "Skeletal Tail", "genes": "Mask (Gleam)"}).probability >= 0
+    for conditions in [{"tail": "Skeletal"}, {"genes": "Not a gene"}, {"health": "Sterile, Stillborn"},
+                       {"sex": ["Male", "Neither"]}]:
+        with pytest.raises(ValueError):
+            query.probability(conditions)
+
+
+def shows(pup, *genes):
+    return any(gene_shown(gene, shown) for gene in genes for shown in pup.genes)
+
+
+def test_independent_fields_match_sampled_litters():
+    conditions = {"health": "Healthy", "sex": "Female", "horns": "Ram Horns", "tail": ["Docked Tail", "Domestic Tail"]}
+    result = TraitQuery(SIRE, DAM, MODIFIERS).probability(conditions)
+    assert result.exact
+    sampled = sampled_share(SIRE, DAM, lambda pup: pup.health == "Healthy" and pup.sex == "Female" and
+                            pup.horns == "Ram Horns" and pup.tail in conditions["tail"])
+    assert abs(result.probability - sampled) < 0.03
+
+
+def test_chimera_group_is_exact_for_one_gene():
+    query = TraitQuery(SIRE, DAM, MODIFIERS)
+    result = query.probability({"chimera_status": "Chimera", "genes": "Banded"})
+    assert result.exact
+    sampled = sampled_share(SIRE, DAM, lambda pup: pup.chimera_status == "Chimera" and shows(pup, "Banded"))
+    assert abs(result.probability - sampled) < 0.03
+
+    # The same condition written as a function has to be rolled, and lands on the exact answer.
+    estimate = query.probability({"chimera_status": "Chimera", "genes": lambda genes: any(
+        gene_shown("Banded", gene) for gene in genes)}, samples=20000, rng=RollRandom(5))
+    assert not estimate.exact
+    assert estimate.samples == 20000
+    assert abs(estimate.probability - result.probability) < 4 * estimate.standard_error
+
+
+def test_several_genes_are_sampled():
+    result = TraitQuery(SIRE, DAM, MODIFIERS).probability({"genes": ["Banded", "Comet"]}, samples=20000,
+                                                          rng=RollRandom(5))
+    assert not result.exact
+    assert 0 < result.standard_error < 0.01
+    sampled = sampled_share(SIRE, DAM, lambda pup: shows(pup, "Banded", "Comet"))
+    assert abs(result.probability - sampled) < 0.03
+
+
+def test_queries_are_shared_by_pairing_and_ruleset():
+    query = get_trait_query(SIRE, DAM, MODIFIERS)
+    assert get_trait_query(parent("sire", SIRE.genes, HORNED, chimera_status="Chimera", chimera_colour="Coal"),
+                           DAM, dict(MODIFIERS)) is query
+    assert get_trait_query(SIRE, DAM, dict(MODIFIERS, Bonded=True)) is not query
+    assert get_trait_query(SIRE, DAM, MODIFIERS, password_valid=True) is not query
+    ruleset = compile_ruleset({"pass_rates": {"bonded_boost": 10}})
+    assert get_trait_query(SIRE, DAM, MODIFIERS, ruleset=ruleset) is not query
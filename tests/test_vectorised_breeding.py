@@ -0,0 +1,62 @@
+import pytest
+
+from genos import breeding_logic
+from genos.breeding_distributions import BreedingDistributions
+from genos.breeding_logic import TEST_ITERATIONS, VECTORISED_TEST_ITERATIONS
+from helpers import HORNED, parent, roller
+
+BICOLOR = dict(HORNED, chimera_status="Bicolor", chimera_colour="Lush Mint")
+
+
+def pairing(seed, **options):
+    return roller(parent("sire", ["Mask", "Gleam", "Comet", "Sable"], BICOLOR, tail="Skeletal"),
+                  parent("dam", ["Comet", "Stardust", "Points"], BICOLOR, tail="Cloud", mutation="Gills"),
+                  {"Alpha": True, "Inbred": 1, "Stardust": 10}, seed=seed, is_test=True, **options)
+
+
+def comments_after_test(seed, **options):
+    tested = pairing(seed, **options)
+    tested.roll_breeding()
+    return tested.comments
+
+
+def test_seeded_tests_repeat():
+    assert comments_after_test(3, test_iterations=20000) == comments_after_test(3, test_iterations=20000)
+    assert comments_after_test(3, test_iterations=20000) != comments_after_test(4, test_iterations=20000)
+    assert "Test rolling 20000 puppies we got the following results." in comments_after_test(3, test_iterations=20000)
+
+
+def test_engine_counts_every_pup():
+    engine = breeding_logic.get_vectorised_engine()
+    if engine is None:
+        pytest.skip("needs NumPy")
+    tested = pairing(3)
+    tested.gene_boost = tested.get_gene_boost()
+    accumulator = engine(tested, 3).run(5000)
+    assert accumulator.items == 5000
+    for trait in ["Number of pups", "Sex", "Tails", "Base colours"]:
+        assert sum(share.share for share in accumulator.shares(trait)) == pytest.approx(1), trait
+    assert tested.get_test_iterations() == VECTORISED_TEST_ITERATIONS
+
+
+def test_engine_matches_the_exact_distributions():
+    engine = breeding_logic.get_vectorised_engine()
+    if engine is None:
+        pytest.skip("needs NumPy")
+    tested = pairing(5)
+    tested.gene_boost = tested.get_gene_boost()
+    accumulator = engine(tested, 5).run(200000)
+    exact = BreedingDistributions(tested).all_distributions()
+    for trait in ["Health", "Base colours", "Horns", "Tails", "Coat Type", "Chimera", "Genes", "Total number of genes"]:
+        rolled = {str(share.value): share.share for share in accumulator.shares(trait)}
+        expected = {str(value): probability for value, probability in exact[trait].items()}
+        for value in set(rolled) | set(expected):
+            assert rolled.get(value, 0) == pytest.approx(expected.get(value, 0), abs=0.005), (trait, value)
+
+
+def test_without_numpy_tests_are_rolled_one_pup_at_a_time(monkeypatch):
+    monkeypatch.setattr(breeding_logic, "get_vectorised_engine", lambda: None)
+    assert pairing(3).get_test_iterations() == TEST_ITERATIONS
+    comments = comments_after_test(3)
+    assert f"Test rolling {TEST_ITERATIONS} puppies we got the following results." in comments
+    assert comments == comments_after_test(3)
@@ -0,0 +1,49 @@
+import pytest
+
+pytest.importorskip("numpy")
+
+from genos.genes import gene_codes, rare_genes
+from genos.random_vesper_rolling_logic import MaxRarityVesper
+from genos.rng import RollRandom
+from genos.ruleset import compile_ruleset
+from genos.vectorised_vespers import CHUNK_SIZE, NO_GENE, VectorisedVesperGenerator
+
+RARE_GENE_CODES = {gene_codes.code(gene) for gene in rare_genes}
+
+
+def rows(columns):
+    return [columns.result(row) for row in range(len(columns))]
+
+
+def test_seeded_batches_repeat_across_chunks():
+    first = VectorisedVesperGenerator(seed=5).generate(CHUNK_SIZE + 10)
+    again = VectorisedVesperGenerator(seed=5).generate(CHUNK_SIZE + 10)
+    assert len(first) == CHUNK_SIZE + 10
+    assert all((first.columns()[name] == again.columns()[name]).all() for name in first.columns())
+    assert rows(VectorisedVesperGenerator(seed=6).generate(50)) != rows(VectorisedVesperGenerator(seed=5).generate(50))
+    assert len(VectorisedVesperGenerator(seed=5).generate(0)) == 0
+
+
+def test_every_row_is_a_vesper_roll_traits_could_give():
+    ruleset = compile_ruleset({"random_vespers": {"gene_count": [2, 5]}})
+    columns = VectorisedVesperGenerator(ruleset, seed=7).generate(5000)
+    for row in range(len(columns)):
+        count = columns.gene_count[row]
+        genes = [int(code) for code in columns.genes[row, :count]]
+        assert 2 <= count <= 5
+        assert NO_GENE not in genes and len(set(genes)) == len(genes)
+        assert (columns.genes[row, count:] == NO_GENE).all()
+        # Only the first gene can be rare, and only on a row that rolled a rare trait.
+        assert not RARE_GENE_CODES & set(genes[1:])
+        assert columns.gene_mod_index[row] < count
+        traits = columns.traits(row)
+        assert len(traits.genes) == count
+        assert (traits.gene_mod is None) == (traits.gene_mod_index is None)
+    assert columns.tally().items == len(columns)
+
+
+def test_max_rarity_vesper_rolls_columns_from_its_rng():
+    columns = MaxRarityVesper(300, RollRandom(4)).columns()
+    assert len(columns) == 300
+    assert rows(columns) == rows(MaxRarityVesper(300, RollRandom(4)).columns())
+    assert [result["name"] for result in columns.iter_results(298)] == ["Roll 299", "Roll 300"]